@@ -3,12 +3,14 @@ Main Application File - MVC Architecture
 File chính khởi động ứng dụng Flask với kiến trúc MVC
 """
 
+import click
 from flask import Flask
 from flask_login import LoginManager
-from flask_bcrypt import Bcrypt
 from config import config
 from models.database import Database
 from models.user import User
+from models.lock_reaper import LockReaper
+from models.password_hasher import password_hasher
 from datetime import datetime
 
 # Import controllers (blueprints)
@@ -35,7 +37,6 @@ def create_app(config_name='development'):
     app.config.from_object(config[config_name])
     
     # Khởi tạo extensions
-    bcrypt = Bcrypt(app)
     login_manager = LoginManager(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Vui lòng đăng nhập để tiếp tục.'
@@ -79,10 +80,102 @@ def create_app(config_name='development'):
         from datetime import timedelta
         return (datetime.now() + timedelta(days=1)).strftime(format)
 
+    # =================== CLI COMMANDS ===================
+    @app.cli.command('backfill-trip-seats')
+    def backfill_trip_seats_command():
+        """Tạo trip_seats cho các chuyến cũ chưa có ghế"""
+        from models.trip_seat import TripSeat
+        count = TripSeat.backfill_missing_seats()
+        print(f"Đã tạo ghế cho {count} chuyến xe")
+
+    @app.cli.command('backfill-booking-search')
+    def backfill_booking_search_command():
+        """Điền cột tìm kiếm (tên không dấu, SĐT chuẩn hóa) cho booking cũ"""
+        from models.booking import Booking
+        count = Booking.backfill_search_columns()
+        print(f"Đã cập nhật {count} booking")
+
+    @app.cli.command('backfill-bus-images')
+    def backfill_bus_images_command():
+        """Bỏ ảnh xe local không còn file (bus_image lưu trước khi kiểm tra lúc lưu)"""
+        from models.bus import Bus
+        count = Bus.backfill_images()
+        print(f"Đã bỏ ảnh hỏng của {count} xe")
+
+    @app.cli.command('rebuild-revenue-rollups')
+    @click.option('--from', 'date_from', default=None, help='Từ ngày (YYYY-MM-DD), mặc định toàn bộ')
+    @click.option('--to', 'date_to', default=None, help='Đến ngày (YYYY-MM-DD)')
+    def rebuild_revenue_rollups_command(date_from, date_to):
+        """Dựng lại bảng tổng hợp doanh thu từ bookings"""
+        from models.revenue_rollup import RevenueRollup
+        count = RevenueRollup.rebuild(date_from, date_to)
+        print(f"Đã tạo {count} dòng tổng hợp doanh thu")
+
+    @app.cli.command('benchmark-revenue-report')
+    @click.option('--from', 'date_from', default=None, help='Từ ngày (YYYY-MM-DD), mặc định 30 ngày trước')
+    @click.option('--to', 'date_to', default=None, help='Đến ngày (YYYY-MM-DD), mặc định hôm nay')
+    @click.option('--runs', default=5, help='Số lần chạy mỗi câu query')
+    def benchmark_revenue_report_command(date_from, date_to, runs):
+        """So sánh plan + thời gian lọc báo cáo doanh thu: DATE(created_at) vs khoảng nửa mở"""
+        import time
+        from datetime import date, timedelta
+        from models.booking import Booking
+        from models.database import Database
+        
+        date_to = date_to or date.today().isoformat()
+        date_from = date_from or (date.today() - timedelta(days=30)).isoformat()
+        
+        before = (
+            Booking.REPORT_QUERY + " AND b.status != 'cancelled'"
+            " AND DATE(b.created_at) >= %s AND DATE(b.created_at) <= %s",
+            (date_from, date_to)
+        )
+        conditions, params = Booking.date_range_condition('b.created_at', date_from, date_to)
+        after = (
+            Booking.REPORT_QUERY + " AND b.status IN ('pending', 'confirmed')" + conditions,
+            tuple(params)
+        )
+        
+        for label, (query, query_params) in (('Trước (DATE())', before), ('Sau (nửa mở)', after)):
+            print(f"=== {label} ===")
+            for row in Database.execute_query("EXPLAIN " + query, query_params, fetch_all=True) or []:
+                print(f"  {row['table']:<6} type={row['type']} key={row['key']} "
+                      f"rows={row['rows']} extra={row['Extra']}")
+            
+            started = time.perf_counter()
+            for _ in range(runs):
+                result = Database.execute_query(query, query_params, fetch_all=True) or []
+            elapsed = (time.perf_counter() - started) / runs * 1000
+            print(f"  {len(result)} dòng, trung bình {elapsed:.1f} ms/lần ({runs} lần)")
+
+    @app.cli.command('reconcile-seats')
+    @click.option('--dry-run', is_flag=True, help='Chỉ báo cáo chuyến bị lệch, không sửa')
+    @click.option('--from', 'from_date', default=None, help='Chỉ các chuyến từ ngày (YYYY-MM-DD)')
+    def reconcile_seats_command(dry_run, from_date):
+        """Đối chiếu trips.available_seats với trip_seats, báo và sửa chỗ lệch"""
+        from models.trip_seat import TripSeat
+        drift = TripSeat.reconcile_available_seats(fix=not dry_run, from_date=from_date)
+        print(f"{len(drift)} chuyến bị lệch available_seats")
+
+    @app.cli.command('reap-locks')
+    @click.option('--loop', is_flag=True, help='Chạy liên tục như 1 worker riêng')
+    def reap_locks_command(loop):
+        """Giải phóng ghế bị lock quá hạn"""
+        reaper = LockReaper.from_config(app.config['LOCK_REAPER'])
+        if loop:
+            reaper.run_forever()
+        else:
+            print(f"Đã giải phóng {reaper.sweep()} ghế")
+
     # User loader cho Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
-        return User.find_by_id(user_id)
+        return User.get_cached(user_id)
+    
+    # Trả connection đang ghim về pool sau mỗi request
+    @app.teardown_appcontext
+    def release_db_connection(exception=None):
+        Database.release_connection()
     
     # Đăng ký blueprints
     app.register_blueprint(auth_bp)
@@ -94,10 +187,19 @@ def create_app(config_name='development'):
     app.register_blueprint(admin_bookings_bp)
     app.register_blueprint(bus_bp)
     app.register_blueprint(revenue_bp)
+    # Pool hash mật khẩu: tạo sớm, trước khi có thread nền (process con được fork)
+    password_hasher.start()
+    
     # Tạo admin mặc định
     with app.app_context():
         create_default_admin()
     
+    # Dọn ghế lock quá hạn chạy nền
+    if app.config['LOCK_REAPER']['enabled']:
+        reaper = LockReaper.from_config(app.config['LOCK_REAPER'])
+        reaper.start()
+        app.extensions['lock_reaper'] = reaper
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
@@ -144,8 +246,8 @@ if __name__ == '__main__':
     print("="*60)
     
     try:
-        Database.get_connection()
-        print("Kết nối database thành công!")
+        with Database.connection():
+            print("Kết nối database thành công!")
         
         print("\nAvailable Routes:")
         for rule in sorted(app.url_map.iter_rules(), key=lambda x: x.rule):
@@ -4,6 +4,7 @@ Chứa các cấu hình database, secret key, và các hằng số
 """
 
 import os
+import tempfile
 
 class Config:
     """Base configuration"""
@@ -19,9 +20,79 @@ class Config:
         'database': os.environ.get('DB_NAME') or 'bus_ticket',
         'autocommit': True
     }
-    
-    # Password hashing
-    BCRYPT_LOG_ROUNDS = 12
+
+    # Connection pool (mỗi worker process có 1 pool riêng)
+    DB_POOL = {
+        'enabled': os.environ.get('DB_POOL_ENABLED', '1') == '1',
+        'size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),       # giây chờ mượn connection
+        'recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),       # giây, 0 = không recycle
+        'pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1'    # kiểm tra connection khi mượn
+    }
+
+    # Dọn ghế lock quá hạn chạy nền
+    # Nhiều worker: tắt ở app (LOCK_REAPER_ENABLED=0) và chạy 1 worker riêng: flask --app app reap-locks --loop
+    LOCK_REAPER = {
+        'enabled': os.environ.get('LOCK_REAPER_ENABLED', '1') == '1',
+        'interval': int(os.environ.get('LOCK_REAPER_INTERVAL', 30)),   # giây
+        'batch_size': 500,
+        'max_batches': 20
+    }
+
+    # Cache dùng chung cho model (models/cache.py)
+    # Nhiều worker trên 1 máy: CACHE_BACKEND=file để các worker thấy cùng dữ liệu/invalidate
+    # Thư mục cache chứa pickle -> phải riêng của user chạy app (mode 0700, FileCache tự kiểm tra)
+    CACHE = {
+        'backend': os.environ.get('CACHE_BACKEND', 'local'),       # 'local' | 'file'
+        'directory': os.environ.get('CACHE_DIR') or os.path.join(
+            tempfile.gettempdir(), f"bus_ticket_cache-{os.getuid() if hasattr(os, 'getuid') else 'app'}"),
+        'default_ttl': int(os.environ.get('CACHE_DEFAULT_TTL', 60)),   # giây
+        'max_entries': 1024                                         # chỉ áp dụng cho backend local
+    }
+
+    # Cache trạng thái ghế theo chuyến (bitmap trong bộ nhớ mỗi process,
+    # đồng bộ giữa các worker qua tag 'trip_seats:<id>' của CACHE)
+    SEAT_CACHE = {
+        'ttl': int(os.environ.get('SEAT_CACHE_TTL', 30)),   # giây
+        'max_trips': 1000
+    }
+
+    # Widget tuyến phổ biến trang chủ: tính lại sau mỗi N giây (hoặc khi route/bus/trip thay đổi)
+    POPULAR_ROUTES_REFRESH = int(os.environ.get('POPULAR_ROUTES_REFRESH', 300))
+
+    # Cache kết quả /search theo (điểm đi, điểm đến, ngày) - số ghế trống luôn lấy từ seat cache
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 60))
+
+    # Lịch giá theo ngày của tuyến (/api/routes/<id>/calendar)
+    ROUTE_CALENDAR_TTL = int(os.environ.get('ROUTE_CALENDAR_TTL', 300))
+
+    # Tìm hành trình nối chuyến (/api/itineraries)
+    ITINERARY = {
+        'horizon_days': 30,             # dựng đồ thị cho các chuyến trong N ngày tới
+        'refresh_seconds': 600,
+        'min_connection_minutes': 30,   # thời gian nối chuyến tối thiểu mặc định
+        'max_layover_hours': 12         # chờ lâu hơn thì không tính là nối chuyến
+    }
+
+    # Tổng số booking (xấp xỉ) ở trang admin, cache N giây
+    BOOKING_COUNT_TTL = int(os.environ.get('BOOKING_COUNT_TTL', 120))
+
+    # Cache User cho Flask-Login (load_user) - không query users mỗi request
+    USER_CACHE = {
+        'ttl': int(os.environ.get('USER_CACHE_TTL', 60)),   # giây
+        'max_entries': 1000
+    }
+
+    # Password hashing - đổi cost thì hash cũ được hash lại khi user đăng nhập
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+
+    # Pool process hash bcrypt (models/password_hasher.py), mỗi worker process 1 pool riêng
+    PASSWORD_HASHER = {
+        'workers': int(os.environ.get('PASSWORD_HASHER_WORKERS', 2)),          # 0 = hash trên thread request
+        'max_pending': int(os.environ.get('PASSWORD_HASHER_MAX_PENDING', 16)),  # vượt quá -> báo bận ngay
+        'timeout': float(os.environ.get('PASSWORD_HASHER_TIMEOUT', 5))          # giây chờ 1 kết quả
+    }
     
     # Session configuration
     SESSION_COOKIE_SECURE = False  # Set True in production with HTTPS
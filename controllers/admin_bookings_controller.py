@@ -3,15 +3,16 @@ Admin Bookings Controller - ĐÃ SỬA HOÀN CHỈNH
 Quản lý vé và đơn đặt vé - Phù hợp với schema SQL mới
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
 from functools import wraps
 from models.booking import Booking
+from models.export import iter_csv, iter_file, write_xlsx
 from models.ticket import Ticket
 from models.trip import Trip
 from models.route import Route
 from models.user import User
-from models.database import Database
 from datetime import datetime, timedelta
 
 admin_bookings_bp = Blueprint('admin_bookings', __name__, url_prefix='/admin/bookings')
@@ -42,83 +43,40 @@ def index():
     search = request.args.get('search', '')
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor') or None
     per_page = 20
     
-    # ✅ Query đầy đủ thông tin
-    query = """
-        SELECT 
-            b.id,
-            b.booking_code,
-            b.passenger_name,
-            b.passenger_phone,
-            b.total_seats,
-            b.total_price,
-            b.payment_method,
-            b.payment_status,
-            b.status as booking_status,
-            b.created_at,
-            
-            -- Ngày đi từ trips (alias để khớp với template)
-            t.trip_date as travel_date,
-            
-            -- Thông tin tuyến từ buses + routes (alias để khớp với template)
-            CONCAT(r.departure_point, ' → ', r.arrival_point) as route_name,
-            r.departure_point as departure_city,
-            r.arrival_point as arrival_city,
-            bus.departure_time,
-            bus.bus_company
-            
-        FROM bookings b
-        INNER JOIN trips t ON b.trip_id = t.id
-        INNER JOIN buses bus ON t.bus_id = bus.id
-        INNER JOIN routes r ON bus.route_id = r.id
-        WHERE 1=1
-    """
-    
-    params = []
-    
-    # Thêm filters
-    if status:
-        query += " AND b.status = %s"
-        params.append(status)
-    
-    if payment_status:
-        query += " AND b.payment_status = %s"
-        params.append(payment_status)
-    
-    if search:
-        query += " AND (b.booking_code LIKE %s OR b.passenger_name LIKE %s OR b.passenger_phone LIKE %s)"
-        search_term = f"%{search}%"
-        params.extend([search_term, search_term, search_term])
-    
-    if date_from:
-        query += " AND t.trip_date >= %s"
-        params.append(date_from)
-    
-    if date_to:
-        query += " AND t.trip_date <= %s"
-        params.append(date_to)
-    
-    query += " ORDER BY b.created_at DESC LIMIT %s OFFSET %s"
-    params.extend([per_page, (page - 1) * per_page])
-    
-    bookings = Database.execute_query(query, tuple(params) if params else None, fetch_all=True)
+    filters = {
+        'status': status,
+        'payment_status': payment_status,
+        'search': search,
+        'date_from': date_from,
+        'date_to': date_to
+    }
+    
+    # ✅ Phân trang keyset theo (created_at, id) - cursor sai thì quay về trang đầu
+    try:
+        result = Booking.get_all_with_filter(cursor=cursor, per_page=per_page, **filters)
+    except ValueError:
+        result = Booking.get_all_with_filter(per_page=per_page, **filters)
+    
+    query_args = {key: value for key, value in filters.items() if value}
+    pagination = {
+        'next_url': url_for('admin_bookings.index', cursor=result['next_cursor'], **query_args)
+                    if result['next_cursor'] else None,
+        'prev_url': url_for('admin_bookings.index', cursor=result['prev_cursor'], **query_args)
+                    if result['prev_cursor'] else None,
+        'approx_total': result['approx_total']
+    }
     
     # Lấy thống kê tổng quan
     stats = Booking.get_statistics()
     
     return render_template('admin/bookings/index.html',
-                         bookings=bookings,
+                         bookings=result['bookings'],
                          stats=stats,
-                         filters={
-                             'status': status,
-                             'payment_status': payment_status,
-                             'search': search,
-                             'date_from': date_from,
-                             'date_to': date_to,
-                             'page': page
-                         },
+                         filters=filters,
+                         pagination=pagination,
                          user=current_user)
 
 
@@ -227,11 +185,11 @@ def update_status(booking_id):
         flash('Trạng thái không hợp lệ!', 'danger')
         return redirect(url_for('admin_bookings.detail', booking_id=booking_id))
     
-    # Cập nhật trạng thái
-    query = "UPDATE bookings SET status = %s WHERE id = %s"
-    Database.execute_query(query, (new_status, booking_id))
-    
-    flash(f'Đã cập nhật trạng thái thành {new_status}!', 'success')
+    # Cập nhật trạng thái (kèm bảng tổng hợp doanh thu)
+    if Booking.update_status(booking_id, new_status):
+        flash(f'Đã cập nhật trạng thái thành {new_status}!', 'success')
+    else:
+        flash('Có lỗi khi cập nhật trạng thái!', 'danger')
     return redirect(url_for('admin_bookings.detail', booking_id=booking_id))
 
 
@@ -254,11 +212,11 @@ def update_payment(booking_id):
         flash('Trạng thái thanh toán không hợp lệ!', 'danger')
         return redirect(url_for('admin_bookings.detail', booking_id=booking_id))
     
-    # Cập nhật trạng thái thanh toán
-    query = "UPDATE bookings SET payment_status = %s WHERE id = %s"
-    Database.execute_query(query, (new_payment_status, booking_id))
-    
-    flash(f'Đã cập nhật trạng thái thanh toán thành {new_payment_status}!', 'success')
+    # Cập nhật trạng thái thanh toán (kèm bảng tổng hợp doanh thu)
+    if Booking.update_payment_status(booking_id, new_payment_status):
+        flash(f'Đã cập nhật trạng thái thanh toán thành {new_payment_status}!', 'success')
+    else:
+        flash('Có lỗi khi cập nhật trạng thái thanh toán!', 'danger')
     return redirect(url_for('admin_bookings.detail', booking_id=booking_id))
 
 
@@ -324,33 +282,11 @@ def cancel_booking(booking_id):
     
     cancel_reason = request.form.get('cancel_reason', 'Admin hủy đơn')
     
-    if Booking.cancel(booking_id, cancel_reason):
-        # ✅ Lấy thông tin trip trước để biết trip_date
-        trip = Trip.get_by_id(booking['trip_id'])
-        
-        if not trip:
-            flash('Không tìm thấy thông tin chuyến xe!', 'warning')
-            return redirect(url_for('admin_bookings.detail', booking_id=booking_id))
-        
-        # Hủy tất cả vé và giải phóng ghế
-        tickets = Ticket.get_by_booking(booking_id)
-        
-        for ticket in tickets:
-            # Hủy vé
-            Ticket.cancel(ticket['id'])
-            
-            # ✅ Giải phóng ghế (dùng trip_date từ trip, không phải từ booking)
-            try:
-                from models.trip_seat import TripSeat
-                TripSeat.release_seat(
-                    trip_id=booking['trip_id'],
-                    travel_date=trip.get('trip_date'),  # ✅ Lấy từ trip.trip_date
-                    seat_number=ticket['seat_number']
-                )
-            except Exception as e:
-                print(f"⚠️ Lỗi giải phóng ghế {ticket['seat_number']}: {e}")
-        
-        flash('Đã hủy đơn đặt vé thành công!', 'success')
+    # Hủy đơn + vé + giải phóng ghế trong 1 transaction
+    released = Booking.cancel_with_release(booking_id, cancel_reason)
+    
+    if released is not None:
+        flash(f'Đã hủy đơn đặt vé thành công (trả {len(released)} ghế)!', 'success')
     else:
         flash('Có lỗi khi hủy đơn!', 'danger')
     
@@ -407,13 +343,55 @@ def statistics():
                          user=current_user)
 
 
+# Cột file xuất danh sách đặt vé
+EXPORT_COLUMNS = [
+    ('booking_code', 'Mã vé'),
+    ('passenger_name', 'Khách hàng'),
+    ('passenger_phone', 'Số điện thoại'),
+    ('passenger_email', 'Email'),
+    ('departure_point', 'Điểm đi'),
+    ('arrival_point', 'Điểm đến'),
+    ('bus_company', 'Nhà xe'),
+    ('trip_date', 'Ngày đi'),
+    ('departure_time', 'Giờ đi'),
+    ('total_seats', 'Số ghế'),
+    ('total_price', 'Thành tiền'),
+    ('payment_method', 'Phương thức TT'),
+    ('payment_status', 'Thanh toán'),
+    ('status', 'Trạng thái'),
+    ('created_at', 'Ngày đặt'),
+]
+
+
 @admin_bookings_bp.route('/export')
 @login_required
 @admin_required
 def export_excel():
     """
-    Xuất danh sách đặt vé ra Excel
+    Xuất danh sách đặt vé (cùng bộ lọc với trang danh sách) ra CSV hoặc Excel
+    Đọc DB theo từng lô và ghi thẳng ra response - không nạp cả danh sách vào RAM
+    ?format=csv (mặc định) | xlsx
     """
-    # TODO: Implement Excel export
-    flash('Tính năng xuất Excel đang được phát triển!', 'info')
-    return redirect(url_for('admin_bookings.index'))
\ No newline at end of file
+    filters = {
+        'status': request.args.get('status', ''),
+        'payment_status': request.args.get('payment_status', ''),
+        'search': request.args.get('search', ''),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', '')
+    }
+    file_format = request.args.get('format', 'csv')
+    filename = f"dat_ve_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    if file_format == 'xlsx':
+        path = write_xlsx(EXPORT_COLUMNS, Booking.iter_export(**filters), sheet_name='Đặt vé')
+        return Response(
+            iter_file(path, delete=True),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={'Content-Disposition': f'attachment; filename={filename}.xlsx'}
+        )
+    
+    return Response(
+        stream_with_context(iter_csv(EXPORT_COLUMNS, Booking.iter_export(**filters))),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+    )
\ No newline at end of file
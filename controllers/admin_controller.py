@@ -3,10 +3,15 @@ Admin Controller
 Xử lý tất cả các chức năng quản trị
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
 from models.user import User
+from models.database import Database
+from models.cache import cache
+from models.itinerary import itinerary_planner
+from models.password_hasher import PasswordHasherBusy, password_hasher
+from models.seat_cache import seat_cache
 
 # Tạo Blueprint cho admin
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -36,6 +41,23 @@ def dashboard():
     return render_template('admin_dashboard.html', user=current_user)
 
 
+@admin_bp.route('/api/metrics')
+@login_required
+@admin_required
+def metrics():
+    """
+    API monitoring: thống kê connection pool, cache, pool hash mật khẩu
+    """
+    return jsonify({
+        'db_pool': Database.pool_stats(),
+        'cache': cache.stats(),
+        'seat_cache': seat_cache.stats(),
+        'user_cache': User.cache_stats(),
+        'password_hasher': password_hasher.stats(),
+        'itinerary_graph': itinerary_planner.stats()
+    })
+
+
 @admin_bp.route('/users')
 @login_required
 @admin_required
@@ -87,15 +109,19 @@ def add_user():
         return redirect(url_for('admin.users'))
     
     # Tạo user mới
-    user_id = User.create(
-        username=username,
-        email=email,
-        password=password,
-        full_name=full_name,
-        phone=phone,
-        address=address,
-        role=role
-    )
+    try:
+        user_id = User.create(
+            username=username,
+            email=email,
+            password=password,
+            full_name=full_name,
+            phone=phone,
+            address=address,
+            role=role
+        )
+    except PasswordHasherBusy:
+        flash('Hệ thống đang bận, vui lòng thử lại sau giây lát!', 'warning')
+        return redirect(url_for('admin.users'))
     
     if user_id:
         flash(f'Đã thêm tài khoản {full_name} thành công!', 'success')
@@ -155,7 +181,13 @@ def edit_user():
         update_data['password'] = password
     
     # Cập nhật user
-    if User.update(user_id, update_data):
+    try:
+        updated = User.update(user_id, update_data)
+    except PasswordHasherBusy:
+        flash('Hệ thống đang bận, vui lòng thử lại sau giây lát!', 'warning')
+        return redirect(url_for('admin.users'))
+    
+    if updated:
         flash(f'Đã cập nhật tài khoản {full_name} thành công!', 'success')
     else:
         flash('Có lỗi xảy ra khi cập nhật tài khoản!', 'danger')
@@ -6,6 +6,7 @@ Xử lý logic đăng nhập, đăng ký, đăng xuất
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, current_user
 from models.user import User
+from models.password_hasher import PasswordHasherBusy
 
 # Tạo Blueprint cho authentication
 auth_bp = Blueprint('auth', __name__)
@@ -48,15 +49,19 @@ def register():
             return render_template('register.html')
         
         # Tạo user mới
-        user_id = User.create(
-            username=username,
-            email=email,
-            password=password,
-            full_name=full_name,
-            phone=phone,
-            address=address,
-            role='user'
-        )
+        try:
+            user_id = User.create(
+                username=username,
+                email=email,
+                password=password,
+                full_name=full_name,
+                phone=phone,
+                address=address,
+                role='user'
+            )
+        except PasswordHasherBusy:
+            flash('Hệ thống đang bận, vui lòng thử lại sau giây lát!', 'warning')
+            return render_template('register.html'), 503
         
         if user_id:
             flash('Đăng ký thành công! Vui lòng đăng nhập.', 'success')
@@ -90,7 +95,16 @@ def login():
         # Tìm user trong database
         user_data = User.find_by_username(username)
         
-        if user_data and User.verify_password(user_data['password_hash'], password):
+        try:
+            password_ok = bool(user_data) and User.verify_password(user_data['password_hash'], password)
+        except PasswordHasherBusy:
+            flash('Hệ thống đang bận, vui lòng thử lại sau giây lát!', 'warning')
+            return render_template('login.html'), 503
+        
+        if password_ok:
+            # Đổi BCRYPT_LOG_ROUNDS -> hash lại theo cost mới
+            User.rehash_if_needed(user_data['id'], user_data['password_hash'], password)
+            
             # Tạo user object cho Flask-Login
             user = User(
                 id=user_data['id'],
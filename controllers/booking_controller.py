@@ -7,6 +7,7 @@ Booking Controller - FIXED cho schema mới (Routes → Buses → Trips)
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, current_user
+from config import Config
 from models.database import Database
 from models.booking import Booking
 from models.ticket import Ticket
@@ -47,11 +48,7 @@ def select_seats(trip_id):
     
     print(f"✅ Tìm thấy trip: {trip['bus_company']} - {trip['departure_point']} → {trip['arrival_point']}")
     
-    # ✅ Init seats nếu chưa có
-    TripSeat.init_seats_for_trip(trip_id, trip['total_seats'])
-    
-    # ✅ Release expired locks
-    TripSeat.release_expired_locks()
+    # Ghế đã được tạo sẵn khi tạo trip (Trip.create / flask backfill-trip-seats)
     
     # ✅ Lấy ghế đã đặt từ trip_seats
     booked_seats = TripSeat.get_booked_seats(trip_id)
@@ -77,7 +74,7 @@ def confirm_booking():
     try:
         trip_id = int(request.form.get('trip_id'))
         travel_date = request.form.get('travel_date', datetime.now().strftime('%Y-%m-%d'))
-        selected_seats = request.form.get('selected_seats', '').split(',')
+        selected_seats = [seat for seat in request.form.get('selected_seats', '').split(',') if seat]
         passenger_name = request.form.get('passenger_name', '').strip()
         passenger_phone = request.form.get('passenger_phone', '').strip()
         passenger_email = request.form.get('passenger_email', '').strip()
@@ -101,19 +98,11 @@ def confirm_booking():
             flash('Không tìm thấy chuyến xe!', 'danger')
             return redirect(url_for('user.home'))
         
-        # ✅ Kiểm tra ghế đã đặt từ trip_seats
-        booked_seats = TripSeat.get_booked_seats(trip_id)
-        for seat in selected_seats:
-            if seat in booked_seats:
-                flash(f'Ghế {seat} đã được đặt!', 'danger')
-                return redirect(url_for('booking.select_seats', trip_id=trip_id, date=travel_date))
-        
-        # ✅ Lock ghế tạm thời (10 phút)
-        for seat in selected_seats:
-            success = TripSeat.lock_seat(trip_id, seat, current_user.id, minutes=10)
-            if not success:
-                flash(f'Không thể giữ ghế {seat}!', 'danger')
-                return redirect(url_for('booking.select_seats', trip_id=trip_id, date=travel_date))
+        # ✅ Lock tất cả ghế tạm thời (10 phút) bằng 1 câu UPDATE
+        # Ghế đã đặt/đang có người giữ -> không khóa ghế nào
+        if not TripSeat.lock_seats(trip_id, selected_seats, current_user.id, ttl=10):
+            flash('Một số ghế bạn chọn đã được đặt hoặc đang có người giữ!', 'danger')
+            return redirect(url_for('booking.select_seats', trip_id=trip_id, date=travel_date))
         
         total_seats = len(selected_seats)
         price_per_seat = float(trip['final_price'])
@@ -228,6 +217,39 @@ def payment_qr():
                          user=current_user)
 
 
+def _issue_tickets(booking_id, booking_temp, user_id):
+    """
+    Tạo tickets + book ghế trong trip_seats (TripSeat.book_seats tự trừ available_seats) cho 1 booking
+    Phải gọi bên trong Database.transaction() để lỗi giữa chừng được rollback
+    
+    Args:
+        booking_id (int): ID booking
+        booking_temp (dict): Thông tin đặt vé trong session
+        user_id (int): ID người đặt
+    """
+    price_per_seat = float(booking_temp['price_per_seat'])
+    selected_seats = booking_temp['selected_seats']
+    
+    ticket_ids = Ticket.create_many(
+        booking_id=booking_id,
+        trip_id=booking_temp['trip_id'],
+        seat_numbers=selected_seats,
+        passenger_name=booking_temp['passenger_name'],
+        passenger_phone=booking_temp['passenger_phone'],
+        price=price_per_seat
+    )
+    
+    if not ticket_ids or len(ticket_ids) != len(selected_seats):
+        raise RuntimeError('Không thể tạo vé!')
+    
+    # Book ghế trong trip_seats (kèm trừ available_seats) - 1 câu UPDATE cho cả đơn
+    booked = TripSeat.book_seats(booking_temp['trip_id'], selected_seats, booking_id)
+    if booked != len(selected_seats):
+        raise RuntimeError(f'Chỉ đặt được {booked}/{len(selected_seats)} ghế, có ghế đã được người khác đặt!')
+    
+    print(f"✅ Tạo {len(ticket_ids)} vé, cập nhật available_seats: -{booked}")
+
+
 @booking_bp.route('/process-payment-cash', methods=['GET', 'POST'])
 @login_required
 def process_payment_cash():
@@ -237,6 +259,7 @@ def process_payment_cash():
     - Tạo tickets
     - Book seats trong trip_seats
     - Cập nhật available_seats trong trips
+    ✅ Toàn bộ chạy trong 1 transaction (commit 1 lần)
     """
     try:
         booking_temp = session.get('booking_temp')
@@ -249,66 +272,28 @@ def process_payment_cash():
         print(f"Trip: {booking_temp['trip_id']}")
         print(f"Seats: {booking_temp['selected_seats']}")
         
-        price_per_seat = float(booking_temp['price_per_seat'])
         total_price = float(booking_temp['total_price'])
         
-        # 1. Tạo booking
-        booking_id = Booking.create(
-            user_id=current_user.id,
-            trip_id=booking_temp['trip_id'],
-            passenger_name=booking_temp['passenger_name'],
-            passenger_phone=booking_temp['passenger_phone'],
-            passenger_email=booking_temp['passenger_email'],
-            total_seats=booking_temp['total_seats'],
-            total_price=total_price,
-            payment_method='cash'
-        )
-        
-        if not booking_id:
-            flash('Có lỗi khi tạo đơn đặt vé!', 'danger')
-            return redirect(url_for('booking.payment'))
-        
-        print(f"✅ Tạo booking: {booking_id}")
-        
-        # 2. Tạo tickets + Book seats
-        for seat in booking_temp['selected_seats']:
-            # Tạo ticket
-            ticket_id = Ticket.create(
-                booking_id=booking_id,
-                trip_id=booking_temp['trip_id'],
+        with Database.transaction():
+            # 1. Tạo booking
+            booking_id = Booking.create(
                 user_id=current_user.id,
-                seat_number=seat,
+                trip_id=booking_temp['trip_id'],
                 passenger_name=booking_temp['passenger_name'],
                 passenger_phone=booking_temp['passenger_phone'],
-                price=price_per_seat
+                passenger_email=booking_temp['passenger_email'],
+                total_seats=booking_temp['total_seats'],
+                total_price=total_price,
+                payment_method='cash'
             )
             
-            print(f"✅ Tạo ticket {ticket_id} cho ghế {seat}")
+            if not booking_id:
+                raise RuntimeError('Có lỗi khi tạo đơn đặt vé!')
             
-            if ticket_id:
-                # Book seat trong trip_seats
-                success = TripSeat.book_seat(
-                    trip_id=booking_temp['trip_id'],
-                    seat_number=seat,
-                    booking_id=booking_id,
-                    ticket_id=ticket_id,
-                    user_id=current_user.id
-                )
-                print(f"✅ Book seat {seat} trong trip_seats: {success}")
-        
-        # 3. Cập nhật available_seats trong trips
-        update_query = """
-            UPDATE trips 
-            SET available_seats = available_seats - %s
-            WHERE id = %s AND available_seats >= %s
-        """
-        Database.execute_query(update_query, (
-            booking_temp['total_seats'],
-            booking_temp['trip_id'],
-            booking_temp['total_seats']
-        ))
-        
-        print(f"✅ Cập nhật available_seats: -{booking_temp['total_seats']}")
+            print(f"✅ Tạo booking: {booking_id}")
+            
+            # 2. Tạo tickets + Book seats + cập nhật available_seats
+            _issue_tickets(booking_id, booking_temp, current_user.id)
         
         session.pop('booking_temp', None)
         flash('Đặt vé thành công!', 'success')
@@ -327,6 +312,7 @@ def process_payment_cash():
 def check_payment():
     """
     ✅ FIXED: Kiểm tra và xác nhận thanh toán
+    ✅ Tạo tickets + book ghế trong 1 transaction
     """
     try:
         booking_temp = session.get('booking_temp')
@@ -339,43 +325,8 @@ def check_payment():
         print(f"\n=== CHECK PAYMENT ===")
         print(f"Booking: {booking_id}")
         
-        price_per_seat = float(booking_temp['price_per_seat'])
-        
-        # Tạo tickets + Book seats
-        for seat in booking_temp['selected_seats']:
-            ticket_id = Ticket.create(
-                booking_id=booking_id,
-                trip_id=booking_temp['trip_id'],
-                user_id=current_user.id,
-                seat_number=seat,
-                passenger_name=booking_temp['passenger_name'],
-                passenger_phone=booking_temp['passenger_phone'],
-                price=price_per_seat
-            )
-            
-            print(f"✅ Tạo ticket {ticket_id} cho ghế {seat}")
-            
-            if ticket_id:
-                success = TripSeat.book_seat(
-                    trip_id=booking_temp['trip_id'],
-                    seat_number=seat,
-                    booking_id=booking_id,
-                    ticket_id=ticket_id,
-                    user_id=current_user.id
-                )
-                print(f"✅ Book seat {seat}: {success}")
-        
-        # Cập nhật available_seats
-        update_query = """
-            UPDATE trips 
-            SET available_seats = available_seats - %s
-            WHERE id = %s AND available_seats >= %s
-        """
-        Database.execute_query(update_query, (
-            booking_temp['total_seats'],
-            booking_temp['trip_id'],
-            booking_temp['total_seats']
-        ))
+        with Database.transaction():
+            _issue_tickets(booking_id, booking_temp, current_user.id)
         
         session.pop('booking_temp', None)
         
@@ -417,35 +368,45 @@ def my_bookings():
     """
     print(f"\n=== MY BOOKINGS - User ID: {current_user.id} ===")
     
-    bookings = Booking.get_by_user(current_user.id)
+    # Phân trang keyset - cursor sai thì quay về trang đầu
+    cursor = request.args.get('cursor') or None
+    try:
+        page = Booking.get_page_by_user(current_user.id, cursor=cursor, per_page=Config.ITEMS_PER_PAGE)
+    except ValueError:
+        page = Booking.get_page_by_user(current_user.id, per_page=Config.ITEMS_PER_PAGE)
+    bookings = page['bookings']
     
     if not bookings:
         print("⚠️ Không có booking nào")
     else:
         print(f"✅ Tìm thấy {len(bookings)} bookings")
     
-    # Lấy danh sách ghế cho mỗi booking
+    # Lấy danh sách ghế cho cả trang bằng 1 query
+    tickets_by_booking = Ticket.get_by_bookings(booking['id'] for booking in bookings)
+    
     for booking in bookings:
-        print(f"\n📋 Booking ID: {booking['id']}, Code: {booking['booking_code']}")
-        
-        tickets = Ticket.get_by_booking(booking['id'])
+        tickets = tickets_by_booking.get(booking['id'], [])
+        booking['seat_list'] = [ticket['seat_number'] for ticket in tickets]
         
-        if tickets:
-            print(f"  ✅ Tìm thấy {len(tickets)} tickets")
-            booking['seat_list'] = [ticket['seat_number'] for ticket in tickets]
-            print(f"  💺 Ghế: {booking['seat_list']}")
-        else:
-            print(f"  ⚠️ KHÔNG TÌM THẤY TICKETS!")
-            booking['seat_list'] = []
+        if not tickets:
+            print(f"  ⚠️ Booking {booking['booking_code']}: KHÔNG TÌM THẤY TICKETS!")
         
         # Tính price_per_seat nếu chưa có
         if not booking.get('price_per_seat') and booking['total_seats'] > 0:
             booking['price_per_seat'] = booking['total_price'] / booking['total_seats']
     
+    pagination = {
+        'next_url': url_for('booking.my_bookings', cursor=page['next_cursor'])
+                    if page['next_cursor'] else None,
+        'prev_url': url_for('booking.my_bookings', cursor=page['prev_cursor'])
+                    if page['prev_cursor'] else None
+    }
+    
     print("\n=== KẾT THÚC MY BOOKINGS ===\n")
     
     return render_template('my_bookings.html',
                          bookings=bookings,
+                         pagination=pagination,
                          user=current_user)
 
 
@@ -454,9 +415,8 @@ def my_bookings():
 def cancel_booking(booking_id):
     """
     ✅ FIXED: Hủy đơn đặt vé
-    - Hủy tickets
-    - Release seats trong trip_seats
-    - Cập nhật available_seats trong trips
+    Booking.cancel_with_release: hủy tickets, release seats trong trip_seats,
+    cập nhật available_seats trong trips - 1 transaction
     """
     booking = Booking.find_by_id(booking_id)
     
@@ -468,33 +428,11 @@ def cancel_booking(booking_id):
     
     print(f"\n=== CANCEL BOOKING {booking_id} ===")
     
-    if Booking.cancel(booking_id, cancel_reason):
-        tickets = Ticket.get_by_booking(booking_id)
-        
-        # Hủy tickets + Release seats
-        for ticket in tickets:
-            Ticket.cancel(ticket['id'])
-            
-            # Release seat trong trip_seats
-            success = TripSeat.release_seat(
-                trip_id=booking['trip_id'],
-                seat_number=ticket['seat_number']
-            )
-            print(f"✅ Release seat {ticket['seat_number']}: {success}")
-        
-        # Trả lại ghế vào trips
-        update_query = """
-            UPDATE trips 
-            SET available_seats = available_seats + %s
-            WHERE id = %s
-        """
-        Database.execute_query(update_query, (
-            len(tickets),
-            booking['trip_id']
-        ))
-        
-        print(f"✅ Trả lại {len(tickets)} ghế vào trips")
-        
+    # Hủy đơn + vé + trả ghế trong 1 transaction
+    released = Booking.cancel_with_release(booking_id, cancel_reason)
+    
+    if released is not None:
+        print(f"✅ Trả lại {len(released)} ghế: {released}")
         flash('Đã hủy đơn đặt vé thành công!', 'success')
     else:
         flash('Có lỗi khi hủy đơn!', 'danger')
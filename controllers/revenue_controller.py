@@ -3,11 +3,15 @@ Revenue Controller
 Quản lý doanh thu và báo cáo thống kê
 """
 
-from flask import Blueprint, render_template, request, jsonify
+from flask import (Blueprint, render_template, request, jsonify, flash, redirect, url_for,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
 from controllers.admin_controller import admin_required
+from models.booking import Booking
 from models.database import Database
-from datetime import datetime, timedelta
+from models.export import iter_csv, iter_file, write_xlsx
+from models.revenue_rollup import RevenueRollup
+from datetime import date, datetime, timedelta
 
 revenue_bp = Blueprint('revenue', __name__, url_prefix='/admin/revenue')
 
@@ -16,67 +20,18 @@ revenue_bp = Blueprint('revenue', __name__, url_prefix='/admin/revenue')
 @login_required
 @admin_required
 def index():
-    """Trang tổng quan doanh thu"""
-    conn = Database.get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
+    """Trang tổng quan doanh thu (đọc từ bảng tổng hợp revenue_daily)"""
     # Lấy tổng doanh thu
-    cursor.execute("""
-        SELECT 
-            SUM(total_price) as total_revenue,
-            COUNT(*) as total_bookings,
-            SUM(CASE WHEN payment_status = 'paid' THEN total_price ELSE 0 END) as paid_revenue,
-            SUM(CASE WHEN payment_status = 'pending' THEN total_price ELSE 0 END) as pending_revenue
-        FROM bookings
-        WHERE status != 'cancelled'
-    """)
-    revenue_stats = cursor.fetchone()
+    revenue_stats = RevenueRollup.totals()
     
     # Doanh thu theo tháng (6 tháng gần nhất)
-    cursor.execute("""
-        SELECT 
-            DATE_FORMAT(created_at, '%Y-%m') as month,
-            SUM(total_price) as revenue,
-            COUNT(*) as bookings
-        FROM bookings
-        WHERE status != 'cancelled' 
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 6 MONTH)
-        GROUP BY DATE_FORMAT(created_at, '%Y-%m')
-        ORDER BY month DESC
-    """)
-    monthly_revenue = cursor.fetchall()
+    monthly_revenue = RevenueRollup.monthly(6)
     
     # Top 5 tuyến xe có doanh thu cao nhất
-    cursor.execute("""
-        SELECT 
-            r.departure_point,
-            r.arrival_point,
-            SUM(b.total_price) as revenue,
-            COUNT(b.id) as bookings
-        FROM bookings b
-        JOIN trips t ON b.trip_id = t.id
-        JOIN buses bus ON t.bus_id = bus.id
-        JOIN routes r ON bus.route_id = r.id
-        WHERE b.status != 'cancelled'
-        GROUP BY r.id, r.departure_point, r.arrival_point
-        ORDER BY revenue DESC
-        LIMIT 5
-    """)
-    top_routes = cursor.fetchall()
+    top_routes = RevenueRollup.top_routes(5)
     
     # Doanh thu theo phương thức thanh toán
-    cursor.execute("""
-        SELECT 
-            payment_method,
-            SUM(total_price) as revenue,
-            COUNT(*) as bookings
-        FROM bookings
-        WHERE status != 'cancelled' AND payment_method IS NOT NULL
-        GROUP BY payment_method
-    """)
-    payment_methods = cursor.fetchall()
-    
-    cursor.close()
+    payment_methods = RevenueRollup.by_payment_method()
     
     return render_template('admin/revenue_dashboard.html',
                          revenue_stats=revenue_stats,
@@ -91,89 +46,38 @@ def index():
 @admin_required
 def report():
     """Trang báo cáo chi tiết"""
-    conn = Database.get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
     # Lấy tham số lọc
     from_date = request.args.get('from_date', '')
     to_date = request.args.get('to_date', '')
     route_id = request.args.get('route_id', '')
     
-    # Query cơ bản
-    query = """
-        SELECT 
-            b.id,
-            b.booking_code,
-            b.passenger_name,
-            b.total_seats,
-            b.total_price,
-            b.payment_status,
-            b.payment_method,
-            b.created_at,
-            r.departure_point,
-            r.arrival_point,
-            bus.bus_company,
-            t.trip_date
-        FROM bookings b
-        JOIN trips t ON b.trip_id = t.id
-        JOIN buses bus ON t.bus_id = bus.id
-        JOIN routes r ON bus.route_id = r.id
-        WHERE b.status != 'cancelled'
-    """
-    
-    params = []
-    
-    # Thêm điều kiện lọc
-    if from_date:
-        query += " AND DATE(b.created_at) >= %s"
-        params.append(from_date)
-    
-    if to_date:
-        query += " AND DATE(b.created_at) <= %s"
-        params.append(to_date)
+    # Booking chưa hủy theo bộ lọc (lọc ngày dạng nửa mở, dùng được index created_at)
+    try:
+        bookings = Booking.get_report_bookings(from_date, to_date, route_id)
+    except ValueError:
+        flash('Ngày lọc không hợp lệ!', 'danger')
+        from_date = to_date = ''
+        bookings = Booking.get_report_bookings('', '', route_id)
     
-    if route_id:
-        query += " AND r.id = %s"
-        params.append(route_id)
-    
-    query += " ORDER BY b.created_at DESC"
-    
-    cursor.execute(query, params)
-    bookings = cursor.fetchall()
-    
-    # Tính tổng doanh thu từ kết quả lọc
-    total_revenue = sum(b['total_price'] for b in bookings)
-    total_bookings = len(bookings)
-    paid_revenue = sum(b['total_price'] for b in bookings if b['payment_status'] == 'paid')
-    pending_revenue = sum(b['total_price'] for b in bookings if b['payment_status'] == 'pending')
-    
-    # Tạo revenue_stats dict giống như function index()
+    # Tổng doanh thu theo cùng bộ lọc, lấy từ bảng tổng hợp
+    totals = RevenueRollup.totals(from_date or None, to_date or None, route_id or None) or {}
     revenue_stats = {
-        'total_revenue': total_revenue,
-        'total_bookings': total_bookings,
-        'paid_revenue': paid_revenue,
-        'pending_revenue': pending_revenue
+        'total_revenue': totals.get('total_revenue') or 0,
+        'total_bookings': int(totals.get('total_bookings') or 0),
+        'paid_revenue': totals.get('paid_revenue') or 0,
+        'pending_revenue': totals.get('pending_revenue') or 0
     }
+    total_revenue = revenue_stats['total_revenue']
+    total_bookings = revenue_stats['total_bookings']
     
     # Lấy danh sách tuyến đường để lọc
-    cursor.execute("SELECT id, departure_point, arrival_point FROM routes WHERE is_active = 1")
-    routes = cursor.fetchall()
+    routes = Database.execute_query(
+        "SELECT id, departure_point, arrival_point FROM routes WHERE is_active = 1",
+        fetch_all=True
+    ) or []
     
     # Lấy dữ liệu doanh thu theo tháng cho biểu đồ (6 tháng gần nhất)
-    cursor.execute("""
-        SELECT 
-            DATE_FORMAT(created_at, '%Y-%m') as month,
-            SUM(total_price) as revenue,
-            COUNT(*) as bookings
-        FROM bookings
-        WHERE status != 'cancelled' 
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 6 MONTH)
-        GROUP BY DATE_FORMAT(created_at, '%Y-%m')
-        ORDER BY month DESC
-    """)
-    monthly_revenue = cursor.fetchall()
-    
-    cursor.close()
+    monthly_revenue = RevenueRollup.monthly(6)
     
     return render_template('admin/revenue_report.html',
                          bookings=bookings,
@@ -188,70 +92,88 @@ def report():
                          user=current_user)
 
 
+# Cột file xuất báo cáo doanh thu (giống bảng chi tiết)
+REPORT_COLUMNS = [
+    ('booking_code', 'Mã vé'),
+    ('passenger_name', 'Khách hàng'),
+    ('departure_point', 'Điểm đi'),
+    ('arrival_point', 'Điểm đến'),
+    ('bus_company', 'Nhà xe'),
+    ('trip_date', 'Ngày đi'),
+    ('total_seats', 'Số ghế'),
+    ('payment_method', 'Phương thức TT'),
+    ('payment_status', 'Thanh toán'),
+    ('total_price', 'Thành tiền'),
+    ('created_at', 'Ngày đặt'),
+]
+
+
+@revenue_bp.route('/report/export')
+@login_required
+@admin_required
+def export_report():
+    """Xuất toàn bộ booking của báo cáo (cùng bộ lọc) ra CSV / Excel, đọc theo từng lô"""
+    from_date = request.args.get('from_date', '')
+    to_date = request.args.get('to_date', '')
+    route_id = request.args.get('route_id', '')
+    file_format = request.args.get('format', 'csv')
+    filename = f"bao_cao_doanh_thu_{datetime.now().strftime('%Y%m%d')}"
+    
+    try:
+        chunks = Booking.iter_report_export(from_date, to_date, route_id)
+        if file_format == 'xlsx':
+            path = write_xlsx(REPORT_COLUMNS, chunks, sheet_name='Doanh thu')
+    except ValueError:
+        flash('Ngày lọc không hợp lệ!', 'danger')
+        return redirect(url_for('revenue.report'))
+    
+    if file_format == 'xlsx':
+        return Response(
+            iter_file(path, delete=True),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={'Content-Disposition': f'attachment; filename={filename}.xlsx'}
+        )
+    
+    return Response(
+        stream_with_context(iter_csv(REPORT_COLUMNS, chunks)),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+    )
+
+
 @revenue_bp.route('/statistics')
 @login_required
 @admin_required
 def statistics():
-    """Trang thống kê tổng hợp"""
-    conn = Database.get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
+    """Trang thống kê tổng hợp (đọc từ bảng tổng hợp revenue_daily / revenue_hourly)"""
     # Thống kê theo ngày trong tuần
-    cursor.execute("""
-        SELECT 
-            DAYNAME(created_at) as day_name,
-            DAYOFWEEK(created_at) as day_num,
-            COUNT(*) as bookings,
-            SUM(total_price) as revenue
-        FROM bookings
-        WHERE status != 'cancelled' 
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-        GROUP BY day_name, day_num
-        ORDER BY day_num
-    """)
-    daily_stats = cursor.fetchall()
+    daily_stats = RevenueRollup.by_weekday(30)
     
     # Thống kê theo giờ trong ngày
-    cursor.execute("""
-        SELECT 
-            HOUR(created_at) as hour,
-            COUNT(*) as bookings,
-            SUM(total_price) as revenue
-        FROM bookings
-        WHERE status != 'cancelled' 
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-        GROUP BY hour
-        ORDER BY hour
-    """)
-    hourly_stats = cursor.fetchall()
+    hourly_stats = RevenueRollup.by_hour(7)
     
     # Thống kê tỷ lệ đặt vé theo trạng thái
-    cursor.execute("""
-        SELECT 
-            status,
-            COUNT(*) as count,
-            ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM bookings), 2) as percentage
-        FROM bookings
-        GROUP BY status
-    """)
-    status_stats = cursor.fetchall()
+    status_stats = RevenueRollup.by_status()
     
-    # Thống kê nhà xe
-    cursor.execute("""
-        SELECT 
-            bus.bus_company,
-            COUNT(DISTINCT t.id) as total_trips,
-            COUNT(b.id) as total_bookings,
-            SUM(b.total_price) as revenue
+    # Thống kê nhà xe: số chuyến lấy từ trips, doanh thu từ bảng tổng hợp
+    trip_counts = Database.execute_query("""
+        SELECT bus.bus_company, COUNT(t.id) as total_trips
         FROM buses bus
         LEFT JOIN trips t ON bus.id = t.bus_id
-        LEFT JOIN bookings b ON t.id = b.trip_id AND b.status != 'cancelled'
         GROUP BY bus.bus_company
-        ORDER BY revenue DESC
-    """)
-    company_stats = cursor.fetchall()
-    
-    cursor.close()
+    """, fetch_all=True) or []
+    revenue_by_company = {row['bus_company']: row for row in RevenueRollup.by_company()}
+    
+    company_stats = []
+    for row in trip_counts:
+        revenue = revenue_by_company.get(row['bus_company']) or {}
+        company_stats.append({
+            'bus_company': row['bus_company'],
+            'total_trips': row['total_trips'],
+            'total_bookings': int(revenue.get('total_bookings') or 0),
+            'revenue': revenue.get('revenue')
+        })
+    company_stats.sort(key=lambda row: row['revenue'] or 0, reverse=True)
     
     return render_template('admin/statistics.html',
                          daily_stats=daily_stats,
@@ -268,36 +190,18 @@ def chart_data():
     """API trả về dữ liệu cho biểu đồ"""
     chart_type = request.args.get('type', 'monthly')
     
-    conn = Database.get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    if chart_type == 'monthly':
-        cursor.execute("""
-            SELECT 
-                DATE_FORMAT(created_at, '%Y-%m') as label,
-                SUM(total_price) as value
-            FROM bookings
-            WHERE status != 'cancelled' 
-                AND created_at >= DATE_SUB(NOW(), INTERVAL 12 MONTH)
-            GROUP BY DATE_FORMAT(created_at, '%Y-%m')
-            ORDER BY label
-        """)
-    elif chart_type == 'daily':
-        cursor.execute("""
-            SELECT 
-                DATE(created_at) as label,
-                SUM(total_price) as value
-            FROM bookings
-            WHERE status != 'cancelled' 
-                AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-            GROUP BY DATE(created_at)
-            ORDER BY label
-        """)
-    
-    data = cursor.fetchall()
-    cursor.close()
+    if chart_type == 'daily':
+        data = [
+            {'label': row['day'], 'value': row['revenue']}
+            for row in RevenueRollup.daily(30)
+        ]
+    else:
+        data = [
+            {'label': row['month'], 'value': row['revenue']}
+            for row in RevenueRollup.monthly(12, ascending=True)
+        ]
     
     return jsonify({
-        'labels': [row['label'].strftime('%Y-%m-%d') if isinstance(row['label'], datetime) else str(row['label']) for row in data],
-        'values': [float(row['value']) for row in data]
-    })
\ No newline at end of file
+        'labels': [row['label'].strftime('%Y-%m-%d') if isinstance(row['label'], (datetime, date)) else str(row['label']) for row in data],
+        'values': [float(row['value'] or 0) for row in data]
+    })
@@ -6,6 +6,7 @@ Quản lý chuyến xe = Bus + Ngày
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from controllers.admin_controller import admin_required
+from models.booking import Booking
 from models.trip import Trip
 from models.bus import Bus
 from models.route import Route
@@ -140,14 +141,13 @@ def edit(trip_id):
         try:
             # Lấy dữ liệu
             trip_date = request.form.get('trip_date')
-            available_seats = request.form.get('available_seats')
             status = request.form.get('status', 'scheduled')
             custom_departure_time = request.form.get('custom_departure_time', '').strip()
             custom_price = request.form.get('custom_price', '').strip()
             custom_discount = request.form.get('custom_discount', '').strip()
             
             # Validate
-            if not trip_date or not available_seats:
+            if not trip_date:
                 flash('⚠️ Vui lòng điền đầy đủ thông tin!', 'danger')
                 buses = Bus.get_all()
                 return render_template('trip_form.html', 
@@ -156,10 +156,9 @@ def edit(trip_id):
                                      action='edit',
                                      user=current_user)
             
-            # Prepare data
+            # Prepare data (available_seats chỉ do TripSeat.book_seats/release_seats cập nhật)
             data = {
                 'trip_date': trip_date,
-                'available_seats': int(available_seats),
                 'status': status,
                 'custom_departure_time': custom_departure_time if custom_departure_time else None,
                 'custom_price': float(custom_price) if custom_price else None,
@@ -202,6 +201,22 @@ def delete(trip_id):
     return redirect(url_for('trips.index'))
 
 
+@trip_bp.route('/cancel-bookings/<int:trip_id>', methods=['POST'])
+@login_required
+@admin_required
+def cancel_bookings(trip_id):
+    """Hủy chuyến: hủy hàng loạt mọi đơn của chuyến (xe hỏng...) và trả ghế"""
+    reason = request.form.get('cancel_reason') or 'Hủy chuyến'
+    result = Booking.cancel_trip(trip_id, reason)
+    
+    if result is not None:
+        flash(f'✅ Đã hủy chuyến: {result["bookings"]} đơn, trả {len(result["seats"])} ghế!', 'success')
+    else:
+        flash('❌ Không thể hủy chuyến!', 'danger')
+    
+    return redirect(url_for('trips.index'))
+
+
 @trip_bp.route('/toggle/<int:trip_id>')
 @login_required
 @admin_required
@@ -222,22 +237,29 @@ def toggle(trip_id):
 @login_required
 @admin_required
 def bulk_create():
-    """Tạo nhiều trips cho 1 xe"""
+    """Tạo nhiều trips cho 1 hoặc nhiều xe"""
     try:
-        bus_id = request.form.get('bulk_bus_id')
+        bus_ids = [bus_id for bus_id in request.form.getlist('bulk_bus_id') if bus_id]
         start_date = request.form.get('bulk_start_date')
         end_date = request.form.get('bulk_end_date')
         
-        if not all([bus_id, start_date, end_date]):
+        if not all([bus_ids, start_date, end_date]):
             flash('⚠️ Vui lòng điền đầy đủ thông tin!', 'danger')
             return redirect(url_for('trips.index'))
         
-        count = Trip.create_bulk(int(bus_id), start_date, end_date)
+        result = Trip.schedule_bulk([int(bus_id) for bus_id in bus_ids], start_date, end_date)
         
-        if count > 0:
-            flash(f'✅ Đã tạo {count} chuyến xe thành công!', 'success')
-        else:
+        if result['created'] > 0:
+            flash(f'✅ Đã tạo {result["created"]} chuyến xe thành công '
+                  f'(bỏ qua {result["skipped"]} chuyến đã có)!', 'success')
+        elif result['skipped'] > 0:
+            flash(f'⚠️ Tất cả {result["skipped"]} chuyến đã tồn tại, không tạo thêm!', 'warning')
+        elif not result['invalid_bus_ids']:
             flash('❌ Không thể tạo chuyến xe!', 'danger')
+        
+        if result['invalid_bus_ids']:
+            flash('⚠️ Bỏ qua xe không tồn tại / ngừng hoạt động / đang bảo trì (ID: '
+                  f'{", ".join(str(bus_id) for bus_id in result["invalid_bus_ids"])})', 'warning')
     
     except Exception as e:
         flash(f'❌ Lỗi: {str(e)}', 'danger')
@@ -4,11 +4,16 @@ User Controller - FIXED cho schema mới
 ✅ Kết nối đúng với v_trips_search
 """
 
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
+from config import Config
+from models.cache import cache
+from models.city_index import city_index
+from models.itinerary import itinerary_planner
+from models.route import Route
 from models.database import Database
+from models.seat_cache import seat_cache
 from datetime import datetime
-import os
 
 user_bp = Blueprint('user', __name__)
 
@@ -51,7 +56,145 @@ def search():
                              date=date,
                              user=current_user)
     
-    # ✅ FIX: Tìm kiếm từ v_trips_search với filter theo NGÀY
+    trips = search_trips(departure, arrival, date)
+    
+    print(f"✅ Tìm thấy {len(trips) if trips else 0} chuyến xe")
+    
+    if trips:
+        for trip in trips:
+            print(f"  - Trip {trip['trip_id']}: {trip['bus_company']} lúc {trip['departure_time']}")
+    
+    # Sort results
+    if sort == 'time':
+        trips = sorted(trips, key=lambda x: x['departure_time'])
+    elif sort == 'price_asc':
+        trips = sorted(trips, key=lambda x: x['final_price'])
+    elif sort == 'price_desc':
+        trips = sorted(trips, key=lambda x: x['final_price'], reverse=True)
+    
+    return render_template('search_results.html',
+                         trips=trips,
+                         departure=departure,
+                         arrival=arrival,
+                         date=date,
+                         user=current_user)
+
+
+@user_bp.route('/api/cities/suggest')
+@login_required
+def suggest_cities():
+    """
+    API gợi ý tên thành phố cho ô điểm đi/điểm đến
+    
+    Query: ?q=<tiền tố>&limit=<số gợi ý, mặc định 10>
+    Returns: JSON {'suggestions': [{'name': 'Đà Nẵng', 'popularity': 12}, ...]}
+    """
+    q = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int), 20)
+    
+    return jsonify({'suggestions': city_index.suggest(q, limit=limit)})
+
+
+@user_bp.route('/api/routes/<int:route_id>/calendar')
+@login_required
+def route_calendar(route_id):
+    """
+    API lịch giá theo ngày của 1 tuyến (giá thấp nhất, số chuyến, số ghế còn)
+    
+    Query: ?from=YYYY-MM-DD (mặc định hôm nay)&days=<1-90, mặc định 30>
+    Returns: JSON {'route_id', 'from', 'days', 'calendar': [...]}
+    """
+    try:
+        start_date = datetime.strptime(request.args.get('from') or datetime.now().strftime('%Y-%m-%d'),
+                                       '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Tham số from không hợp lệ (YYYY-MM-DD)'}), 400
+    
+    days = max(1, min(request.args.get('days', 30, type=int), 90))
+    
+    return jsonify({
+        'route_id': route_id,
+        'from': start_date.isoformat(),
+        'days': days,
+        'calendar': Route.get_calendar(route_id, start_date, days)
+    })
+
+
+@user_bp.route('/api/itineraries')
+@login_required
+def search_itineraries():
+    """
+    API tìm hành trình nối chuyến (1-2 lần chuyển xe)
+    
+    Query: ?departure=&arrival=&date=YYYY-MM-DD&max_transfers=1|2
+           &min_connection=<phút>&sort=duration|price&limit=<tối đa 20>
+    Returns: JSON {'itineraries': [...]}
+    """
+    departure = request.args.get('departure', '').strip()
+    arrival = request.args.get('arrival', '').strip()
+    if not departure or not arrival:
+        return jsonify({'error': 'Thiếu điểm đi hoặc điểm đến'}), 400
+    
+    try:
+        travel_date = datetime.strptime(request.args.get('date') or datetime.now().strftime('%Y-%m-%d'),
+                                        '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Tham số date không hợp lệ (YYYY-MM-DD)'}), 400
+    
+    options = Config.ITINERARY
+    itineraries = itinerary_planner.search(
+        departure, arrival, travel_date,
+        max_transfers=max(1, min(request.args.get('max_transfers', 2, type=int), 2)),
+        min_connection=max(0, request.args.get('min_connection', options['min_connection_minutes'], type=int)),
+        max_layover=options['max_layover_hours'],
+        sort=request.args.get('sort', 'duration'),
+        limit=max(1, min(request.args.get('limit', 10, type=int), 20))
+    )
+    
+    return jsonify({'itineraries': itineraries})
+
+
+def _normalize_search_term(text):
+    """Chuẩn hóa điểm đi/đến làm khóa cache (bỏ khoảng trắng thừa, không phân biệt hoa thường)"""
+    return ' '.join(text.split()).casefold()
+
+
+def search_trips(departure, arrival, date):
+    """
+    Tìm chuyến theo (điểm đi, điểm đến, ngày)
+    Kết quả cache Config.SEARCH_CACHE_TTL giây theo khóa đã chuẩn hóa, xóa khi trip/bus/route
+    thay đổi; số ghế trống lấy lại từ seat_cache mỗi lần nên không bị cũ.
+    Chuyến đã hết ghế (sau khi lấy lại số ghế) bị bỏ khỏi kết quả.
+    
+    Returns:
+        list: Danh sách chuyến còn ghế (bản sao, có thể sort/sửa thoải mái)
+    """
+    # Query bằng đúng giá trị đã chuẩn hóa của khóa (collation _ci không phân biệt hoa thường),
+    # để "Hà  Nội" không cache [] dưới khóa của "Hà Nội"
+    departure = _normalize_search_term(departure)
+    arrival = _normalize_search_term(arrival)
+    key = 'search:{}|{}|{}'.format(departure, arrival, date)
+    cached = cache.get_or_set(
+        key,
+        lambda: _query_trips(departure, arrival, date),
+        ttl=Config.SEARCH_CACHE_TTL,
+        tags=('trips', 'buses', 'routes')
+    )
+    
+    trips = [dict(trip) for trip in cached]
+    seat_maps = seat_cache.get_seat_maps(trip['trip_id'] for trip in trips)
+    for trip in trips:
+        seat_map = seat_maps[trip['trip_id']]
+        # Chuyến cũ chưa có trip_seats -> giữ available_seats của trips
+        if seat_map['available'] or seat_map['locked'] or seat_map['booked']:
+            trip['available_seats'] = len(seat_map['available']) + len(seat_map['locked'])
+    
+    # Kết quả cache có thể chứa chuyến vừa bán hết -> không cho chọn chuyến 0 ghế
+    return [trip for trip in trips if trip['available_seats'] > 0]
+
+
+def _query_trips(departure, arrival, date):
+    """✅ FIX: Tìm kiếm từ v_trips_search với filter theo NGÀY"""
     query = """
         SELECT 
             trip_id,
@@ -84,49 +227,25 @@ def search():
         ORDER BY departure_time ASC
     """
     
-    trips = Database.execute_query(
-        query, 
-        (departure, arrival, date), 
-        fetch_all=True
-    )
-    
-    print(f"✅ Tìm thấy {len(trips) if trips else 0} chuyến xe")
-    
-    if trips:
-        for trip in trips:
-            print(f"  - Trip {trip['trip_id']}: {trip['bus_company']} lúc {trip['departure_time']}")
-    
-    # Sort results
-    if sort == 'time':
-        trips = sorted(trips, key=lambda x: x['departure_time'])
-    elif sort == 'price_asc':
-        trips = sorted(trips, key=lambda x: x['final_price'])
-    elif sort == 'price_desc':
-        trips = sorted(trips, key=lambda x: x['final_price'], reverse=True)
-    
-    return render_template('search_results.html',
-                         trips=trips,
-                         departure=departure,
-                         arrival=arrival,
-                         date=date,
-                         user=current_user)
+    return Database.execute_query(query, (departure, arrival, date), fetch_all=True) or []
 
 
-def check_image_exists(image_path):
-    """Kiểm tra file ảnh có tồn tại"""
-    if not image_path:
-        return False
-    
-    if image_path.startswith('/static/'):
-        relative_path = image_path.replace('/static/', '')
-        full_path = os.path.join('static', relative_path)
-        return os.path.isfile(full_path)
-    
-    return False
+def get_popular_routes():
+    """
+    Lấy danh sách tuyến phổ biến (widget trang chủ)
+    Tính sẵn và cache Config.POPULAR_ROUTES_REFRESH giây,
+    xóa khi route/bus/trip thay đổi (tag 'routes', 'buses', 'trips')
+    """
+    return cache.get_or_set(
+        'popular_routes',
+        _build_popular_routes,
+        ttl=Config.POPULAR_ROUTES_REFRESH,
+        tags=('routes', 'buses', 'trips')
+    )
 
 
-def get_popular_routes():
-    """Lấy danh sách tuyến phổ biến"""
+def _build_popular_routes():
+    """Tính danh sách tuyến phổ biến từ database"""
     query = """
         SELECT 
             r.id,
@@ -193,9 +312,10 @@ def get_popular_routes():
             '/static/images/default-bus.jpg'
         ]
         
+        # File ảnh local đã được kiểm tra lúc lưu xe (Bus.resolve_image)
         if not image_path or image_path in placeholder_images:
             route['route_image'] = None
-        elif not check_image_exists(image_path):
+        elif not image_path.startswith('/static/'):
             route['route_image'] = None
     
     return routes
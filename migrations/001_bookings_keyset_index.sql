@@ -0,0 +1,7 @@
+-- Phân trang keyset cho danh sách booking admin
+-- ORDER BY b.created_at DESC, b.id DESC + điều kiện (created_at, id) < cursor
+-- đọc thẳng theo index thay vì sắp xếp cả bảng.
+-- Chạy: mysql -u root -p bus_ticket < migrations/001_bookings_keyset_index.sql
+
+ALTER TABLE `bookings`
+  ADD KEY `idx_created_id` (`created_at`, `id`);
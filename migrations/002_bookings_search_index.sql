@@ -0,0 +1,13 @@
+-- Tìm kiếm booking có index cho trang admin (Booking.search_condition)
+-- - passenger_phone_norm: SĐT chỉ gồm chữ số, +84 -> 0 (tìm theo tiền tố)
+-- - passenger_name_folded: tên không dấu, FULLTEXT ngram (tìm theo cụm ký tự)
+-- Ứng dụng tự điền 2 cột khi tạo booking; booking cũ: flask --app app backfill-booking-search
+-- Chạy: mysql -u root -p bus_ticket < migrations/002_bookings_search_index.sql
+
+ALTER TABLE `bookings`
+  ADD COLUMN `passenger_phone_norm` varchar(20) COLLATE utf8mb4_unicode_ci DEFAULT NULL AFTER `passenger_phone`,
+  ADD COLUMN `passenger_name_folded` varchar(100) COLLATE utf8mb4_unicode_ci DEFAULT NULL AFTER `passenger_name`,
+  ADD KEY `idx_phone_norm` (`passenger_phone_norm`);
+
+ALTER TABLE `bookings`
+  ADD FULLTEXT KEY `ft_passenger_name` (`passenger_name_folded`) WITH PARSER ngram;
@@ -0,0 +1,29 @@
+-- Bảng tổng hợp doanh thu theo ngày (models/revenue_rollup.py)
+-- Cập nhật tăng dần mỗi khi booking được tạo / đổi trạng thái;
+-- dựng lại toàn bộ: flask --app app rebuild-revenue-rollups
+-- Chạy: mysql -u root -p bus_ticket < migrations/003_revenue_rollups.sql
+
+CREATE TABLE IF NOT EXISTS `revenue_daily` (
+  `stat_date` date NOT NULL COMMENT 'Ngày đặt (DATE(bookings.created_at))',
+  `route_id` int NOT NULL,
+  `bus_company` varchar(100) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `payment_method` varchar(50) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '' COMMENT '= bookings.payment_method (varchar 50)',
+  `status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL COMMENT 'bookings.status',
+  `payment_status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL COMMENT 'bookings.payment_status',
+  `bookings` int NOT NULL DEFAULT 0,
+  `seats` int NOT NULL DEFAULT 0,
+  `revenue` decimal(15,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`stat_date`, `route_id`, `bus_company`, `payment_method`, `status`, `payment_status`),
+  KEY `idx_route` (`route_id`),
+  KEY `idx_company` (`bus_company`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Theo giờ trong ngày (biểu đồ giờ cao điểm ở trang thống kê)
+CREATE TABLE IF NOT EXISTS `revenue_hourly` (
+  `stat_date` date NOT NULL,
+  `stat_hour` tinyint NOT NULL,
+  `status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `bookings` int NOT NULL DEFAULT 0,
+  `revenue` decimal(15,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`stat_date`, `stat_hour`, `status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
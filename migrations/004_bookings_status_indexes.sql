@@ -0,0 +1,14 @@
+-- Index cho lọc theo trạng thái + thời gian đặt (báo cáo doanh thu, thống kê)
+-- và theo chuyến + trạng thái (đếm/hủy booking của 1 chuyến)
+--   idx_status_created: b.status IN (...) AND b.created_at >= ? AND b.created_at < ?
+--   idx_trip_status:    b.trip_id = ? AND b.status != 'cancelled', JOIN trips -> bookings
+-- idx_trip / idx_status là tiền tố của 2 index mới nên bỏ đi
+-- (idx_trip_status vẫn phục vụ khóa ngoại bookings_ibfk_1).
+-- So sánh plan trước/sau: flask --app app benchmark-revenue-report
+-- Chạy: mysql -u root -p bus_ticket < migrations/004_bookings_status_indexes.sql
+
+ALTER TABLE `bookings`
+  ADD KEY `idx_status_created` (`status`, `created_at`),
+  ADD KEY `idx_trip_status` (`trip_id`, `status`),
+  DROP KEY `idx_status`,
+  DROP KEY `idx_trip`;
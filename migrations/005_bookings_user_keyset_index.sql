@@ -0,0 +1,9 @@
+-- Trang "Vé của tôi" phân trang keyset theo user
+-- WHERE b.user_id = ? ORDER BY b.created_at DESC, b.id DESC LIMIT n đọc thẳng theo index,
+-- không sắp xếp toàn bộ lịch sử đặt vé của user.
+-- idx_user là tiền tố của index mới nên bỏ đi (idx_user_created vẫn phục vụ khóa ngoại bookings_ibfk_2).
+-- Chạy: mysql -u root -p bus_ticket < migrations/005_bookings_user_keyset_index.sql
+
+ALTER TABLE `bookings`
+  ADD KEY `idx_user_created` (`user_id`, `created_at`, `id`),
+  DROP KEY `idx_user`;
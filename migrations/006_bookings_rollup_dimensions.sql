@@ -0,0 +1,17 @@
+-- Chiều tổng hợp doanh thu (tuyến, nhà xe) lưu trên booking lúc đặt
+-- (models/revenue_rollup.py) - sửa tuyến/nhà xe của xe sau đó không làm lệch bảng tổng hợp,
+-- và snapshot chỉ cần khóa dòng bookings (không JOIN trips/buses ... FOR UPDATE)
+-- Booking.create tự điền; booking cũ được điền từ xe hiện tại ngay trong file này.
+-- Chạy: mysql -u root -p bus_ticket < migrations/006_bookings_rollup_dimensions.sql
+-- rồi: flask --app app rebuild-revenue-rollups
+
+ALTER TABLE `bookings`
+  ADD COLUMN `booked_route_id` int DEFAULT NULL AFTER `trip_id`,
+  ADD COLUMN `booked_bus_company` varchar(100) COLLATE utf8mb4_unicode_ci DEFAULT NULL AFTER `booked_route_id`;
+
+UPDATE `bookings` b
+  INNER JOIN `trips` t ON b.trip_id = t.id
+  INNER JOIN `buses` bus ON t.bus_id = bus.id
+SET b.booked_route_id = bus.route_id,
+    b.booked_bus_company = bus.bus_company
+WHERE b.booked_route_id IS NULL;
@@ -0,0 +1,8 @@
+-- revenue_daily.payment_method phải dài bằng bookings.payment_method (varchar 50):
+-- ngắn hơn thì upsert tổng hợp lỗi (strict mode -> rollback cả checkout)
+-- hoặc bị cắt và gộp nhầm khóa (không strict).
+-- migrations/003 đã sửa cho cài mới; file này cho DB đã chạy 003 trước đó (chạy lại vô hại).
+-- Chạy: mysql -u root -p bus_ticket < migrations/007_revenue_daily_payment_method.sql
+
+ALTER TABLE `revenue_daily`
+  MODIFY `payment_method` varchar(50) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '';
@@ -3,13 +3,43 @@ Booking Model - Fixed cho schema mới
 ✅ FIX: Thêm error handling và lấy đầy đủ thông tin bus_type
 """
 
+from config import Config
+from models.cache import cache
+from models.city_index import fold_text
 from models.database import Database
-from datetime import datetime
+from models.revenue_rollup import RevenueRollup
+from models.trip_seat import TripSeat
+from datetime import date, datetime, timedelta
+import base64
+import json
 import random
+import re
 import string
 
 class Booking:
     
+    # Danh sách booking cho báo cáo doanh thu (điều kiện lọc nối thêm sau WHERE)
+    REPORT_QUERY = """
+        SELECT 
+            b.id,
+            b.booking_code,
+            b.passenger_name,
+            b.total_seats,
+            b.total_price,
+            b.payment_status,
+            b.payment_method,
+            b.created_at,
+            r.departure_point,
+            r.arrival_point,
+            bus.bus_company,
+            t.trip_date
+        FROM bookings b
+        JOIN trips t ON b.trip_id = t.id
+        JOIN buses bus ON t.bus_id = bus.id
+        JOIN routes r ON bus.route_id = r.id
+        WHERE 1=1
+    """
+    
     @staticmethod
     def generate_booking_code():
         """Tạo mã đặt vé: BK20251202001"""
@@ -30,18 +60,34 @@ class Booking:
             
             query = """
                 INSERT INTO bookings (
-                    user_id, trip_id, booking_code, 
+                    user_id, trip_id, booked_route_id, booked_bus_company, booking_code, 
                     passenger_name, passenger_phone, passenger_email,
+                    passenger_name_folded, passenger_phone_norm,
                     total_seats, total_price, payment_method, 
                     payment_status, status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', 'pending')
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', 'pending')
             """
             
-            booking_id = Database.execute_query(query, (
-                user_id, trip_id, booking_code,
-                passenger_name, passenger_phone, passenger_email,
-                total_seats, total_price, payment_method
-            ))
+            # Tuyến / nhà xe lúc đặt cho bảng tổng hợp doanh thu (đọc thường, không khóa trips/buses)
+            bus = Database.execute_query("""
+                SELECT bus.route_id, bus.bus_company
+                FROM trips t
+                INNER JOIN buses bus ON t.bus_id = bus.id
+                WHERE t.id = %s
+            """, (trip_id,), fetch_one=True)
+            if not bus:
+                print(f"❌ Không tìm thấy chuyến {trip_id}")
+                return None
+            
+            with Database.transaction():
+                booking_id = Database.execute_query(query, (
+                    user_id, trip_id, bus['route_id'], bus['bus_company'], booking_code,
+                    passenger_name, passenger_phone, passenger_email,
+                    fold_text(passenger_name), Booking.normalize_phone(passenger_phone),
+                    total_seats, total_price, payment_method
+                ))
+                if booking_id:
+                    RevenueRollup.record_new(booking_id)
             
             if booking_id:
                 print(f"✅ Tạo booking thành công - ID: {booking_id}, Code: {booking_code}")
@@ -73,10 +119,16 @@ class Booking:
         return Database.execute_query(query, (booking_id,), fetch_one=True)
     
     @staticmethod
-    def get_by_user(user_id):
+    def get_page_by_user(user_id, cursor=None, per_page=10):
         """
-        ✅ FIXED: Thêm đầy đủ thông tin bus_type, departure_point, arrival_point
-        Lấy danh sách booking của user
+        Booking của user theo trang (keyset, mới nhất trước) - trang "Vé của tôi"
+        Dùng idx_user_created (user_id, created_at, id): chi phí không tăng theo lịch sử đặt vé
+        
+        Returns:
+            dict: {'bookings': [...], 'next_cursor': str|None, 'prev_cursor': str|None}
+            
+        Raises:
+            ValueError: cursor không hợp lệ
         """
         query = """
             SELECT 
@@ -93,71 +145,386 @@ class Booking:
             INNER JOIN buses bus ON tp.bus_id = bus.id
             INNER JOIN routes r ON bus.route_id = r.id
             WHERE b.user_id = %s
-            ORDER BY b.created_at DESC
         """
-        
-        bookings = Database.execute_query(query, (user_id,), fetch_all=True)
-        
-        if bookings:
-            print(f"✅ Tìm thấy {len(bookings)} bookings cho user {user_id}")
-        else:
-            print(f"⚠️ Không tìm thấy booking nào cho user {user_id}")
-        
-        return bookings
+        return Booking.keyset_page(query, [user_id], cursor, per_page)
     
     @staticmethod
-    def get_all_with_filter(status='', payment_status='', search='', 
-                           date_from='', date_to='', page=1, per_page=20):
-        """Lấy danh sách booking với filter cho admin"""
-        query = """
-            SELECT b.*, 
-                   tp.trip_date,
-                   bus.bus_company, bus.departure_time, bus.bus_type,
-                   r.departure_point, r.arrival_point,
-                   u.username, u.full_name
-            FROM bookings b
-            INNER JOIN trips tp ON b.trip_id = tp.id
-            INNER JOIN buses bus ON tp.bus_id = bus.id
-            INNER JOIN routes r ON bus.route_id = r.id
-            INNER JOIN users u ON b.user_id = u.id
-            WHERE 1=1
+    def build_filter(status='', payment_status='', search='', date_from='', date_to=''):
+        """
+        Tạo điều kiện WHERE cho danh sách booking admin (dùng chung cho list/đếm/xuất file)
+        Alias bảng: b = bookings, tp = trips
+        
+        Returns:
+            tuple: (chuỗi điều kiện bắt đầu bằng ' AND ...' hoặc '', list params)
         """
+        conditions = ''
         params = []
         
-        # Filters
         if status:
-            query += " AND b.status = %s"
+            conditions += " AND b.status = %s"
             params.append(status)
         
         if payment_status:
-            query += " AND b.payment_status = %s"
+            conditions += " AND b.payment_status = %s"
             params.append(payment_status)
         
         if search:
-            query += """ AND (
-                b.booking_code LIKE %s OR 
-                b.passenger_name LIKE %s OR 
-                b.passenger_phone LIKE %s
-            )"""
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
+            search_sql, search_params = Booking.search_condition(search)
+            conditions += search_sql
+            params.extend(search_params)
         
         if date_from:
-            query += " AND tp.trip_date >= %s"
+            conditions += " AND tp.trip_date >= %s"
             params.append(date_from)
         
         if date_to:
-            query += " AND tp.trip_date <= %s"
+            conditions += " AND tp.trip_date <= %s"
             params.append(date_to)
         
-        # Order and pagination
+        return conditions, params
+    
+    @staticmethod
+    def date_range_condition(column, date_from='', date_to=''):
+        """
+        Điều kiện lọc theo ngày dạng nửa mở [date_from 00:00, date_to + 1 ngày)
+        thay cho DATE(column) >= / <= để MySQL dùng được index trên column
+        
+        Args:
+            column (str): Cột datetime/timestamp, vd 'b.created_at'
+            date_from (str|date): Từ ngày (rỗng = không lọc)
+            date_to (str|date): Đến ngày, tính cả ngày này (rỗng = không lọc)
+            
+        Returns:
+            tuple: (' AND ...' hoặc '', list params)
+            
+        Raises:
+            ValueError: Ngày không đúng định dạng YYYY-MM-DD
+        """
+        conditions = ''
+        params = []
+        
+        if date_from:
+            if not isinstance(date_from, date):
+                date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
+            conditions += f" AND {column} >= %s"
+            params.append(date_from)
+        
+        if date_to:
+            if not isinstance(date_to, date):
+                date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+            conditions += f" AND {column} < %s"
+            params.append(date_to + timedelta(days=1))
+        
+        return conditions, params
+    
+    @staticmethod
+    def report_query(date_from='', date_to='', route_id=''):
+        """
+        Câu query danh sách booking (chưa hủy) cho báo cáo doanh thu
+        Lọc theo ngày đặt (nửa mở, dùng idx_status_created) và tuyến
+        
+        Returns:
+            tuple: (query, params) - mới nhất trước
+        """
+        query = Booking.REPORT_QUERY + " AND b.status IN ('pending', 'confirmed')"
+        
+        conditions, params = Booking.date_range_condition('b.created_at', date_from, date_to)
+        query += conditions
+        
+        if route_id:
+            query += " AND bus.route_id = %s"
+            params.append(route_id)
+        
         query += " ORDER BY b.created_at DESC"
+        return query, params
+    
+    @staticmethod
+    def get_report_bookings(date_from='', date_to='', route_id='', limit=500):
+        """
+        Danh sách booking cho trang báo cáo doanh thu (tối đa limit dòng mới nhất,
+        toàn bộ thì xuất file - iter_report_export)
+        
+        Returns:
+            list: Danh sách booking mới nhất trước
+        """
+        query, params = Booking.report_query(date_from, date_to, route_id)
+        query += " LIMIT %s"
+        params.append(limit)
+        
+        return Database.execute_query(query, tuple(params), fetch_all=True) or []
+    
+    @staticmethod
+    def iter_report_export(date_from='', date_to='', route_id='', chunk_size=1000):
+        """Đọc toàn bộ booking của báo cáo doanh thu theo từng lô (xuất file)"""
+        query, params = Booking.report_query(date_from, date_to, route_id)
+        return Database.stream(query, tuple(params), chunk_size=chunk_size)
+    
+    @staticmethod
+    def iter_export(status='', payment_status='', search='', date_from='', date_to='',
+                    chunk_size=1000):
+        """
+        Đọc toàn bộ booking theo cùng bộ lọc với danh sách admin, từng lô
+        (cursor không buffer - bộ nhớ không tăng theo số dòng)
+        
+        Yields:
+            list: Lô booking (dict), mới nhất trước
+        """
+        query = """
+            SELECT b.booking_code, b.passenger_name, b.passenger_phone, b.passenger_email,
+                   r.departure_point, r.arrival_point, bus.bus_company,
+                   tp.trip_date, bus.departure_time,
+                   b.total_seats, b.total_price, b.payment_method,
+                   b.payment_status, b.status, b.created_at
+            FROM bookings b
+            INNER JOIN trips tp ON b.trip_id = tp.id
+            INNER JOIN buses bus ON tp.bus_id = bus.id
+            INNER JOIN routes r ON bus.route_id = r.id
+            WHERE 1=1
+        """
+        conditions, params = Booking.build_filter(status, payment_status, search, date_from, date_to)
+        query += conditions + " ORDER BY b.created_at DESC, b.id DESC"
+        
+        return Database.stream(query, tuple(params), chunk_size=chunk_size)
+    
+    @staticmethod
+    def normalize_phone(phone):
+        """
+        Chuẩn hóa SĐT để tìm kiếm: chỉ giữ chữ số, +84/84 -> 0
+        Ví dụ: '+84 912-345-678' -> '0912345678'
+        """
+        digits = re.sub(r'\D', '', phone or '')
+        if digits.startswith('84') and len(digits) >= 11:
+            digits = '0' + digits[2:]
+        return digits
+    
+    @staticmethod
+    def search_condition(search):
+        """
+        Điều kiện tìm kiếm booking dùng index (thay cho LIKE '%x%' trên 3 cột)
+        - Mã đặt vé (BK...): tiền tố trên idx_booking_code
+        - SĐT (chỉ số và + - . ( ) khoảng trắng): tiền tố trên passenger_phone_norm;
+          chỉ gồm chữ số thì khớp cả mã đặt vé gõ thiếu 'BK' (vd '20251202')
+        - Còn lại: tên hành khách, FULLTEXT ngram trên passenger_name_folded (không dấu)
+        
+        Returns:
+            tuple: (chuỗi ' AND ...', list params)
+        """
+        term = search.strip()
+        
+        if re.fullmatch(r'(?i)BK\d*', term):
+            return " AND b.booking_code LIKE %s", [term.upper() + '%']
+        
+        if re.fullmatch(r'[\d\s+().-]+', term):
+            phone = Booking.normalize_phone(term)
+            if len(phone) >= 3:
+                if term.isdigit():
+                    # 2 tiền tố trên 2 index -> MySQL dùng index_merge (union)
+                    return (" AND (b.passenger_phone_norm LIKE %s OR b.booking_code LIKE %s)",
+                            [phone + '%', 'BK' + term + '%'])
+                return " AND b.passenger_phone_norm LIKE %s", [phone + '%']
+        
+        name = fold_text(term)
+        if len(name.replace(' ', '')) < 2:
+            # Quá ngắn cho ngram (2 ký tự) -> không có kết quả thay vì quét bảng
+            return " AND 1=0", []
+        
+        # Tìm theo cụm từ (fold_text chỉ giữ a-z0-9 nên không lẫn toán tử boolean mode)
+        return (" AND MATCH(b.passenger_name_folded) AGAINST (%s IN BOOLEAN MODE)",
+                ['"' + name + '"'])
+    
+    @staticmethod
+    def backfill_search_columns(chunk_size=1000):
+        """
+        Điền passenger_name_folded / passenger_phone_norm cho booking cũ
+        (chạy 1 lần sau migrations/002_bookings_search_index.sql)
+        
+        Returns:
+            int: Số booking đã cập nhật
+        """
+        query = """
+            SELECT id, passenger_name, passenger_phone FROM bookings
+            WHERE passenger_name_folded IS NULL AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """
+        
+        total = 0
+        last_id = 0
+        while True:
+            rows = Database.execute_query(query, (last_id, chunk_size), fetch_all=True) or []
+            if not rows:
+                break
+            
+            ids = [row['id'] for row in rows]
+            case_name = ' '.join(['WHEN %s THEN %s'] * len(rows))
+            case_phone = ' '.join(['WHEN %s THEN %s'] * len(rows))
+            placeholders = ', '.join(['%s'] * len(rows))
+            
+            params = []
+            for row in rows:
+                params.extend([row['id'], fold_text(row['passenger_name'])])
+            for row in rows:
+                params.extend([row['id'], Booking.normalize_phone(row['passenger_phone'])])
+            params.extend(ids)
+            
+            Database.execute_update(f"""
+                UPDATE bookings
+                SET passenger_name_folded = CASE id {case_name} END,
+                    passenger_phone_norm = CASE id {case_phone} END
+                WHERE id IN ({placeholders})
+            """, tuple(params))
+            
+            total += len(rows)
+            last_id = ids[-1]
+        
+        print(f"✅ Backfill search columns: {total} bookings")
+        return total
+    
+    @staticmethod
+    def encode_cursor(row, direction):
+        """Token phân trang (opaque) từ (created_at, id) của 1 dòng"""
+        payload = json.dumps({'c': row['created_at'].isoformat(), 'i': row['id'], 'd': direction})
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(token):
+        """
+        Giải mã token phân trang
         
-        offset = (page - 1) * per_page
-        query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
+        Returns:
+            tuple: (created_at, id, 'next' | 'prev')
+            
+        Raises:
+            ValueError: Token không hợp lệ
+        """
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            direction = payload['d']
+            if direction not in ('next', 'prev'):
+                raise ValueError(direction)
+            return datetime.fromisoformat(payload['c']), int(payload['i']), direction
+        except Exception as e:
+            raise ValueError(f"Cursor không hợp lệ: {token}") from e
+    
+    @staticmethod
+    def keyset_page(query, params, cursor=None, per_page=20):
+        """
+        Chạy query danh sách booking (alias b, đã có WHERE) theo trang keyset (created_at, id)
+        Chỉ đọc per_page + 1 dòng từ vị trí cursor, không dùng OFFSET
+        
+        Returns:
+            dict: {'bookings': [...], 'next_cursor': str|None, 'prev_cursor': str|None}
+            
+        Raises:
+            ValueError: cursor không hợp lệ
+        """
+        params = list(params)
+        direction = 'next'
+        if cursor:
+            created_at, booking_id, direction = Booking.decode_cursor(cursor)
+            op = '<' if direction == 'next' else '>'
+            query += f" AND (b.created_at {op} %s OR (b.created_at = %s AND b.id {op} %s))"
+            params.extend([created_at, created_at, booking_id])
+        
+        # Trang trước: đọc ngược lên rồi đảo lại
+        order = 'DESC' if direction == 'next' else 'ASC'
+        query += f" ORDER BY b.created_at {order}, b.id {order} LIMIT %s"
+        params.append(per_page + 1)
+        
+        bookings = Database.execute_query(query, tuple(params), fetch_all=True) or []
+        has_more = len(bookings) > per_page
+        bookings = bookings[:per_page]
+        
+        if direction == 'next':
+            next_cursor = Booking.encode_cursor(bookings[-1], 'next') if has_more else None
+            prev_cursor = Booking.encode_cursor(bookings[0], 'prev') if cursor and bookings else None
+        else:
+            bookings.reverse()
+            prev_cursor = Booking.encode_cursor(bookings[0], 'prev') if has_more else None
+            next_cursor = Booking.encode_cursor(bookings[-1], 'next') if bookings else None
+        
+        return {
+            'bookings': bookings,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+        }
+    
+    @staticmethod
+    def count_with_filter(status='', payment_status='', search='', date_from='', date_to=''):
+        """
+        Tổng số booking (xấp xỉ) theo filter, cache Config.BOOKING_COUNT_TTL giây
+        Không filter: lấy ước lượng TABLE_ROWS của InnoDB (không quét bảng)
+        """
+        filters = (status, payment_status, search, date_from, date_to)
+        
+        def load():
+            if not any(filters):
+                query = """
+                    SELECT TABLE_ROWS as total FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bookings'
+                """
+                result = Database.execute_query(query, fetch_one=True)
+                return int(result['total'] or 0) if result else 0
+            
+            conditions, params = Booking.build_filter(*filters)
+            query = f"""
+                SELECT COUNT(*) as total
+                FROM bookings b
+                INNER JOIN trips tp ON b.trip_id = tp.id
+                WHERE 1=1 {conditions}
+            """
+            result = Database.execute_query(query, tuple(params), fetch_one=True)
+            return int(result['total']) if result else 0
+        
+        key = 'bookings_count:' + json.dumps(filters, ensure_ascii=False)
+        return cache.get_or_set(key, load, ttl=Config.BOOKING_COUNT_TTL, tags=('bookings',))
+    
+    @staticmethod
+    def get_all_with_filter(status='', payment_status='', search='', 
+                           date_from='', date_to='', cursor=None, per_page=20, with_total=True):
+        """
+        Lấy danh sách booking với filter cho admin - phân trang keyset theo (created_at, id)
+        Trang sau/trước chỉ đọc per_page + 1 dòng từ vị trí cursor, không dùng OFFSET
+        nên trang 500 nhanh như trang 1.
         
-        return Database.execute_query(query, tuple(params), fetch_all=True)
+        Args:
+            cursor (str): Token next_cursor/prev_cursor của lần gọi trước (None = trang đầu)
+            per_page (int): Số dòng mỗi trang
+            with_total (bool): Có tính tổng xấp xỉ (count_with_filter) không
+            
+        Returns:
+            dict: {'bookings': [...], 'next_cursor': str|None, 'prev_cursor': str|None,
+                   'approx_total': int|None}
+            
+        Raises:
+            ValueError: cursor không hợp lệ
+        """
+        query = """
+            SELECT b.*, 
+                   b.status as booking_status,
+                   tp.trip_date,
+                   tp.trip_date as travel_date,
+                   bus.bus_company, bus.departure_time, bus.bus_type,
+                   r.departure_point, r.arrival_point,
+                   r.departure_point as departure_city,
+                   r.arrival_point as arrival_city,
+                   CONCAT(r.departure_point, ' → ', r.arrival_point) as route_name,
+                   u.username, u.full_name
+            FROM bookings b
+            INNER JOIN trips tp ON b.trip_id = tp.id
+            INNER JOIN buses bus ON tp.bus_id = bus.id
+            INNER JOIN routes r ON bus.route_id = r.id
+            LEFT JOIN users u ON b.user_id = u.id
+            WHERE 1=1
+        """
+        conditions, params = Booking.build_filter(status, payment_status, search, date_from, date_to)
+        query += conditions
+        
+        page = Booking.keyset_page(query, params, cursor, per_page)
+        page['approx_total'] = (Booking.count_with_filter(status, payment_status, search, date_from, date_to)
+                                if with_total else None)
+        return page
     
     @staticmethod
     def get_statistics():
@@ -187,7 +554,8 @@ class Booking:
                 WHERE id = %s
             """
             
-            Database.execute_query(query, (booking_id,))
+            with RevenueRollup.track(booking_id):
+                Database.execute_query(query, (booking_id,))
             print(f"✅ Xác nhận booking {booking_id} thành công")
             return True
         except Exception as e:
@@ -206,13 +574,112 @@ class Booking:
                 WHERE id = %s
             """
             
-            Database.execute_query(query, (notes, booking_id))
+            with RevenueRollup.track(booking_id):
+                Database.execute_query(query, (notes, booking_id))
             print(f"✅ Hủy booking {booking_id} thành công")
             return True
         except Exception as e:
             print(f"❌ Lỗi cancel booking: {e}")
             return False
     
+    @staticmethod
+    def cancel_with_release(booking_id, notes=''):
+        """
+        Hủy đơn + hủy vé + trả ghế trong 1 transaction, mỗi bảng 1 câu UPDATE theo tập
+        (không lặp từng vé). Đơn đã hủy trước đó thì không trả ghế lần nữa.
+        
+        Args:
+            booking_id (int): ID booking
+            notes (str): Lý do hủy
+            
+        Returns:
+            list: Số ghế đã trả ([] nếu đơn đã hủy từ trước), None nếu lỗi / không tìm thấy
+        """
+        try:
+            with RevenueRollup.track(booking_id):
+                booking = Database.execute_query(
+                    "SELECT trip_id, status FROM bookings WHERE id = %s FOR UPDATE",
+                    (booking_id,), fetch_one=True
+                )
+                if not booking:
+                    return None
+                if booking['status'] == 'cancelled':
+                    return []
+                
+                Database.execute_update("""
+                    UPDATE bookings
+                    SET status = 'cancelled', notes = %s, updated_at = NOW()
+                    WHERE id = %s
+                """, (notes, booking_id))
+                
+                Database.execute_update("""
+                    UPDATE tickets SET status = 'cancelled'
+                    WHERE booking_id = %s AND status = 'booked'
+                """, (booking_id,))
+                
+                # trip_seats + trips.available_seats + seat_cache
+                seats = TripSeat.release_seats(booking['trip_id'], booking_id=booking_id)
+            
+            print(f"✅ Hủy booking {booking_id}, trả {len(seats)} ghế: {seats}")
+            return seats
+            
+        except Exception as e:
+            print(f"❌ Lỗi cancel booking {booking_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    @staticmethod
+    def cancel_trip(trip_id, notes=''):
+        """
+        Hủy hàng loạt mọi đơn chưa hủy của 1 chuyến (vd xe hỏng) trong 1 transaction:
+        đơn, vé, ghế, số ghế trống - mỗi bảng 1 câu UPDATE - và đánh dấu chuyến 'cancelled'
+        để ghế vừa trả không bị bán lại.
+        
+        Args:
+            trip_id (int): ID chuyến xe
+            notes (str): Lý do hủy
+            
+        Returns:
+            dict: {'bookings': số đơn đã hủy, 'seats': [số ghế đã trả]}, None nếu lỗi
+        """
+        try:
+            with Database.transaction():
+                before = RevenueRollup.snapshot_many(trip_id=trip_id, for_update=True)
+                booking_ids = [row['id'] for row in before]
+                
+                if booking_ids:
+                    Database.execute_update("""
+                        UPDATE bookings
+                        SET status = 'cancelled', notes = %s, updated_at = NOW()
+                        WHERE trip_id = %s AND status != 'cancelled'
+                    """, (notes, trip_id))
+                
+                Database.execute_update("""
+                    UPDATE tickets SET status = 'cancelled'
+                    WHERE trip_id = %s AND status = 'booked'
+                """, (trip_id,))
+                
+                # trip_seats + trips.available_seats + seat_cache
+                seats = TripSeat.release_seats(trip_id)
+                
+                Database.execute_update(
+                    "UPDATE trips SET status = 'cancelled' WHERE id = %s", (trip_id,)
+                )
+                
+                RevenueRollup.apply_many(before, RevenueRollup.snapshot_many(booking_ids))
+                
+                Database.on_commit(lambda: cache.invalidate_tags(f'trip:{trip_id}', 'trips'))
+            
+            print(f"✅ Hủy chuyến {trip_id}: {len(booking_ids)} đơn, trả {len(seats)} ghế")
+            return {'bookings': len(booking_ids), 'seats': seats}
+            
+        except Exception as e:
+            print(f"❌ Lỗi hủy hàng loạt chuyến {trip_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
     @staticmethod
     def confirm_payment(booking_id):
         """Xác nhận thanh toán"""
@@ -224,13 +691,68 @@ class Booking:
                     updated_at = NOW()
                 WHERE id = %s
             """
-            Database.execute_query(query, (booking_id,))
+            with RevenueRollup.track(booking_id):
+                Database.execute_query(query, (booking_id,))
             print(f"✅ Xác nhận thanh toán booking {booking_id} thành công")
             return True
         except Exception as e:
             print(f"❌ Lỗi confirm payment: {e}")
             return False
     
+    @staticmethod
+    def update_status(booking_id, status):
+        """
+        Đổi trạng thái đơn (admin)
+        
+        Args:
+            booking_id (int): ID booking
+            status (str): 'pending' | 'confirmed' | 'cancelled'
+            
+        Returns:
+            bool: True nếu thành công
+        """
+        try:
+            query = """
+                UPDATE bookings
+                SET status = %s,
+                    updated_at = NOW()
+                WHERE id = %s
+            """
+            with RevenueRollup.track(booking_id):
+                Database.execute_query(query, (status, booking_id))
+            print(f"✅ Booking {booking_id} -> {status}")
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi update status booking: {e}")
+            return False
+    
+    @staticmethod
+    def update_payment_status(booking_id, payment_status):
+        """
+        Đổi trạng thái thanh toán (admin)
+        
+        Args:
+            booking_id (int): ID booking
+            payment_status (str): 'pending' | 'paid' | 'refunded'
+            
+        Returns:
+            bool: True nếu thành công
+        """
+        try:
+            query = """
+                UPDATE bookings
+                SET payment_status = %s,
+                    updated_at = NOW()
+                WHERE id = %s
+            """
+            with RevenueRollup.track(booking_id):
+                Database.execute_query(query, (payment_status, booking_id))
+            print(f"✅ Booking {booking_id} thanh toán -> {payment_status}")
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi update payment status booking: {e}")
+            return False
+    
     @staticmethod
     def get_daily_statistics(date_from, date_to):
         """Thống kê theo ngày"""
@@ -6,7 +6,9 @@ Có: giá, giờ, ghế, ảnh, loại xe
 """
 
 from models.database import Database
+from models.cache import cache
 import json
+import os
 from datetime import datetime
 
 
@@ -171,6 +173,55 @@ class Bus:
             print(f"❌ Lỗi get_by_id: {e}")
             return None
     
+    @staticmethod
+    def resolve_image(image_path):
+        """
+        Chuẩn hóa ảnh xe lúc lưu: ảnh local (/static/...) không tồn tại -> None
+        Kiểm tra file 1 lần khi upload/lưu, trang chủ không cần os.path.isfile mỗi request.
+        
+        Args:
+            image_path (str): Đường dẫn ảnh (/static/... hoặc URL)
+            
+        Returns:
+            str: Đường dẫn ảnh hoặc None
+        """
+        if not image_path:
+            return None
+        
+        if image_path.startswith('/static/'):
+            full_path = os.path.join('static', image_path[len('/static/'):])
+            if not os.path.isfile(full_path):
+                print(f"⚠️ Không tìm thấy ảnh {image_path}, bỏ qua")
+                return None
+        
+        return image_path
+    
+    @staticmethod
+    def backfill_images():
+        """
+        Kiểm tra lại bus_image đã lưu trước khi có resolve_image (chạy 1 lần sau khi deploy)
+        Ảnh local không còn file -> NULL để trang chủ/tìm kiếm không trả link hỏng.
+        
+        Returns:
+            int: Số xe đã sửa ảnh
+        """
+        rows = Database.execute_query(
+            "SELECT id, bus_image FROM buses WHERE bus_image LIKE %s",
+            ('/static/%',), fetch_all=True
+        ) or []
+        
+        broken_ids = [row['id'] for row in rows if Bus.resolve_image(row['bus_image']) is None]
+        if not broken_ids:
+            return 0
+        
+        placeholders = ', '.join(['%s'] * len(broken_ids))
+        Database.execute_update(
+            f"UPDATE buses SET bus_image = NULL WHERE id IN ({placeholders})",
+            tuple(broken_ids)
+        )
+        cache.invalidate_tags(*[f'bus:{bus_id}' for bus_id in broken_ids], 'buses')
+        return len(broken_ids)
+    
     @staticmethod
     def create(data):
         """
@@ -219,13 +270,14 @@ class Bus:
                 'last_maintenance_date': last_maintenance_date,
                 'next_maintenance_date': next_maintenance_date,
                 'amenities': amenities_json,
-                'bus_image': data.get('bus_image') or None,
+                'bus_image': Bus.resolve_image(data.get('bus_image')),
                 'policies': data.get('policies') or None,
                 'notes': data.get('notes') or None,
                 'is_active': data.get('is_active', True)
             }
             
             bus_id = Database.insert('buses', insert_data)
+            cache.invalidate_tags('buses')
             print(f"✅ Đã tạo bus ID: {bus_id}")
             return bus_id
             
@@ -279,13 +331,14 @@ class Bus:
                 'last_maintenance_date': last_maintenance_date,
                 'next_maintenance_date': next_maintenance_date,
                 'amenities': amenities_json,
-                'bus_image': data.get('bus_image') or None,
+                'bus_image': Bus.resolve_image(data.get('bus_image')),
                 'policies': data.get('policies') or None,
                 'notes': data.get('notes') or None,
                 'is_active': data.get('is_active', True)
             }
             
             Database.update('buses', update_data, f"id = {bus_id}")
+            cache.invalidate_tags(f'bus:{bus_id}', 'buses')
             print(f"✅ Đã update bus ID: {bus_id}")
             return True
             
@@ -313,6 +366,7 @@ class Bus:
                 'status': 'inactive'
             }
             Database.update('buses', update_data, f"id = {bus_id}")
+            cache.invalidate_tags(f'bus:{bus_id}', 'buses')
             print(f"✅ Đã xóa bus ID: {bus_id}")
             return True
             
@@ -0,0 +1,334 @@
+"""
+Cache - lớp cache dùng chung cho các model
+Interface: get / set / delete / get_or_set / invalidate_tags (TTL + tag)
+
+Backend:
+    - LocalCache: LRU trong bộ nhớ, chỉ trong 1 process
+    - FileCache: lưu file trong 1 thư mục, nhiều worker (gunicorn) trên cùng máy dùng chung
+
+Tag invalidate dùng "phiên bản tag": mỗi entry nhớ phiên bản các tag lúc set,
+invalidate_tags đổi phiên bản -> entry cũ tự hết hiệu lực ở mọi process.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from config import Config
+
+
+class CacheBackend:
+    """Interface chung cho các backend cache"""
+
+    def __init__(self, default_ttl=60):
+        self.default_ttl = default_ttl
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._sets = 0
+        self._invalidations = 0
+
+    # ---------- Backend phải cài đặt ----------
+
+    def _read(self, key):
+        """Trả về (expires_at, tag_versions, value) hoặc None"""
+        raise NotImplementedError
+
+    def _write(self, key, record):
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Xóa 1 key"""
+        raise NotImplementedError
+
+    def tag_version(self, tag):
+        """Phiên bản hiện tại của tag (None nếu chưa từng invalidate)"""
+        raise NotImplementedError
+
+    def bump_tag(self, tag):
+        """Đổi phiên bản tag, trả về phiên bản mới"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        raise NotImplementedError
+
+    # ---------- Dùng chung ----------
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, default=None):
+        """
+        Lấy giá trị theo key
+
+        Returns:
+            Giá trị đã cache, hoặc default nếu không có / hết hạn / tag đã bị invalidate
+        """
+        record = self._read(key)
+        if record is not None:
+            expires_at, tag_versions, value = record
+            if expires_at is None or expires_at > time.time():
+                if all(self.tag_version(tag) == version for tag, version in tag_versions.items()):
+                    self._count('_hits')
+                    return value
+            self.delete(key)
+
+        self._count('_misses')
+        return default
+
+    def set(self, key, value, ttl=None, tags=()):
+        """
+        Lưu giá trị
+
+        Args:
+            key (str): Khóa cache
+            value: Giá trị (phải pickle được với FileCache)
+            ttl (int): Số giây sống (None = default_ttl, 0 = không hết hạn)
+            tags (iterable): Các tag để invalidate theo nhóm, vd ['route:3', 'trips']
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        tag_versions = {tag: self.tag_version(tag) for tag in tags}
+        self._write(key, (expires_at, tag_versions, value))
+        self._count('_sets')
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        """
+        Lấy từ cache, nếu miss thì gọi loader() rồi lưu lại
+        (loader trả về None thì không cache)
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        value = loader()
+        if value is not None:
+            self.set(key, value, ttl=ttl, tags=tags)
+        return value
+
+    def invalidate_tags(self, *tags):
+        """
+        Làm mất hiệu lực mọi entry gắn 1 trong các tag
+
+        Usage:
+            cache.invalidate_tags(f'route:{route_id}', 'routes')
+        """
+        for tag in tags:
+            self.bump_tag(tag)
+        self._count('_invalidations')
+
+    def stats(self):
+        """Thống kê cache của process hiện tại"""
+        with self._stats_lock:
+            total = self._hits + self._misses
+            return {
+                'backend': type(self).__name__,
+                'hits': self._hits,
+                'misses': self._misses,
+                'sets': self._sets,
+                'invalidations': self._invalidations,
+                'hit_rate': round(self._hits / total, 4) if total else 0.0
+            }
+
+
+class LocalCache(CacheBackend):
+    """
+    Cache LRU trong bộ nhớ (mỗi process 1 bản)
+    Tag theo từng đối tượng ('user:<id>', 'trip_seats:<id>', ...) được gộp vào TAG_BUCKETS
+    nhóm băm theo tiền tố -> số phiên bản tag giữ trong bộ nhớ có giới hạn. Bump 1 tag
+    làm mất hiệu lực cả nhóm (thừa, nhưng không bao giờ trả dữ liệu cũ như khi xóa bớt tag).
+    """
+
+    TAG_BUCKETS = 4096
+
+    def __init__(self, max_entries=1024, default_ttl=60):
+        super().__init__(default_ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _tag_key(cls, tag):
+        """'trips' -> 'trips'; 'user:42' -> ('user', nhóm băm của 'user:42')"""
+        prefix, sep, _ = tag.partition(':')
+        if not sep:
+            return tag
+        return (prefix, zlib.crc32(tag.encode('utf-8')) % cls.TAG_BUCKETS)
+
+    def _read(self, key):
+        with self._lock:
+            record = self._entries.get(key)
+            if record is not None:
+                self._entries.move_to_end(key)
+            return record
+
+    def _write(self, key, record):
+        with self._lock:
+            self._entries[key] = record
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tag_version(self, tag):
+        return self._tags.get(self._tag_key(tag))
+
+    def bump_tag(self, tag):
+        key = self._tag_key(tag)
+        with self._lock:
+            version = (self._tags.get(key) or 0) + 1
+            self._tags[key] = version
+            return version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        result = super().stats()
+        result['entries'] = len(self._entries)
+        result['max_entries'] = self.max_entries
+        result['tag_versions'] = len(self._tags)
+        return result
+
+
+class FileCache(CacheBackend):
+    """
+    Cache lưu file (pickle) trong 1 thư mục - các worker trên cùng máy dùng chung
+    Ghi file bằng tempfile + os.replace nên không có process nào đọc phải file ghi dở.
+    File là pickle (load = chạy code) -> thư mục được tạo với mode 0700 và phải thuộc
+    user đang chạy app, không ai khác ghi được; không thỏa thì báo lỗi thay vì dùng.
+    """
+
+    PRUNE_EVERY = 500   # dọn file hết hạn sau mỗi N lần set
+
+    def __init__(self, directory, default_ttl=60):
+        super().__init__(default_ttl)
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+    
+    def _check_directory(self):
+        """Từ chối thư mục của user khác hoặc user khác ghi được (có thể bị cài pickle độc)"""
+        if not hasattr(os, 'getuid'):
+            return      # Windows: không có uid/mode kiểu POSIX
+        
+        info = os.stat(self.directory)
+        if info.st_uid != os.getuid():
+            raise PermissionError(
+                f"Thư mục cache {self.directory} không thuộc user hiện tại - đặt CACHE_DIR khác")
+        if info.st_mode & 0o077:
+            raise PermissionError(
+                f"Thư mục cache {self.directory} cho user khác truy cập - "
+                f"chmod 700 (hoặc xóa đi để tạo lại) rồi chạy lại")
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._digest(key) + '.cache')
+
+    def _tag_path(self, tag):
+        return os.path.join(self.directory, 'tag-' + self._digest(tag) + '.ver')
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write(self, key, record):
+        self._atomic_write(self._path(key), pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        if self._sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def tag_version(self, tag):
+        try:
+            with open(self._tag_path(tag), 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def bump_tag(self, tag):
+        # Phiên bản ngẫu nhiên: 2 process cùng bump cũng không cần khóa
+        version = uuid.uuid4().hex
+        self._atomic_write(self._tag_path(tag), version.encode('ascii'))
+        return version
+
+    def prune(self):
+        """Xóa các file cache đã hết hạn"""
+        now = time.time()
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.cache'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    expires_at = pickle.load(f)[0]
+                if expires_at is not None and expires_at <= now:
+                    os.remove(path)
+                    removed += 1
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+        return removed
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache') or name.endswith('.ver'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        result = super().stats()
+        result['directory'] = self.directory
+        return result
+
+
+def create_cache(options):
+    """
+    Tạo backend theo cấu hình Config.CACHE
+
+    Args:
+        options (dict): {'backend': 'local' | 'file', 'directory', 'default_ttl', 'max_entries'}
+    """
+    if options['backend'] == 'file':
+        return FileCache(options['directory'], default_ttl=options['default_ttl'])
+    return LocalCache(max_entries=options['max_entries'], default_ttl=options['default_ttl'])
+
+
+cache = create_cache(Config.CACHE)
@@ -0,0 +1,314 @@
+"""
+City Index - chỉ mục tên tỉnh/thành trong bộ nhớ
+Chuẩn hóa tiếng Việt không dấu, hỗ trợ tìm theo tiền tố và tên gọi khác (alias),
+trả về danh sách route_id để câu SQL tìm chuyến dùng được index (b.route_id IN (...)).
+Kèm trie tiền tố (không dấu) cho gợi ý tên thành phố, xếp theo độ phổ biến.
+
+Route.create/update cập nhật trực tiếp (incremental) chỉ mục của process hiện tại;
+các worker khác tự dựng lại khi tag 'routes' trong cache đổi hoặc sau REFRESH_SECONDS giây.
+"""
+
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from models.cache import cache
+from models.database import Database
+
+
+# Tiền tố hành chính bỏ qua khi so khớp ("TP. Hồ Chí Minh" == "Hồ Chí Minh")
+ADMIN_PREFIXES = ('thanh pho ', 'tp ', 'tinh ')
+
+# Tên gọi khác -> tên chuẩn (đều ở dạng đã chuẩn hóa)
+CITY_ALIASES = {
+    'sai gon': 'ho chi minh',
+    'saigon': 'ho chi minh',
+    'sg': 'ho chi minh',
+    'hcm': 'ho chi minh',
+    'tphcm': 'ho chi minh',
+    'hn': 'ha noi',
+    'hanoi': 'ha noi',
+    'dn': 'da nang',
+    'danang': 'da nang',
+    'dalat': 'da lat',
+    'vt': 'vung tau',
+    'hp': 'hai phong',
+    'nt': 'nha trang',
+    'ct': 'can tho',
+}
+
+
+def fold_text(text):
+    """Bỏ dấu tiếng Việt, chữ thường, chỉ giữ chữ/số và 1 khoảng trắng"""
+    if not text:
+        return ''
+
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def normalize_city(text):
+    """
+    Chuẩn hóa tên thành phố: bỏ dấu, bỏ tiền tố hành chính, áp dụng alias
+
+    Ví dụ: 'TP. Hồ Chí Minh' -> 'ho chi minh', 'Sài Gòn' -> 'ho chi minh', 'Đà  Lạt' -> 'da lat'
+    """
+    text = fold_text(text)
+
+    for prefix in ADMIN_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+
+    return CITY_ALIASES.get(text, text)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'cities')
+
+    def __init__(self):
+        self.children = {}
+        self.cities = set()     # tên chuẩn hóa của các thành phố có khóa kết thúc tại node
+
+
+class CityIndex:
+    """Chỉ mục điểm đi/điểm đến -> route_id + trie gợi ý (an toàn đa luồng)"""
+
+    REFRESH_SECONDS = 600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._built_at = None
+        self._tag_version = None
+
+    def _reset(self):
+        self._departure = {}        # tên chuẩn hóa -> set(route_id)
+        self._arrival = {}
+        self._departure_keys = []   # các khóa đã sắp xếp để tìm tiền tố (bisect)
+        self._arrival_keys = []
+        self._routes = {}           # route_id -> (điểm đi, điểm đến, số chuyến)
+        self._cities = {}           # tên chuẩn hóa -> {'name', 'routes', 'popularity'}
+        self._trie = _TrieNode()
+
+    @staticmethod
+    def _word_suffixes(name):
+        """'ho chi minh' -> ['ho chi minh', 'chi minh', 'minh'] (gõ 'chi minh' vẫn khớp)"""
+        words = name.split()
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    # ---------- Dựng chỉ mục ----------
+
+    def _add_key(self, names, keys, key, route_id):
+        if key not in names:
+            names[key] = set()
+            bisect.insort(keys, key)
+        names[key].add(route_id)
+
+    def _remove_key(self, names, keys, key, route_id):
+        route_ids = names.get(key)
+        if route_ids is None:
+            return
+        route_ids.discard(route_id)
+        if not route_ids:
+            del names[key]
+            keys.pop(bisect.bisect_left(keys, key))
+
+    def _trie_insert(self, key, city):
+        node = self._trie
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.cities.add(city)
+
+    def _add_city(self, display_name, route_id, trips):
+        city = normalize_city(display_name)
+        if not city:
+            return
+        entry = self._cities.get(city)
+        if entry is None:
+            entry = self._cities[city] = {'name': display_name, 'routes': set(), 'popularity': 0}
+            keys = self._word_suffixes(city) + [fold_text(display_name)]
+            keys += [alias for alias, target in CITY_ALIASES.items() if target == city]
+            for key in keys:
+                self._trie_insert(key, city)
+        entry['routes'].add(route_id)
+        entry['popularity'] += trips
+
+    def _remove_city(self, display_name, route_id, trips):
+        entry = self._cities.get(normalize_city(display_name))
+        if entry is None:
+            return
+        # Giữ node trong trie; thành phố không còn tuyến sẽ bị lọc khi gợi ý
+        entry['routes'].discard(route_id)
+        entry['popularity'] = max(0, entry['popularity'] - trips)
+
+    def _index_route(self, route_id, departure_point, arrival_point, trips=0):
+        self._routes[route_id] = (departure_point, arrival_point, trips)
+        for key in self._word_suffixes(normalize_city(departure_point)):
+            self._add_key(self._departure, self._departure_keys, key, route_id)
+        for key in self._word_suffixes(normalize_city(arrival_point)):
+            self._add_key(self._arrival, self._arrival_keys, key, route_id)
+        self._add_city(departure_point, route_id, trips)
+        self._add_city(arrival_point, route_id, trips)
+
+    def _unindex_route(self, route_id):
+        existing = self._routes.pop(route_id, None)
+        if existing is None:
+            return None
+        departure_point, arrival_point, trips = existing
+        for key in self._word_suffixes(normalize_city(departure_point)):
+            self._remove_key(self._departure, self._departure_keys, key, route_id)
+        for key in self._word_suffixes(normalize_city(arrival_point)):
+            self._remove_key(self._arrival, self._arrival_keys, key, route_id)
+        self._remove_city(departure_point, route_id, trips)
+        self._remove_city(arrival_point, route_id, trips)
+        return existing
+
+    def _build(self, tag_version):
+        """Dựng lại toàn bộ chỉ mục từ bảng routes (chỉ tuyến đang hoạt động)"""
+        # Độ phổ biến = số chuyến sắp chạy của tuyến
+        query = """
+            SELECT r.id, r.departure_point, r.arrival_point, COUNT(t.id) as trip_count
+            FROM routes r
+            LEFT JOIN buses b ON b.route_id = r.id AND b.is_active = TRUE
+            LEFT JOIN trips t ON t.bus_id = b.id AND t.is_active = TRUE
+                             AND t.trip_date >= CURDATE()
+            WHERE r.is_active = TRUE
+            GROUP BY r.id, r.departure_point, r.arrival_point
+        """
+        routes = Database.execute_query(query, fetch_all=True) or []
+
+        with self._lock:
+            self._reset()
+            for route in routes:
+                self._index_route(route['id'], route['departure_point'],
+                                  route['arrival_point'], int(route['trip_count'] or 0))
+            self._built_at = time.monotonic()
+            self._tag_version = tag_version
+
+        print(f"✅ City index: {len(routes)} tuyến, {len(self._cities)} thành phố")
+
+    def _ensure_fresh(self):
+        tag_version = cache.tag_version('routes')
+        if (self._built_at is None or self._tag_version != tag_version
+                or time.monotonic() - self._built_at > self.REFRESH_SECONDS):
+            self._build(tag_version)
+
+    # ---------- Cập nhật incremental (gọi từ Route.create/update, sau invalidate tag) ----------
+
+    def add_route(self, route_id, departure_point, arrival_point):
+        """Thêm 1 tuyến mới vào chỉ mục của process hiện tại"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._index_route(route_id, departure_point, arrival_point)
+            self._tag_version = cache.tag_version('routes')
+
+    def update_route(self, route_id, departure_point=None, arrival_point=None):
+        """Cập nhật điểm đi/đến của 1 tuyến (None = giữ nguyên)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            existing = self._unindex_route(route_id)
+            if existing is None:
+                # Tuyến đang tắt / chưa có trong chỉ mục -> để lần dựng lại xử lý
+                self._built_at = None
+                return
+            self._index_route(route_id,
+                              departure_point or existing[0],
+                              arrival_point or existing[1],
+                              existing[2])
+            self._tag_version = cache.tag_version('routes')
+
+    # ---------- Tra cứu ----------
+
+    @staticmethod
+    def _lookup(names, keys, term):
+        """Khớp chính xác trước, không có thì khớp theo tiền tố"""
+        if term in names:
+            return set(names[term])
+
+        route_ids = set()
+        i = bisect.bisect_left(keys, term)
+        while i < len(keys) and keys[i].startswith(term):
+            route_ids |= names[keys[i]]
+            i += 1
+        return route_ids
+
+    def find_routes(self, departure=None, arrival=None):
+        """
+        Tìm route_id theo điểm đi/điểm đến người dùng nhập
+
+        Args:
+            departure (str): Điểm đi (None/rỗng = không lọc)
+            arrival (str): Điểm đến (None/rỗng = không lọc)
+
+        Returns:
+            list: Danh sách route_id tăng dần (rỗng nếu không khớp)
+        """
+        self._ensure_fresh()
+
+        departure_term = normalize_city(departure)
+        arrival_term = normalize_city(arrival)
+
+        with self._lock:
+            result = None
+            if departure_term:
+                result = self._lookup(self._departure, self._departure_keys, departure_term)
+            if arrival_term:
+                arrival_ids = self._lookup(self._arrival, self._arrival_keys, arrival_term)
+                result = arrival_ids if result is None else result & arrival_ids
+            if result is None:
+                result = set(self._routes)
+
+        return sorted(result)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Gợi ý tên thành phố theo tiền tố (không dấu, khớp cả từ giữa tên và alias)
+
+        Args:
+            prefix (str): Chuỗi người dùng đang gõ, vd 'da', 'sai g', 'chi m'
+            limit (int): Số gợi ý tối đa
+
+        Returns:
+            list: [{'name': 'Đà Nẵng', 'popularity': 12}, ...] xếp theo độ phổ biến giảm dần
+        """
+        self._ensure_fresh()
+
+        term = fold_text(prefix)
+        if not term:
+            return []
+
+        with self._lock:
+            node = self._trie
+            for ch in term:
+                node = node.children.get(ch)
+                if node is None:
+                    return []
+
+            cities = set()
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                cities |= current.cities
+                stack.extend(current.children.values())
+
+            entries = [self._cities[city] for city in cities if self._cities[city]['routes']]
+
+        entries.sort(key=lambda entry: (-entry['popularity'], entry['name']))
+        return [
+            {'name': entry['name'], 'popularity': entry['popularity']}
+            for entry in entries[:limit]
+        ]
+
+    def invalidate(self):
+        """Buộc dựng lại ở lần tra cứu tiếp theo"""
+        with self._lock:
+            self._built_at = None
+
+
+city_index = CityIndex()
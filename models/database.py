@@ -2,33 +2,415 @@
 Database connection and management module
 Quản lý kết nối MySQL và các thao tác database
 ĐÃ SỬA: Thêm backtick cho tên cột để tránh conflict với reserved words
+ĐÃ SỬA: Thêm connection pool an toàn đa luồng (Config.DB_POOL)
 """
 
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import Error
 from config import Config
 
 
+class PoolTimeoutError(Error):
+    """Hết thời gian chờ mượn connection từ pool"""
+
+
+class ConnectionPool:
+    """
+    Pool kết nối MySQL an toàn đa luồng
+    
+    - size: số connection giữ lại khi rảnh
+    - max_overflow: số connection tạo thêm khi cao điểm (đóng lại khi trả về)
+    - timeout: số giây tối đa chờ mượn connection
+    - recycle: số giây tối đa sống của 1 connection (0 = không giới hạn)
+    - pre_ping: kiểm tra connection còn sống trước khi cho mượn
+    """
+    
+    def __init__(self, db_config, size=5, max_overflow=10, timeout=30,
+                 recycle=3600, pre_ping=True):
+        self._db_config = dict(db_config)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        
+        self._cond = threading.Condition()
+        self._idle = deque()        # connection đang rảnh (LIFO)
+        self._created_at = {}       # id(connection) -> thời điểm tạo
+        self._total = 0             # tổng connection đang tồn tại (kể cả đang tạo)
+        self._in_use = 0
+        
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._discarded = 0
+    
+    def _connect(self):
+        """Tạo connection mới"""
+        connection = mysql.connector.connect(**self._db_config)
+        self._created_at[id(connection)] = time.monotonic()
+        return connection
+    
+    def _close(self, connection):
+        """Đóng connection, bỏ qua lỗi"""
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+    
+    def _validate(self, connection):
+        """
+        Kiểm tra connection trước khi cho mượn
+        Recycle nếu quá tuổi, tạo lại nếu đã chết
+        """
+        created_at = self._created_at.get(id(connection), 0)
+        
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            self._close(connection)
+            self._recycled += 1
+            return self._connect()
+        
+        if self.pre_ping and not connection.is_connected():
+            self._close(connection)
+            self._discarded += 1
+            return self._connect()
+        
+        return connection
+    
+    def acquire(self):
+        """
+        Mượn 1 connection từ pool
+        
+        Returns:
+            MySQLConnection: connection đã được kiểm tra
+            
+        Raises:
+            PoolTimeoutError: nếu chờ quá self.timeout giây
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        connection = None
+        waited = False
+        
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection = self._idle.pop()
+                    break
+                if self._total < self.size + self.max_overflow:
+                    self._total += 1
+                    break
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        msg=f"Hết thời gian chờ connection ({self.timeout}s, "
+                            f"đang dùng {self._in_use}/{self.size + self.max_overflow})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            
+            wait_time = time.monotonic() - start
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+        
+        try:
+            if connection is None:
+                return self._connect()
+            return self._validate(connection)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._total -= 1
+                self._cond.notify()
+            raise
+    
+    def release(self, connection, discard=False):
+        """
+        Trả connection về pool
+        Rollback transaction còn dở, đóng connection overflow hoặc đã hỏng
+        discard=True: đóng luôn (vd còn kết quả chưa đọc hết trên cursor không buffer)
+        """
+        healthy = not discard
+        try:
+            if healthy and connection.in_transaction:
+                connection.rollback()
+        except Exception:
+            healthy = False
+        
+        with self._cond:
+            self._in_use -= 1
+            keep = healthy and len(self._idle) < self.size
+            if keep:
+                self._idle.append(connection)
+            else:
+                self._total -= 1
+                if not healthy:
+                    self._discarded += 1
+            self._cond.notify()
+        
+        if not keep:
+            self._close(connection)
+    
+    def close_all(self):
+        """Đóng toàn bộ connection đang rảnh"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+        
+        for connection in idle:
+            self._close(connection)
+    
+    def stats(self):
+        """
+        Thống kê pool (dùng cho monitoring)
+        
+        Returns:
+            dict: in_use, idle, total, thời gian chờ...
+        """
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'total': self._total,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'discarded': self._discarded,
+                'wait_time_avg_ms': round(self._wait_time_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3)
+            }
+
+
 class Database:
     """Database connection manager"""
     
     _connection = None
+    _pool = None
+    _pool_lock = threading.Lock()
+    _local = threading.local()
+    
+    @classmethod
+    def get_pool(cls):
+        """
+        Lấy connection pool (tạo lần đầu khi cần)
+        
+        Returns:
+            ConnectionPool hoặc None nếu tắt pool trong Config.DB_POOL
+        """
+        if not Config.DB_POOL.get('enabled'):
+            return None
+        
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls._pool = ConnectionPool(
+                        Config.DB_CONFIG,
+                        size=Config.DB_POOL['size'],
+                        max_overflow=Config.DB_POOL['max_overflow'],
+                        timeout=Config.DB_POOL['timeout'],
+                        recycle=Config.DB_POOL['recycle'],
+                        pre_ping=Config.DB_POOL['pre_ping']
+                    )
+                    print(f"✅ Khởi tạo connection pool (size={Config.DB_POOL['size']}, "
+                          f"overflow={Config.DB_POOL['max_overflow']})")
+        return cls._pool
     
     @classmethod
     def get_connection(cls):
         """
         Tạo hoặc trả về kết nối database hiện tại
-        Sử dụng singleton pattern để tránh tạo nhiều kết nối
+        
+        - Có pool: mượn 1 connection và ghim vào thread hiện tại
+          cho đến khi gọi release_connection() (cuối mỗi request)
+        - Không có pool: dùng singleton như cũ
         """
         try:
-            if cls._connection is None or not cls._connection.is_connected():
-                cls._connection = mysql.connector.connect(**Config.DB_CONFIG)
-                print("✅ Kết nối database thành công!")
-            return cls._connection
+            pool = cls.get_pool()
+            
+            if pool is None:
+                if cls._connection is None or not cls._connection.is_connected():
+                    cls._connection = mysql.connector.connect(**Config.DB_CONFIG)
+                    print("✅ Kết nối database thành công!")
+                return cls._connection
+            
+            connection = getattr(cls._local, 'connection', None)
+            if connection is None:
+                connection = pool.acquire()
+                cls._local.connection = connection
+            return connection
         except Error as e:
             print(f"❌ Lỗi kết nối database: {e}")
             raise
     
+    @classmethod
+    def release_connection(cls):
+        """Trả connection đang ghim ở thread hiện tại về pool"""
+        connection = getattr(cls._local, 'connection', None)
+        if connection is not None:
+            cls._local.connection = None
+            cls._pool.release(connection)
+    
+    @classmethod
+    @contextmanager
+    def connection(cls):
+        """
+        Mượn connection trong phạm vi with
+        Dùng lại connection đang ghim ở thread hiện tại nếu có
+        
+        Usage:
+            with Database.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+        """
+        pool = cls.get_pool()
+        
+        if pool is None or getattr(cls._local, 'connection', None) is not None:
+            yield cls.get_connection()
+            return
+        
+        connection = pool.acquire()
+        try:
+            yield connection
+        finally:
+            pool.release(connection)
+    
+    @classmethod
+    def in_transaction(cls):
+        """Thread hiện tại có đang ở trong Database.transaction() không"""
+        return getattr(cls._local, 'transaction_depth', 0) > 0
+    
+    @classmethod
+    @contextmanager
+    def transaction(cls):
+        """
+        Unit of work: ghim 1 connection, tắt autocommit, commit 1 lần khi kết thúc
+        Có exception -> rollback toàn bộ. Gọi lồng nhau sẽ dùng chung transaction ngoài cùng.
+        Callback before_commit chạy ngay trước COMMIT, on_commit chạy sau khi commit xong.
+        
+        Usage:
+            with Database.transaction():
+                Database.insert(...)
+                Database.update(...)
+        """
+        if cls.in_transaction():
+            cls._local.transaction_depth += 1
+            try:
+                yield cls._local.transaction_connection
+            finally:
+                cls._local.transaction_depth -= 1
+            return
+        
+        pinned_before = getattr(cls._local, 'connection', None)
+        connection = cls.get_connection()
+        callbacks = []
+        before_commit = []
+        
+        try:
+            connection.start_transaction()
+            cls._local.transaction_connection = connection
+            cls._local.transaction_depth = 1
+            cls._local.on_commit_callbacks = callbacks
+            cls._local.before_commit_callbacks = before_commit
+            cls._local.transaction_state = {}
+            try:
+                yield connection
+                # Vẫn trong transaction: lỗi ở đây cũng rollback toàn bộ
+                for callback in before_commit:
+                    callback()
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cls._local.transaction_depth = 0
+                cls._local.transaction_connection = None
+                cls._local.on_commit_callbacks = None
+                cls._local.before_commit_callbacks = None
+                cls._local.transaction_state = None
+        finally:
+            if cls._pool is not None and pinned_before is None:
+                cls.release_connection()
+        
+        # Chỉ chạy khi đã commit thành công (rollback thì bỏ qua)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Lỗi on_commit callback: {e}")
+    
+    @classmethod
+    def before_commit(cls, callback):
+        """
+        Đăng ký callback chạy ở cuối transaction hiện tại, ngay trước COMMIT
+        (vd: ghi bảng tổng hợp sau cùng để khóa dòng nóng trong thời gian ngắn nhất).
+        Không có transaction thì chạy ngay.
+        
+        Args:
+            callback (callable): Hàm không tham số
+        """
+        if cls.in_transaction():
+            cls._local.before_commit_callbacks.append(callback)
+        else:
+            callback()
+    
+    @classmethod
+    def transaction_state(cls):
+        """
+        Dict sống cùng transaction hiện tại (mất khi commit/rollback), để gom dữ liệu
+        giữa các câu lệnh trong cùng unit of work. Không có transaction -> None.
+        """
+        if cls.in_transaction():
+            return cls._local.transaction_state
+        return None
+    
+    @classmethod
+    def on_commit(cls, callback):
+        """
+        Đăng ký callback chạy sau khi transaction hiện tại commit
+        (vd: cập nhật cache). Không có transaction thì chạy ngay.
+        
+        Args:
+            callback (callable): Hàm không tham số
+        """
+        if cls.in_transaction():
+            cls._local.on_commit_callbacks.append(callback)
+        else:
+            callback()
+    
+    @classmethod
+    def pool_stats(cls):
+        """
+        Thống kê connection pool
+        
+        Returns:
+            dict: Thống kê pool hoặc {'enabled': False}
+        """
+        pool = cls.get_pool()
+        if pool is None:
+            return {'enabled': False}
+        
+        stats = pool.stats()
+        stats['enabled'] = True
+        return stats
+    
     @classmethod
     def close_connection(cls):
         """Đóng kết nối database"""
@@ -36,6 +418,11 @@ class Database:
             cls._connection.close()
             cls._connection = None
             print("🔌 Đã đóng kết nối database")
+        
+        if cls._pool is not None:
+            cls.release_connection()
+            cls._pool.close_all()
+            print("🔌 Đã đóng connection pool")
     
     @classmethod
     def execute_query(cls, query, params=None, fetch_one=False, fetch_all=False):
@@ -52,21 +439,94 @@ class Database:
             dict hoặc list: Kết quả truy vấn
         """
         try:
-            connection = cls.get_connection()
-            cursor = connection.cursor(dictionary=True)
+            with cls.connection() as connection:
+                cursor = connection.cursor(dictionary=True, buffered=True)
+                try:
+                    cursor.execute(query, params or ())
+                    
+                    if fetch_one:
+                        result = cursor.fetchone()
+                    elif fetch_all:
+                        result = cursor.fetchall()
+                    else:
+                        if not cls.in_transaction():
+                            connection.commit()
+                        result = cursor.lastrowid
+                finally:
+                    cursor.close()
             
-            cursor.execute(query, params or ())
+            return result
             
-            if fetch_one:
-                result = cursor.fetchone()
-            elif fetch_all:
-                result = cursor.fetchall()
+        except Error as e:
+            print(f"❌ Lỗi thực thi query: {e}")
+            print(f"Query: {query}")
+            print(f"Params: {params}")
+            raise
+    
+    @classmethod
+    def stream(cls, query, params=None, chunk_size=1000):
+        """
+        Đọc kết quả lớn theo từng lô bằng cursor không buffer (dữ liệu nằm ở server,
+        client chỉ giữ chunk_size dòng) trên 1 connection riêng, không dùng connection
+        đang ghim ở thread - dùng cho xuất file.
+        
+        Args:
+            query (str): Câu SELECT
+            params (tuple): Tham số
+            chunk_size (int): Số dòng mỗi lô
+            
+        Yields:
+            list: Lô dòng (dict)
+            
+        Usage:
+            for rows in Database.stream("SELECT ...", params):
+                ...
+        """
+        pool = cls.get_pool()
+        connection = pool.acquire() if pool is not None else mysql.connector.connect(**Config.DB_CONFIG)
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        finished = False
+        try:
+            cursor.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+            finished = True
+        finally:
+            # Dừng giữa chừng (client ngắt kết nối): còn dòng chưa đọc -> bỏ connection
+            if finished:
+                cursor.close()
+            if pool is not None:
+                pool.release(connection, discard=not finished)
             else:
-                connection.commit()
-                result = cursor.lastrowid
+                connection.close()
+    
+    @classmethod
+    def execute_update(cls, query, params=None):
+        """
+        Thực thi UPDATE/DELETE
+        
+        Args:
+            query (str): Câu lệnh SQL
+            params (tuple): Tham số cho câu lệnh
             
-            cursor.close()
-            return result
+        Returns:
+            int: Số dòng bị ảnh hưởng
+        """
+        try:
+            with cls.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(query, params or ())
+                    affected = cursor.rowcount
+                    if not cls.in_transaction():
+                        connection.commit()
+                finally:
+                    cursor.close()
+            
+            return affected
             
         except Error as e:
             print(f"❌ Lỗi thực thi query: {e}")
@@ -93,6 +553,84 @@ class Database:
         
         return cls.execute_query(query, tuple(data.values()))
     
+    @classmethod
+    def _insert_chunks(cls, table, rows, chunk_size, ignore=False):
+        """
+        Insert nhiều dòng, mỗi chunk là 1 câu INSERT nhiều VALUES, chung 1 transaction
+        
+        Returns:
+            list: [(lastrowid, rowcount), ...] cho từng chunk
+        """
+        columns = list(rows[0].keys())
+        column_sql = ', '.join([f'`{col}`' for col in columns])
+        row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        verb = 'INSERT IGNORE' if ignore else 'INSERT'
+        results = []
+        
+        try:
+            with cls.transaction() as connection:
+                cursor = connection.cursor()
+                try:
+                    for start in range(0, len(rows), chunk_size):
+                        chunk = rows[start:start + chunk_size]
+                        query = (f"{verb} INTO `{table}` ({column_sql}) VALUES "
+                                 + ', '.join([row_placeholder] * len(chunk)))
+                        params = [row[col] for row in chunk for col in columns]
+                        
+                        cursor.execute(query, params)
+                        results.append((cursor.lastrowid, cursor.rowcount))
+                finally:
+                    cursor.close()
+            
+            return results
+            
+        except Error as e:
+            print(f"❌ Lỗi insert nhiều dòng vào {table}: {e}")
+            raise
+    
+    @classmethod
+    def insert_many(cls, table, rows, chunk_size=500):
+        """
+        Insert nhiều dòng bằng câu INSERT nhiều VALUES (mỗi chunk 1 round-trip)
+        Tất cả chunk chạy chung 1 transaction
+        
+        Args:
+            table (str): Tên bảng
+            rows (list): Danh sách dict {column: value}, cùng tập cột
+            chunk_size (int): Số dòng tối đa mỗi câu INSERT
+            
+        Returns:
+            list: ID của các record vừa insert (theo thứ tự rows)
+        """
+        if not rows:
+            return []
+        
+        # InnoDB cấp ID liên tiếp cho 1 câu INSERT nhiều VALUES,
+        # lastrowid = ID của dòng đầu tiên trong chunk
+        ids = []
+        for first_id, count in cls._insert_chunks(table, rows, chunk_size):
+            ids.extend(range(first_id, first_id + count))
+        return ids
+    
+    @classmethod
+    def insert_ignore_many(cls, table, rows, chunk_size=500):
+        """
+        Giống insert_many nhưng dùng INSERT IGNORE:
+        dòng trùng UNIQUE KEY bị bỏ qua thay vì báo lỗi
+        
+        Args:
+            table (str): Tên bảng
+            rows (list): Danh sách dict {column: value}, cùng tập cột
+            chunk_size (int): Số dòng tối đa mỗi câu INSERT
+            
+        Returns:
+            int: Số dòng thực sự được insert
+        """
+        if not rows:
+            return 0
+        
+        return sum(count for _, count in cls._insert_chunks(table, rows, chunk_size, ignore=True))
+    
     @classmethod
     def update(cls, table, data, condition):
         """
@@ -110,7 +648,7 @@ class Database:
         set_clause = ', '.join([f"`{k}` = %s" for k in data.keys()])
         query = f"UPDATE `{table}` SET {set_clause} WHERE {condition}"
         
-        return cls.execute_query(query, tuple(data.values()))
+        return cls.execute_update(query, tuple(data.values()))
     
     @classmethod
     def delete(cls, table, condition):
@@ -120,9 +658,12 @@ class Database:
         Args:
             table (str): Tên bảng
             condition (str): Điều kiện WHERE
+            
+        Returns:
+            int: Số dòng bị xóa
         """
         query = f"DELETE FROM `{table}` WHERE {condition}"
-        return cls.execute_query(query)
+        return cls.execute_update(query)
     
     @classmethod
     def select(cls, table, columns='*', condition=None, order_by=None, limit=None):
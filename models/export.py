@@ -0,0 +1,105 @@
+"""
+Export - ghi dữ liệu ra CSV / XLSX theo từng lô (bộ nhớ không tăng theo số dòng)
+Nguồn dữ liệu là iterator các lô dòng, vd Database.stream(...) / Booking.iter_export(...)
+
+    columns = [('booking_code', 'Mã vé'), ('total_price', 'Thành tiền'), ...]
+    Response(stream_with_context(iter_csv(columns, chunks)), mimetype='text/csv')
+"""
+
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import xlsxwriter
+
+
+def _cell(value):
+    """Đổi giá trị từ MySQL sang dạng ghi được vào file"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, timedelta):
+        # cột TIME của MySQL
+        minutes = int(value.total_seconds()) // 60
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def iter_csv(columns, chunks):
+    """
+    Sinh file CSV (UTF-8 có BOM để Excel đọc đúng tiếng Việt), mỗi lô 1 đoạn text
+
+    Args:
+        columns (list): [(key, tiêu đề), ...]
+        chunks (iterable): Các lô dòng (list dict)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write('\ufeff')
+    writer.writerow([header for _, header in columns])
+
+    for rows in chunks:
+        for row in rows:
+            writer.writerow([_cell(row.get(key)) for key, _ in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_xlsx(columns, chunks, sheet_name='Sheet1'):
+    """
+    Ghi file XLSX tạm bằng chế độ constant_memory của xlsxwriter
+    (mỗi dòng được ghi xuống đĩa ngay, không giữ cả bảng trong RAM)
+
+    Returns:
+        str: Đường dẫn file tạm - đọc bằng iter_file(path, delete=True)
+    """
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name)
+        bold = workbook.add_format({'bold': True})
+
+        for col, (_, header) in enumerate(columns):
+            worksheet.write(0, col, header, bold)
+
+        row_index = 1
+        for rows in chunks:
+            for row in rows:
+                worksheet.write_row(row_index, 0, [_cell(row.get(key)) for key, _ in columns])
+                row_index += 1
+
+        workbook.close()
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path
+
+
+def iter_file(path, delete=False, block_size=64 * 1024):
+    """Đọc file theo từng khối để trả về response, xóa file khi xong nếu delete=True"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+    finally:
+        if delete:
+            os.remove(path)
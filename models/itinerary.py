@@ -0,0 +1,334 @@
+"""
+Itinerary Planner - tìm hành trình nối chuyến (1-2 lần chuyển xe)
+Đồ thị trong bộ nhớ: node = thành phố (tên chuẩn hóa), cạnh = chuyến xe cụ thể (trip)
+với giờ đi/giờ đến tuyệt đối, dựng sẵn cho các chuyến trong ITINERARY['horizon_days'] ngày tới.
+Mỗi node giữ danh sách chuyến xuất phát đã sắp xếp theo giờ đi -> tìm chuyến nối bằng bisect.
+
+Tự dựng lại khi tag 'routes' / 'buses' / 'trips' trong cache đổi hoặc sau refresh_seconds giây.
+"""
+
+import bisect
+import heapq
+import itertools
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from config import Config
+from models.cache import cache
+from models.city_index import normalize_city
+from models.database import Database
+from models.seat_cache import seat_cache
+
+
+GRAPH_TAGS = ('routes', 'buses', 'trips')
+
+
+def _parse_duration(text):
+    """'8h30m' / '8h' / '45m' / '8 giờ 30 phút' -> timedelta (None nếu không đọc được)"""
+    if not text:
+        return None
+    hours = re.search(r'(\d+)\s*(h|giờ)', text, re.IGNORECASE)
+    minutes = re.search(r'(\d+)\s*(m|phút)', text, re.IGNORECASE)
+    if not hours and not minutes:
+        return None
+    return timedelta(hours=int(hours.group(1)) if hours else 0,
+                     minutes=int(minutes.group(1)) if minutes else 0)
+
+
+def _travel_time(row):
+    """Thời gian chạy của xe: arrival_time - departure_time, không có thì duration, rồi distance"""
+    if row['arrival_time'] is not None and row['bus_departure_time'] is not None:
+        travel = row['arrival_time'] - row['bus_departure_time']
+        if travel <= timedelta(0):
+            travel += timedelta(days=1)     # xe chạy qua đêm
+        return travel
+
+    travel = _parse_duration(row.get('duration'))
+    if travel:
+        return travel
+
+    if row.get('distance'):
+        return timedelta(hours=row['distance'] / 60)
+
+    return None
+
+
+class ItineraryPlanner:
+    """Đồ thị chuyến xe + tìm hành trình nối chuyến (an toàn đa luồng)"""
+
+    MAX_EXPANSIONS = 20000      # số hành trình dở tối đa được mở rộng mỗi lần tìm
+
+    def __init__(self, horizon_days=30, refresh_seconds=600):
+        self.horizon_days = horizon_days
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()     # chỉ 1 thread dựng lại đồ thị mỗi lúc
+        self._departures = {}   # thành phố -> list chặng, sắp theo giờ đi
+        self._times = {}        # thành phố -> list giờ đi (song song _departures, để bisect)
+        self._names = {}        # thành phố chuẩn hóa -> tên hiển thị
+        self._edges = 0
+        self._built_at = None
+        self._built_on = None
+        self._tag_versions = None
+
+    def _build(self, tag_versions):
+        """Dựng lại đồ thị từ các chuyến sắp chạy (1 query)"""
+        query = """
+            SELECT
+                t.id as trip_id,
+                t.trip_date,
+                t.available_seats,
+                COALESCE(t.custom_departure_time, b.departure_time) as departure_time,
+                b.departure_time as bus_departure_time,
+                b.arrival_time,
+                b.duration,
+                b.id as bus_id,
+                b.bus_company,
+                b.bus_type,
+                COALESCE(t.custom_price, b.price)
+                    * (1 - COALESCE(t.custom_discount, b.discount_percent) / 100) as final_price,
+                r.id as route_id,
+                r.departure_point,
+                r.arrival_point,
+                r.distance
+            FROM trips t
+            INNER JOIN buses b ON t.bus_id = b.id
+            INNER JOIN routes r ON b.route_id = r.id
+            WHERE t.is_active = TRUE
+              AND b.is_active = TRUE
+              AND r.is_active = TRUE
+              AND t.status = 'scheduled'
+              AND t.trip_date >= CURDATE()
+              AND t.trip_date < CURDATE() + INTERVAL %s DAY
+        """
+        rows = Database.execute_query(query, (self.horizon_days,), fetch_all=True) or []
+
+        departures = {}
+        names = {}
+        edges = 0
+        for row in rows:
+            travel = _travel_time(row)
+            if travel is None or row['departure_time'] is None:
+                continue
+
+            origin = normalize_city(row['departure_point'])
+            destination = normalize_city(row['arrival_point'])
+            names.setdefault(origin, row['departure_point'])
+            names.setdefault(destination, row['arrival_point'])
+
+            depart_at = datetime.combine(row['trip_date'], datetime.min.time()) + row['departure_time']
+            departures.setdefault(origin, []).append({
+                'trip_id': row['trip_id'],
+                'bus_id': row['bus_id'],
+                'route_id': row['route_id'],
+                'bus_company': row['bus_company'],
+                'bus_type': row['bus_type'],
+                'from': origin,
+                'to': destination,
+                'depart_at': depart_at,
+                'arrive_at': depart_at + travel,
+                'price': float(row['final_price'] or 0),
+                'available_seats': row['available_seats']
+            })
+            edges += 1
+
+        for legs in departures.values():
+            legs.sort(key=lambda leg: leg['depart_at'])
+
+        with self._lock:
+            self._departures = departures
+            self._times = {city: [leg['depart_at'] for leg in legs] for city, legs in departures.items()}
+            self._names = names
+            self._edges = edges
+            self._built_at = time.monotonic()
+            self._built_on = datetime.now().date()
+            self._tag_versions = tag_versions
+
+        print(f"✅ Itinerary graph: {len(names)} thành phố, {edges} chuyến")
+
+    def _is_fresh(self, tag_versions):
+        return (self._built_at is not None and self._tag_versions == tag_versions
+                and self._built_on == datetime.now().date()
+                and time.monotonic() - self._built_at <= self.refresh_seconds)
+
+    def _ensure_fresh(self):
+        """
+        Dựng lại đồ thị khi cũ - single-flight: chỉ thread giữ _build_lock chạy query,
+        các request khác dùng tiếp đồ thị cũ (chỉ phải chờ khi chưa có đồ thị nào)
+        """
+        if self._is_fresh(tuple(cache.tag_version(tag) for tag in GRAPH_TAGS)):
+            return
+
+        if not self._build_lock.acquire(blocking=self._built_at is None):
+            return
+        try:
+            # Kiểm tra lại: thread khác có thể vừa dựng xong trong lúc chờ lock
+            tag_versions = tuple(cache.tag_version(tag) for tag in GRAPH_TAGS)
+            if not self._is_fresh(tag_versions):
+                self._build(tag_versions)
+        finally:
+            self._build_lock.release()
+
+    @staticmethod
+    def _legs_between(departures, times, city, start, end):
+        """Các chặng xuất phát từ city với giờ đi trong [start, end)"""
+        legs = departures.get(city)
+        if not legs:
+            return []
+        city_times = times[city]
+        return legs[bisect.bisect_left(city_times, start):bisect.bisect_left(city_times, end)]
+
+    def search(self, departure, arrival, travel_date, max_transfers=2,
+               min_connection=30, max_layover=12, sort='duration', limit=10):
+        """
+        Tìm hành trình nối chuyến từ departure đến arrival, khởi hành trong ngày travel_date
+
+        Args:
+            departure (str): Điểm đi (chấp nhận không dấu/alias)
+            arrival (str): Điểm đến
+            travel_date (date): Ngày khởi hành chặng đầu
+            max_transfers (int): Số lần chuyển xe tối đa (1 hoặc 2)
+            min_connection (int): Thời gian nối chuyến tối thiểu (phút)
+            max_layover (int): Thời gian chờ tối đa giữa 2 chặng (giờ)
+            sort (str): 'duration' (tổng thời gian) hoặc 'price' (tổng giá)
+            limit (int): Số hành trình tối đa
+
+        Returns:
+            list: Hành trình [{'legs': [...], 'transfers', 'depart_at', 'arrive_at',
+                  'duration_minutes', 'total_price'}, ...] (chỉ hành trình có >= 1 lần chuyển)
+        """
+        self._ensure_fresh()
+
+        origin = normalize_city(departure)
+        destination = normalize_city(arrival)
+        if not origin or not destination or origin == destination:
+            return []
+
+        day_start = datetime.combine(travel_date, datetime.min.time())
+        min_gap = timedelta(minutes=min_connection)
+        max_gap = timedelta(hours=max_layover)
+        max_legs = max_transfers + 1
+
+        # _build thay cả bộ dict mới (không sửa tại chỗ) -> chỉ cần lấy tham chiếu dưới lock,
+        # duyệt đồ thị ngoài lock để các request tìm hành trình chạy song song
+        with self._lock:
+            departures, times, names = self._departures, self._times, self._names
+        
+        if sort == 'price':
+            rank = lambda it: (it['total_price'], it['duration_minutes'])
+        else:
+            rank = lambda it: (it['duration_minutes'], it['total_price'])
+
+        # Best-first: khóa của hành trình dở (thời gian/giá tới chặng hiện tại) là cận dưới
+        # của mọi hành trình nối tiếp nó -> hành trình hoàn chỉnh ra khỏi heap theo đúng thứ hạng.
+        # Kiểm tra ghế thực tế (seat_cache) theo từng lô, dừng khi đủ limit hoặc hết ứng viên.
+        heap = []
+        counter = itertools.count()     # phá hòa, không so sánh list chặng
+
+        def push(path):
+            heapq.heappush(heap, (rank(self._summarize(path)), next(counter), path))
+
+        for leg in self._legs_between(departures, times, origin, day_start, day_start + timedelta(days=1)):
+            if leg['to'] != destination and leg['available_seats'] > 0:
+                push([leg])
+
+        itineraries = []
+        complete = []
+        expansions = 0
+        while heap and len(itineraries) < limit and expansions < self.MAX_EXPANSIONS:
+            _, _, path = heapq.heappop(heap)
+            last = path[-1]
+
+            if last['to'] == destination:
+                complete.append(path)
+                if len(complete) >= limit - len(itineraries):
+                    itineraries.extend(self._with_live_seats(complete))
+                    complete = []
+                continue
+
+            expansions += 1
+            visited = {origin} | {leg['to'] for leg in path}
+            for leg in self._legs_between(departures, times, last['to'],
+                                          last['arrive_at'] + min_gap, last['arrive_at'] + max_gap):
+                if leg['available_seats'] <= 0:
+                    continue
+                if leg['to'] == destination:
+                    push(path + [leg])
+                elif len(path) + 1 < max_legs and leg['to'] not in visited:
+                    push(path + [leg])
+
+        if complete:
+            itineraries.extend(self._with_live_seats(complete))
+
+        return [self._serialize(itinerary, names) for itinerary in itineraries[:limit]]
+
+    @staticmethod
+    def _summarize(legs):
+        return {
+            'legs': legs,
+            'transfers': len(legs) - 1,
+            'depart_at': legs[0]['depart_at'],
+            'arrive_at': legs[-1]['arrive_at'],
+            'duration_minutes': int((legs[-1]['arrive_at'] - legs[0]['depart_at']).total_seconds() // 60),
+            'total_price': sum(leg['price'] for leg in legs)
+        }
+
+    @staticmethod
+    def _with_live_seats(paths):
+        """Cập nhật số ghế còn từ seat_cache, bỏ hành trình có chặng đã hết ghế"""
+        seat_maps = seat_cache.get_seat_maps(leg['trip_id'] for path in paths for leg in path)
+
+        itineraries = []
+        for path in paths:
+            legs = []
+            for leg in path:
+                leg = dict(leg)
+                seat_map = seat_maps[leg['trip_id']]
+                if seat_map['available'] or seat_map['locked'] or seat_map['booked']:
+                    leg['available_seats'] = len(seat_map['available']) + len(seat_map['locked'])
+                legs.append(leg)
+
+            if any(leg['available_seats'] <= 0 for leg in legs):
+                continue
+
+            itineraries.append(ItineraryPlanner._summarize(legs))
+        return itineraries
+
+    @staticmethod
+    def _serialize(itinerary, names):
+        """Đổi datetime sang chuỗi ISO và tên thành phố sang tên hiển thị (cho JSON)"""
+        legs = []
+        for leg in itinerary['legs']:
+            legs.append({
+                'trip_id': leg['trip_id'],
+                'bus_id': leg['bus_id'],
+                'route_id': leg['route_id'],
+                'bus_company': leg['bus_company'],
+                'bus_type': leg['bus_type'],
+                'from': names.get(leg['from'], leg['from']),
+                'to': names.get(leg['to'], leg['to']),
+                'depart_at': leg['depart_at'].isoformat(),
+                'arrive_at': leg['arrive_at'].isoformat(),
+                'price': leg['price'],
+                'available_seats': leg['available_seats']
+            })
+        return {
+            'legs': legs,
+            'transfers': itinerary['transfers'],
+            'depart_at': itinerary['depart_at'].isoformat(),
+            'arrive_at': itinerary['arrive_at'].isoformat(),
+            'duration_minutes': itinerary['duration_minutes'],
+            'total_price': itinerary['total_price']
+        }
+
+    def stats(self):
+        """Thống kê đồ thị (dùng cho monitoring)"""
+        with self._lock:
+            return {'cities': len(self._names), 'edges': self._edges}
+
+
+itinerary_planner = ItineraryPlanner(
+    horizon_days=Config.ITINERARY['horizon_days'],
+    refresh_seconds=Config.ITINERARY['refresh_seconds']
+)
@@ -0,0 +1,66 @@
+"""
+Lock Reaper - dọn ghế bị lock quá hạn chạy nền
+Thay cho việc gọi TripSeat.release_expired_locks() trên mỗi lần xem trang chọn ghế
+"""
+
+import threading
+from models.trip_seat import TripSeat
+
+
+class LockReaper:
+    """Thread nền định kỳ giải phóng ghế lock quá hạn theo lô"""
+    
+    def __init__(self, interval=30, batch_size=500, max_batches=20):
+        """
+        Args:
+            interval (int): Số giây giữa 2 lần quét
+            batch_size (int): Số ghế tối đa mỗi lô UPDATE
+            max_batches (int): Số lô tối đa mỗi lần quét
+        """
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    @classmethod
+    def from_config(cls, reaper_config):
+        """Tạo reaper từ Config.LOCK_REAPER"""
+        return cls(
+            interval=reaper_config['interval'],
+            batch_size=reaper_config['batch_size'],
+            max_batches=reaper_config['max_batches']
+        )
+    
+    def sweep(self):
+        """Quét 1 lần, trả về số ghế đã giải phóng"""
+        return TripSeat.release_expired_locks(
+            batch_size=self.batch_size,
+            max_batches=self.max_batches
+        )
+    
+    def run_forever(self):
+        """Vòng lặp quét cho đến khi stop() (dùng cho thread hoặc CLI worker)"""
+        while not self._stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Lỗi LockReaper: {e}")
+            self._stop_event.wait(self.interval)
+    
+    def start(self):
+        """Chạy reaper trong daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='lock-reaper', daemon=True)
+        self._thread.start()
+        print(f"🧹 LockReaper chạy nền (mỗi {self.interval}s)")
+    
+    def stop(self):
+        """Dừng reaper"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
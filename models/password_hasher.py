@@ -0,0 +1,271 @@
+"""
+Password Hasher - hash/kiểm tra mật khẩu bcrypt trong process pool riêng
+bcrypt cost 12 tốn ~250ms CPU mỗi lần -> không chạy trên thread xử lý request.
+
+- Số việc đang chờ/chạy bị giới hạn (max_pending): vượt quá thì báo bận ngay
+  (PasswordHasherBusy) thay vì xếp hàng làm nghẽn mọi worker lúc mở bán vé
+- needs_rehash(): hash cũ có cost khác BCRYPT_LOG_ROUNDS -> hash lại khi user đăng nhập
+- stats(): histogram độ trễ (gồm cả thời gian chờ trong hàng) cho từng thao tác
+
+Pool dùng start method 'fork' (không import lại app.py trong process con);
+nền tảng không có fork hoặc workers = 0 thì hash ngay trên thread gọi.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt as _bcrypt
+
+from config import Config
+
+
+# Cận trên các bucket histogram (ms), bucket cuối là +Inf
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+OPERATIONS = ('hash', 'verify')
+
+
+class PasswordHasherBusy(Exception):
+    """Pool hash đang quá tải (đủ max_pending việc) hoặc chờ quá timeout"""
+
+
+# ---------- Chạy trong process con (phải là hàm cấp module để pickle được) ----------
+
+def _hash_password(password, rounds):
+    return _bcrypt.hashpw(password.encode('utf-8'), _bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(password_hash, password):
+    try:
+        return _bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # password_hash không phải chuỗi bcrypt hợp lệ
+        return False
+
+
+def hash_cost(password_hash):
+    """'$2b$12$...' -> 12 (None nếu không đọc được)"""
+    parts = (password_hash or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class _Histogram:
+    """Histogram độ trễ theo bucket cố định (ms)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms):
+        index = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += 1
+        self.sum_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, q):
+        """Ước lượng phân vị bằng cận trên của bucket chứa nó"""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def snapshot(self):
+        labels = [f'le_{bound}' for bound in LATENCY_BUCKETS] + ['le_inf']
+        return {
+            'count': self.total,
+            'avg_ms': round(self.sum_ms / self.total, 1) if self.total else None,
+            'max_ms': round(self.max_ms, 1),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+
+class PasswordHasher:
+    """Hash/kiểm tra mật khẩu bcrypt qua process pool có giới hạn (an toàn đa luồng)"""
+
+    def __init__(self, rounds=12, workers=2, max_pending=16, timeout=5):
+        """
+        Args:
+            rounds (int): bcrypt cost cho hash mới
+            workers (int): Số process hash (0 = hash ngay trên thread gọi)
+            max_pending (int): Số việc tối đa đang chờ + đang chạy, vượt quá -> PasswordHasherBusy
+            timeout (float): Số giây tối đa chờ 1 kết quả
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._pending = 0
+        self._histograms = {op: _Histogram() for op in OPERATIONS}
+        self._rejected = {op: 0 for op in OPERATIONS}
+        self._timeouts = {op: 0 for op in OPERATIONS}
+
+    @classmethod
+    def from_config(cls, hasher_config, rounds):
+        """Tạo hasher từ Config.PASSWORD_HASHER"""
+        workers = hasher_config['workers']
+        if workers and 'fork' not in multiprocessing.get_all_start_methods():
+            print("⚠️ PasswordHasher: nền tảng không hỗ trợ fork, hash trên thread gọi")
+            workers = 0
+        return cls(
+            rounds=rounds,
+            workers=workers,
+            max_pending=hasher_config['max_pending'],
+            timeout=hasher_config['timeout']
+        )
+
+    # ---------- Pool ----------
+
+    def _get_executor(self):
+        """Tạo pool lần đầu dùng (hoặc sau fork sang process khác, vd worker gunicorn)"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('fork')
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """
+        Tạo sẵn pool (gọi lúc khởi động app, trước khi có các thread nền)
+        ProcessPoolExecutor chỉ fork process con ở lần submit đầu tiên (với 'fork' thì fork
+        đủ workers ngay lúc đó) -> chạy 1 việc rỗng và chờ để fork xảy ra ở đây,
+        không phải trong request đăng nhập đầu tiên khi LockReaper/thread request đã chạy.
+        """
+        if self.workers:
+            self._get_executor().submit(int).result(timeout=self.timeout)
+            print(f"🔐 PasswordHasher: {self.workers} process, tối đa {self.max_pending} việc chờ")
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- Thực thi ----------
+
+    def _release_slot(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _run(self, operation, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected[operation] += 1
+            raise PasswordHasherBusy(f"Pool hash đang đủ {self.max_pending} việc")
+
+        with self._lock:
+            self._pending += 1
+
+        started = time.perf_counter()
+        if not self.workers:
+            try:
+                result = func(*args)
+            finally:
+                self._release_slot()
+        else:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(func, *args)
+            except Exception:
+                self._release_slot()
+                raise
+            # Slot chỉ trả lại khi việc thực sự xong (kể cả khi bên gọi đã bỏ chờ)
+            future.add_done_callback(self._release_slot)
+
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                with self._lock:
+                    self._timeouts[operation] += 1
+                raise PasswordHasherBusy(f"Hash quá {self.timeout}s")
+            except BrokenProcessPool:
+                # 1 process con chết -> tạo pool mới ở lần gọi sau
+                self._reset_executor(executor)
+                raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._histograms[operation].observe(elapsed_ms)
+        return result
+
+    def hash(self, password):
+        """
+        Hash mật khẩu với cost hiện tại
+
+        Returns:
+            str: Chuỗi bcrypt ('$2b$12$...')
+
+        Raises:
+            PasswordHasherBusy: Pool quá tải
+        """
+        return self._run('hash', _hash_password, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        """
+        Kiểm tra mật khẩu với hash đã lưu
+
+        Returns:
+            bool: True nếu đúng
+
+        Raises:
+            PasswordHasherBusy: Pool quá tải
+        """
+        if not password_hash or not password:
+            return False
+        return self._run('verify', _check_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Hash được tạo với cost khác cấu hình hiện tại"""
+        cost = hash_cost(password_hash)
+        return cost is not None and cost != self.rounds
+
+    def stats(self):
+        """Thống kê pool + histogram độ trễ của process hiện tại"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'rounds': self.rounds,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'rejected': dict(self._rejected),
+                'timeouts': dict(self._timeouts),
+                'latency': {op: histogram.snapshot() for op, histogram in self._histograms.items()}
+            }
+
+
+password_hasher = PasswordHasher.from_config(Config.PASSWORD_HASHER, Config.BCRYPT_LOG_ROUNDS)
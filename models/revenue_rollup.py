@@ -0,0 +1,376 @@
+"""
+Revenue Rollup - bảng tổng hợp doanh thu
+revenue_daily: ngày × tuyến × nhà xe × phương thức TT × trạng thái × trạng thái TT
+(tuyến / nhà xe = bookings.booked_route_id / booked_bus_company, lưu lúc đặt vé)
+revenue_hourly: ngày × giờ × trạng thái
+
+Cập nhật tăng dần (delta) trong cùng transaction với thay đổi booking
+(gom lại, ghi ở cuối transaction - xem apply_many):
+    Booking.create  -> RevenueRollup.record_new(booking_id)
+    đổi trạng thái  -> with RevenueRollup.track(booking_id): UPDATE bookings ...
+Các trang doanh thu chỉ đọc từ 2 bảng này.
+"""
+
+from contextlib import contextmanager
+from models.database import Database
+
+
+class RevenueRollup:
+    """Duy trì và truy vấn bảng tổng hợp doanh thu"""
+    
+    # Tuyến / nhà xe lấy từ booking (lưu lúc đặt) - không JOIN trips/buses nên
+    # FOR UPDATE chỉ khóa dòng bookings và sửa xe sau đó không làm lệch bảng tổng hợp
+    SNAPSHOT_QUERY = """
+        SELECT 
+            b.id, b.created_at, b.status, b.payment_status,
+            COALESCE(b.payment_method, '') as payment_method,
+            b.total_price, b.total_seats,
+            b.booked_route_id as route_id, b.booked_bus_company as bus_company
+        FROM bookings b
+        WHERE b.booked_route_id IS NOT NULL
+    """
+    
+    # ---------- Cập nhật tăng dần ----------
+    
+    @staticmethod
+    def snapshot(booking_id, for_update=False):
+        """Các chiều tổng hợp hiện tại của 1 booking (None nếu không có)"""
+        query = RevenueRollup.SNAPSHOT_QUERY + " AND b.id = %s" + (" FOR UPDATE" if for_update else "")
+        return Database.execute_query(query, (booking_id,), fetch_one=True)
+    
+    @staticmethod
+    def snapshot_many(booking_ids=None, trip_id=None, for_update=False):
+        """
+        Snapshot nhiều booking (theo danh sách ID hoặc mọi booking chưa hủy của 1 chuyến)
+        
+        Returns:
+            list: Snapshot (dict)
+        """
+        query = RevenueRollup.SNAPSHOT_QUERY
+        params = []
+        if booking_ids is not None:
+            booking_ids = list(booking_ids)
+            if not booking_ids:
+                return []
+            query += f" AND b.id IN ({', '.join(['%s'] * len(booking_ids))})"
+            params.extend(booking_ids)
+        if trip_id is not None:
+            query += " AND b.trip_id = %s AND b.status != 'cancelled'"
+            params.append(trip_id)
+        query += " ORDER BY b.id" + (" FOR UPDATE" if for_update else "")
+        return Database.execute_query(query, tuple(params), fetch_all=True) or []
+    
+    @staticmethod
+    def _deltas(before, after, daily=None, hourly=None):
+        """
+        Cộng delta (trước -> sau) vào 2 dict theo khóa của 2 bảng tổng hợp
+        
+        Returns:
+            tuple: (daily, hourly) - {khóa: [bookings, seats, revenue]} / {khóa: [bookings, revenue]}
+        """
+        daily = {} if daily is None else daily
+        hourly = {} if hourly is None else hourly
+        for rows, sign in ((before, -1), (after, 1)):
+            for row in rows:
+                stat_date = row['created_at'].date()
+                key = (stat_date, row['route_id'], row['bus_company'],
+                       row['payment_method'], row['status'], row['payment_status'])
+                delta = daily.setdefault(key, [0, 0, 0])
+                delta[0] += sign
+                delta[1] += sign * int(row['total_seats'] or 0)
+                delta[2] += sign * (row['total_price'] or 0)
+                
+                key = (stat_date, row['created_at'].hour, row['status'])
+                delta = hourly.setdefault(key, [0, 0])
+                delta[0] += sign
+                delta[1] += sign * (row['total_price'] or 0)
+        return daily, hourly
+    
+    @staticmethod
+    def _write(daily, hourly):
+        """
+        Upsert delta vào bảng tổng hợp: revenue_daily rồi revenue_hourly, mỗi bảng theo
+        thứ tự khóa tăng dần -> mọi transaction khóa các dòng tổng hợp cùng 1 thứ tự
+        """
+        if not any(any(delta) for delta in list(daily.values()) + list(hourly.values())):
+            return
+        
+        with Database.transaction():
+            for key in sorted(daily):
+                delta = daily[key]
+                if not any(delta):
+                    continue
+                Database.execute_update("""
+                    INSERT INTO revenue_daily 
+                        (stat_date, route_id, bus_company, payment_method, status, payment_status,
+                         bookings, seats, revenue)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        bookings = bookings + VALUES(bookings),
+                        seats = seats + VALUES(seats),
+                        revenue = revenue + VALUES(revenue)
+                """, key + tuple(delta))
+            
+            for key in sorted(hourly):
+                delta = hourly[key]
+                if not any(delta):
+                    continue
+                Database.execute_update("""
+                    INSERT INTO revenue_hourly (stat_date, stat_hour, status, bookings, revenue)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        bookings = bookings + VALUES(bookings),
+                        revenue = revenue + VALUES(revenue)
+                """, key + tuple(delta))
+    
+    @staticmethod
+    def apply_many(before, after):
+        """
+        Ghi delta giữa 2 tập snapshot (trước / sau thay đổi) vào bảng tổng hợp
+        Trong transaction: chỉ gom delta, ghi 1 lần ở cuối (Database.before_commit) -
+        dòng tổng hợp (nóng, dùng chung mọi checkout) bị khóa sau cùng và ngắn nhất,
+        sau bookings/trip_seats/trips, nên không ngược thứ tự khóa với checkout/hủy vé.
+        
+        Args:
+            before (list): Snapshot trước thay đổi
+            after (list): Snapshot sau thay đổi
+        """
+        state = Database.transaction_state()
+        if state is None:
+            RevenueRollup._write(*RevenueRollup._deltas(before, after))
+            return
+        
+        pending = state.get('revenue_rollup')
+        if pending is None:
+            pending = state['revenue_rollup'] = ({}, {})
+            Database.before_commit(lambda: RevenueRollup._write(*pending))
+        RevenueRollup._deltas(before, after, *pending)
+    
+    @staticmethod
+    def apply(before, after):
+        """
+        Ghi delta giữa 2 snapshot của cùng 1 booking
+        
+        Args:
+            before (dict): Snapshot trước thay đổi (None = booking mới)
+            after (dict): Snapshot sau thay đổi (None = booking đã bị xóa)
+        """
+        RevenueRollup.apply_many([before] if before else [], [after] if after else [])
+    
+    @staticmethod
+    def record_new(booking_id):
+        """Cộng booking vừa tạo vào bảng tổng hợp"""
+        RevenueRollup.apply(None, RevenueRollup.snapshot(booking_id))
+    
+    @staticmethod
+    @contextmanager
+    def track(booking_id):
+        """
+        Bao quanh câu UPDATE bookings: khóa dòng booking, chạy UPDATE,
+        rồi ghi delta vào bảng tổng hợp - tất cả trong 1 transaction
+        
+        Usage:
+            with RevenueRollup.track(booking_id):
+                Database.execute_query("UPDATE bookings SET status = ...", ...)
+        """
+        with Database.transaction():
+            before = RevenueRollup.snapshot(booking_id, for_update=True)
+            yield
+            RevenueRollup.apply(before, RevenueRollup.snapshot(booking_id))
+    
+    @staticmethod
+    def rebuild(date_from=None, date_to=None):
+        """
+        Dựng lại bảng tổng hợp từ bookings (toàn bộ hoặc khoảng ngày [date_from, date_to])
+        Dùng cho lần đầu (backfill) hoặc sau khi sửa/xóa dữ liệu trực tiếp trong DB.
+        
+        Returns:
+            int: Số dòng revenue_daily đã tạo
+        """
+        where_rollup = "WHERE 1=1"
+        where_bookings = "WHERE 1=1"
+        params = []
+        if date_from:
+            where_rollup += " AND stat_date >= %s"
+            where_bookings += " AND b.created_at >= %s"
+            params.append(date_from)
+        if date_to:
+            where_rollup += " AND stat_date <= %s"
+            where_bookings += " AND b.created_at < DATE_ADD(%s, INTERVAL 1 DAY)"
+            params.append(date_to)
+        params = tuple(params)
+        
+        with Database.transaction():
+            Database.execute_update(f"DELETE FROM revenue_daily {where_rollup}", params)
+            Database.execute_update(f"DELETE FROM revenue_hourly {where_rollup}", params)
+            
+            created = Database.execute_update(f"""
+                INSERT INTO revenue_daily 
+                    (stat_date, route_id, bus_company, payment_method, status, payment_status,
+                     bookings, seats, revenue)
+                SELECT 
+                    DATE(b.created_at), b.booked_route_id, b.booked_bus_company,
+                    COALESCE(b.payment_method, ''), b.status, b.payment_status,
+                    COUNT(*), SUM(b.total_seats), SUM(b.total_price)
+                FROM bookings b
+                {where_bookings} AND b.booked_route_id IS NOT NULL
+                GROUP BY DATE(b.created_at), b.booked_route_id, b.booked_bus_company,
+                         COALESCE(b.payment_method, ''), b.status, b.payment_status
+            """, params)
+            
+            Database.execute_update(f"""
+                INSERT INTO revenue_hourly (stat_date, stat_hour, status, bookings, revenue)
+                SELECT DATE(b.created_at), HOUR(b.created_at), b.status, COUNT(*), SUM(b.total_price)
+                FROM bookings b
+                {where_bookings} AND b.booked_route_id IS NOT NULL
+                GROUP BY DATE(b.created_at), HOUR(b.created_at), b.status
+            """, params)
+        
+        print(f"✅ Dựng lại revenue rollup: {created} dòng")
+        return created
+    
+    # ---------- Truy vấn cho trang doanh thu ----------
+    
+    @staticmethod
+    def totals(date_from=None, date_to=None, route_id=None):
+        """
+        Tổng doanh thu (không tính đơn đã hủy)
+        
+        Returns:
+            dict: total_revenue, total_bookings, paid_revenue, pending_revenue
+        """
+        query = """
+            SELECT 
+                SUM(revenue) as total_revenue,
+                SUM(bookings) as total_bookings,
+                SUM(CASE WHEN payment_status = 'paid' THEN revenue ELSE 0 END) as paid_revenue,
+                SUM(CASE WHEN payment_status = 'pending' THEN revenue ELSE 0 END) as pending_revenue
+            FROM revenue_daily
+            WHERE status != 'cancelled'
+        """
+        params = []
+        if date_from:
+            query += " AND stat_date >= %s"
+            params.append(date_from)
+        if date_to:
+            query += " AND stat_date <= %s"
+            params.append(date_to)
+        if route_id:
+            query += " AND route_id = %s"
+            params.append(route_id)
+        
+        return Database.execute_query(query, tuple(params), fetch_one=True)
+    
+    @staticmethod
+    def monthly(months=6, ascending=False):
+        """Doanh thu theo tháng (N tháng gần nhất): month, revenue, bookings"""
+        order = 'ASC' if ascending else 'DESC'
+        query = f"""
+            SELECT 
+                DATE_FORMAT(stat_date, '%Y-%m') as month,
+                SUM(revenue) as revenue,
+                SUM(bookings) as bookings
+            FROM revenue_daily
+            WHERE status != 'cancelled'
+              AND stat_date >= DATE_SUB(CURDATE(), INTERVAL %s MONTH)
+            GROUP BY DATE_FORMAT(stat_date, '%Y-%m')
+            ORDER BY month {order}
+        """
+        return Database.execute_query(query, (months,), fetch_all=True) or []
+    
+    @staticmethod
+    def daily(days=30):
+        """Doanh thu theo ngày (N ngày gần nhất): day, revenue"""
+        query = """
+            SELECT stat_date as day, SUM(revenue) as revenue
+            FROM revenue_daily
+            WHERE status != 'cancelled'
+              AND stat_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+            GROUP BY stat_date
+            ORDER BY stat_date
+        """
+        return Database.execute_query(query, (days,), fetch_all=True) or []
+    
+    @staticmethod
+    def top_routes(limit=5):
+        """Tuyến có doanh thu cao nhất: departure_point, arrival_point, revenue, bookings"""
+        query = """
+            SELECT 
+                r.departure_point,
+                r.arrival_point,
+                SUM(rd.revenue) as revenue,
+                SUM(rd.bookings) as bookings
+            FROM revenue_daily rd
+            INNER JOIN routes r ON rd.route_id = r.id
+            WHERE rd.status != 'cancelled'
+            GROUP BY r.id, r.departure_point, r.arrival_point
+            ORDER BY revenue DESC
+            LIMIT %s
+        """
+        return Database.execute_query(query, (limit,), fetch_all=True) or []
+    
+    @staticmethod
+    def by_payment_method():
+        """Doanh thu theo phương thức thanh toán: payment_method, revenue, bookings"""
+        query = """
+            SELECT payment_method, SUM(revenue) as revenue, SUM(bookings) as bookings
+            FROM revenue_daily
+            WHERE status != 'cancelled' AND payment_method != ''
+            GROUP BY payment_method
+        """
+        return Database.execute_query(query, fetch_all=True) or []
+    
+    @staticmethod
+    def by_weekday(days=30):
+        """Theo ngày trong tuần (N ngày gần nhất): day_name, day_num, bookings, revenue"""
+        query = """
+            SELECT 
+                DAYNAME(stat_date) as day_name,
+                DAYOFWEEK(stat_date) as day_num,
+                SUM(bookings) as bookings,
+                SUM(revenue) as revenue
+            FROM revenue_daily
+            WHERE status != 'cancelled'
+              AND stat_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+            GROUP BY day_name, day_num
+            ORDER BY day_num
+        """
+        return Database.execute_query(query, (days,), fetch_all=True) or []
+    
+    @staticmethod
+    def by_hour(days=7):
+        """Theo giờ trong ngày (N ngày gần nhất): hour, bookings, revenue"""
+        query = """
+            SELECT stat_hour as hour, SUM(bookings) as bookings, SUM(revenue) as revenue
+            FROM revenue_hourly
+            WHERE status != 'cancelled'
+              AND stat_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+            GROUP BY stat_hour
+            ORDER BY stat_hour
+        """
+        return Database.execute_query(query, (days,), fetch_all=True) or []
+    
+    @staticmethod
+    def by_status():
+        """Tỷ lệ booking theo trạng thái: status, count, percentage"""
+        query = """
+            SELECT 
+                status,
+                SUM(bookings) as count,
+                ROUND(SUM(bookings) * 100.0 / NULLIF((SELECT SUM(bookings) FROM revenue_daily), 0), 2) as percentage
+            FROM revenue_daily
+            GROUP BY status
+            HAVING count > 0
+        """
+        return Database.execute_query(query, fetch_all=True) or []
+    
+    @staticmethod
+    def by_company():
+        """Doanh thu theo nhà xe: bus_company, total_bookings, revenue"""
+        query = """
+            SELECT bus_company, SUM(bookings) as total_bookings, SUM(revenue) as revenue
+            FROM revenue_daily
+            WHERE status != 'cancelled'
+            GROUP BY bus_company
+        """
+        return Database.execute_query(query, fetch_all=True) or []
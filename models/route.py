@@ -4,7 +4,11 @@ Chỉ quản lý tuyến đường (điểm A → điểm B)
 KHÔNG có: giá, giờ, ảnh xe, loại xe (đã chuyển sang bảng buses)
 """
 
+from config import Config
 from models.database import Database
+from models.cache import cache
+from models.city_index import city_index
+from datetime import timedelta
 
 
 class Route:
@@ -33,6 +37,8 @@ class Route:
             }
             
             route_id = Database.insert('routes', data)
+            cache.invalidate_tags('routes')
+            city_index.add_route(route_id, departure_point, arrival_point)
             print(f"✅ Đã tạo route ID: {route_id}")
             return route_id
             
@@ -137,6 +143,8 @@ class Route:
         """
         try:
             Database.update('routes', data, f"id = {route_id}")
+            cache.invalidate_tags(f'route:{route_id}', 'routes')
+            city_index.update_route(route_id, data.get('departure_point'), data.get('arrival_point'))
             print(f"✅ Đã update route ID: {route_id}")
             return True
         except Exception as e:
@@ -158,6 +166,7 @@ class Route:
         """
         try:
             Database.delete('routes', f"id = {route_id}")
+            cache.invalidate_tags(f'route:{route_id}', 'routes', 'buses', 'trips')
             print(f"✅ Đã xóa route ID: {route_id}")
             return True
         except Exception as e:
@@ -180,6 +189,7 @@ class Route:
         query = "UPDATE routes SET is_active = NOT is_active WHERE id = %s"
         try:
             Database.execute_query(query, (route_id,))
+            cache.invalidate_tags(f'route:{route_id}', 'routes')
             return True
         except Exception as e:
             print(f"❌ Lỗi toggle status: {e}")
@@ -289,4 +299,68 @@ class Route:
             GROUP BY r.id
             ORDER BY r.departure_point, r.arrival_point
         """
-        return Database.execute_query(query, fetch_all=True)
\ No newline at end of file
+        return Database.execute_query(query, fetch_all=True)
+    
+    @staticmethod
+    def get_calendar(route_id, start_date, days=30):
+        """
+        Lịch giá theo ngày của 1 tuyến: giá thấp nhất, số chuyến, số ghế còn
+        Tính bằng 1 câu GROUP BY trip_date, cache theo tuyến (Config.ROUTE_CALENDAR_TTL giây),
+        xóa khi tuyến/xe/chuyến thay đổi.
+        
+        Args:
+            route_id (int): ID tuyến
+            start_date (date): Ngày bắt đầu
+            days (int): Số ngày
+            
+        Returns:
+            list: [{'date': '2025-12-01', 'min_price': 250000.0, 'trip_count': 3, 'remaining_seats': 87}, ...]
+                  đủ mọi ngày trong khoảng (ngày không có chuyến: trip_count = 0, min_price = None)
+        """
+        key = f'route_calendar:{route_id}:{start_date.isoformat()}:{days}'
+        return cache.get_or_set(
+            key,
+            lambda: Route._build_calendar(route_id, start_date, days),
+            ttl=Config.ROUTE_CALENDAR_TTL,
+            tags=(f'route:{route_id}', 'buses', 'trips')
+        )
+    
+    @staticmethod
+    def _build_calendar(route_id, start_date, days):
+        """Query lịch giá (xem get_calendar)"""
+        end_date = start_date + timedelta(days=days)
+        
+        query = """
+            SELECT 
+                t.trip_date,
+                MIN(COALESCE(t.custom_price, b.price)
+                    * (1 - COALESCE(t.custom_discount, b.discount_percent) / 100)) as min_price,
+                COUNT(*) as trip_count,
+                SUM(t.available_seats) as remaining_seats
+            FROM trips t
+            INNER JOIN buses b ON t.bus_id = b.id
+            INNER JOIN routes r ON b.route_id = r.id
+            WHERE b.route_id = %s
+              AND r.is_active = TRUE
+              AND b.is_active = TRUE
+              AND t.is_active = TRUE
+              AND t.status = 'scheduled'
+              AND t.trip_date >= %s
+              AND t.trip_date < %s
+            GROUP BY t.trip_date
+        """
+        rows = Database.execute_query(query, (route_id, start_date, end_date), fetch_all=True) or []
+        by_date = {row['trip_date']: row for row in rows}
+        
+        calendar = []
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            row = by_date.get(day)
+            calendar.append({
+                'date': day.isoformat(),
+                'min_price': float(row['min_price']) if row and row['min_price'] is not None else None,
+                'trip_count': int(row['trip_count']) if row else 0,
+                'remaining_seats': int(row['remaining_seats'] or 0) if row else 0
+            })
+        
+        return calendar
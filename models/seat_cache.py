@@ -0,0 +1,253 @@
+"""
+Seat Cache - cache trạng thái ghế theo chuyến trong bộ nhớ
+Mỗi chuyến lưu dạng bitmap (int) cho ghế tồn tại / đang giữ / đã đặt,
+cập nhật write-through bởi TripSeat.lock_seats/book_seat/release_seat/unlock_seat,
+tự nạp lại từ trip_seats sau TTL giây.
+Mỗi lần ghi đổi phiên bản tag 'trip_seats:<id>' trong cache dùng chung
+-> worker khác thấy phiên bản lệch và nạp lại.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import Config
+from models.cache import cache
+from models.database import Database
+
+
+def _seat_numbers(mask):
+    """Chuyển bitmap thành danh sách số ghế tăng dần"""
+    seats = []
+    seat_num = 0
+    while mask:
+        if mask & 1:
+            seats.append(seat_num)
+        mask >>= 1
+        seat_num += 1
+    return seats
+
+
+def _tag(trip_id):
+    return f'trip_seats:{trip_id}'
+
+
+class SeatStateCache:
+    """Cache trạng thái ghế theo trip_id (LRU + TTL, an toàn đa luồng)"""
+    
+    def __init__(self, ttl=30, max_trips=1000):
+        """
+        Args:
+            ttl (int): Số giây trước khi nạp lại từ database
+            max_trips (int): Số chuyến tối đa giữ trong cache
+        """
+        self.ttl = ttl
+        self.max_trips = max_trips
+        self._entries = OrderedDict()   # trip_id -> entry
+        self._versions = {}             # trip_id -> số lần ghi (chống ghi đè bởi lần nạp cũ)
+        self._lock = threading.Lock()
+        
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+    
+    @staticmethod
+    def _load_many(tag_versions):
+        """
+        Đọc trạng thái ghế của nhiều chuyến từ trip_seats bằng 1 câu query
+        
+        Args:
+            tag_versions (dict): trip_id -> phiên bản tag lúc bắt đầu nạp
+            
+        Returns:
+            dict: trip_id -> entry
+        """
+        trip_ids = list(tag_versions)
+        placeholders = ', '.join(['%s'] * len(trip_ids))
+        query = f"""
+            SELECT trip_id, seat_number, status, locked_until FROM trip_seats
+            WHERE trip_id IN ({placeholders})
+        """
+        rows = Database.execute_query(query, tuple(trip_ids), fetch_all=True) or []
+        
+        loaded_at = time.monotonic()
+        entries = {
+            trip_id: {
+                'all': 0,
+                'locked': 0,
+                'booked': 0,
+                'lock_expiry': {},
+                'tag_version': tag_versions[trip_id],
+                'loaded_at': loaded_at
+            }
+            for trip_id in trip_ids
+        }
+        
+        for row in rows:
+            entry = entries[row['trip_id']]
+            seat_num = int(row['seat_number'])
+            bit = 1 << seat_num
+            entry['all'] |= bit
+            if row['status'] == 'booked':
+                entry['booked'] |= bit
+            elif row['status'] == 'locked':
+                entry['locked'] |= bit
+                entry['lock_expiry'][seat_num] = row['locked_until']
+        
+        return entries
+    
+    def _get_entries(self, trip_ids):
+        """Lấy entry còn hạn của nhiều chuyến, nạp lại (1 query) các chuyến miss/hết TTL/worker khác đã ghi"""
+        tag_versions = {trip_id: cache.tag_version(_tag(trip_id)) for trip_id in trip_ids}
+        
+        entries = {}
+        missing = {}
+        versions = {}
+        with self._lock:
+            now = time.monotonic()
+            for trip_id, tag_version in tag_versions.items():
+                entry = self._entries.get(trip_id)
+                if (entry and entry['tag_version'] == tag_version
+                        and now - entry['loaded_at'] < self.ttl):
+                    self._entries.move_to_end(trip_id)
+                    self._hits += 1
+                    entries[trip_id] = entry
+                else:
+                    self._misses += 1
+                    missing[trip_id] = tag_version
+                    versions[trip_id] = self._versions.get(trip_id, 0)
+        
+        if not missing:
+            return entries
+        
+        loaded = self._load_many(missing)
+        entries.update(loaded)
+        
+        with self._lock:
+            for trip_id, entry in loaded.items():
+                # Có ghi trong lúc đang nạp -> kết quả nạp có thể đã cũ, không lưu
+                if self._versions.get(trip_id, 0) != versions[trip_id]:
+                    continue
+                self._entries[trip_id] = entry
+                self._entries.move_to_end(trip_id)
+            while len(self._entries) > self.max_trips:
+                evicted, _ = self._entries.popitem(last=False)
+                self._versions.pop(evicted, None)
+                self._evictions += 1
+        
+        return entries
+    
+    def _to_seat_map(self, entry):
+        """Chuyển entry bitmap thành sơ đồ ghế (ghế lock quá hạn tính là available)"""
+        with self._lock:
+            locked = entry['locked']
+            now = datetime.now()
+            for seat_num, locked_until in entry['lock_expiry'].items():
+                if locked_until and locked_until < now:
+                    locked &= ~(1 << seat_num)
+            booked = entry['booked']
+            available = entry['all'] & ~booked & ~locked
+        
+        return {
+            'available': _seat_numbers(available),
+            'booked': _seat_numbers(booked),
+            'locked': _seat_numbers(locked)
+        }
+    
+    def get_seat_map(self, trip_id):
+        """
+        Sơ đồ ghế của 1 chuyến
+        Ghế lock đã quá hạn được tính là available
+        
+        Returns:
+            dict: {'available': [1,2], 'booked': [3], 'locked': [4]} (số ghế kiểu int)
+        """
+        trip_id = int(trip_id)
+        return self._to_seat_map(self._get_entries([trip_id])[trip_id])
+    
+    def get_seat_maps(self, trip_ids):
+        """
+        Sơ đồ ghế của nhiều chuyến (các chuyến chưa có trong cache được nạp bằng 1 query)
+        
+        Returns:
+            dict: trip_id -> sơ đồ ghế như get_seat_map
+        """
+        trip_ids = list(dict.fromkeys(int(trip_id) for trip_id in trip_ids))
+        if not trip_ids:
+            return {}
+        
+        entries = self._get_entries(trip_ids)
+        return {trip_id: self._to_seat_map(entries[trip_id]) for trip_id in trip_ids}
+    
+    def update(self, trip_id, seat_numbers, status, locked_until=None):
+        """
+        Write-through: cập nhật trạng thái ghế sau khi đã ghi database
+        
+        Args:
+            trip_id (int): ID chuyến xe
+            seat_numbers (list): Danh sách số ghế
+            status (str): 'available' | 'locked' | 'booked'
+            locked_until (datetime): Hạn giữ ghế (khi status = 'locked')
+        """
+        trip_id = int(trip_id)
+        tag_version = cache.bump_tag(_tag(trip_id))
+        
+        with self._lock:
+            self._versions[trip_id] = self._versions.get(trip_id, 0) + 1
+            entry = self._entries.get(trip_id)
+            if entry is None:
+                return
+            entry['tag_version'] = tag_version
+            
+            for seat in seat_numbers:
+                seat_num = int(seat)
+                bit = 1 << seat_num
+                entry['all'] |= bit
+                entry['locked'] &= ~bit
+                entry['booked'] &= ~bit
+                entry['lock_expiry'].pop(seat_num, None)
+                
+                if status == 'locked':
+                    entry['locked'] |= bit
+                    entry['lock_expiry'][seat_num] = locked_until
+                elif status == 'booked':
+                    entry['booked'] |= bit
+    
+    def invalidate(self, trip_id=None):
+        """Xóa cache của 1 chuyến (hoặc toàn bộ nếu trip_id=None, chỉ process hiện tại)"""
+        if trip_id is not None:
+            trip_id = int(trip_id)
+            cache.bump_tag(_tag(trip_id))
+        
+        with self._lock:
+            if trip_id is None:
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                self._entries.pop(trip_id, None)
+                self._versions[trip_id] = self._versions.get(trip_id, 0) + 1
+    
+    def stats(self):
+        """
+        Thống kê cache (dùng cho monitoring)
+        
+        Returns:
+            dict: hits, misses, hit_rate, số chuyến đang cache...
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'trips': len(self._entries),
+                'max_trips': self.max_trips,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / total, 4) if total else 0.0
+            }
+
+
+seat_cache = SeatStateCache(
+    ttl=Config.SEAT_CACHE['ttl'],
+    max_trips=Config.SEAT_CACHE['max_trips']
+)
@@ -52,6 +52,47 @@ class Ticket:
             traceback.print_exc()
             return None
     
+    @staticmethod
+    def create_many(booking_id, trip_id, seat_numbers, passenger_name,
+                    passenger_phone, price):
+        """
+        Tạo vé cho nhiều ghế bằng 1 câu INSERT nhiều VALUES
+        
+        Args:
+            booking_id (int): ID booking
+            trip_id (int): ID chuyến xe
+            seat_numbers (list): Danh sách số ghế
+            passenger_name (str): Tên hành khách
+            passenger_phone (str): SĐT hành khách
+            price (float): Giá mỗi vé
+            
+        Returns:
+            list: Danh sách ticket_id (theo thứ tự seat_numbers) hoặc None nếu lỗi
+        """
+        try:
+            rows = [
+                {
+                    'booking_id': booking_id,
+                    'trip_id': trip_id,
+                    'seat_number': int(seat),
+                    'passenger_name': passenger_name,
+                    'passenger_phone': passenger_phone,
+                    'price': price,
+                    'status': 'booked'
+                }
+                for seat in seat_numbers
+            ]
+            
+            ticket_ids = Database.insert_many('tickets', rows)
+            print(f"✅ Tạo {len(ticket_ids)} tickets cho booking {booking_id}")
+            return ticket_ids
+            
+        except Exception as e:
+            print(f"❌ Lỗi tạo vé: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
     @staticmethod
     def find_by_id(ticket_id):
         """Tìm vé theo ID"""
@@ -83,6 +124,34 @@ class Ticket:
         """
         return Database.execute_query(query, (booking_id,), fetch_all=True)
     
+    @staticmethod
+    def get_by_bookings(booking_ids):
+        """
+        Lấy vé của nhiều booking bằng 1 query (tránh N+1)
+        
+        Args:
+            booking_ids (list): Danh sách ID booking
+            
+        Returns:
+            dict: {booking_id: [ticket, ...]} - booking không có vé thì không có key
+        """
+        booking_ids = list(booking_ids)
+        if not booking_ids:
+            return {}
+        
+        placeholders = ', '.join(['%s'] * len(booking_ids))
+        query = f"""
+            SELECT * FROM tickets 
+            WHERE booking_id IN ({placeholders})
+            ORDER BY booking_id, seat_number
+        """
+        tickets = Database.execute_query(query, tuple(booking_ids), fetch_all=True) or []
+        
+        result = {}
+        for ticket in tickets:
+            result.setdefault(ticket['booking_id'], []).append(ticket)
+        return result
+    
     @staticmethod
     def get_by_user(user_id, limit=None):
         """Lấy tất cả vé của 1 user"""
@@ -6,6 +6,7 @@ Thông tin giá, giờ lấy từ Bus, có thể override nếu cần
 """
 
 from models.database import Database
+from models.cache import cache
 from datetime import datetime, timedelta
 import json
 
@@ -17,6 +18,8 @@ class Trip:
     def search(departure_city, arrival_city, travel_date=None):
         """
         ✅ THÊM MỚI - Tìm kiếm chuyến xe theo schema mới
+        Điểm đi/đến được tra trong city_index (không dấu, tiền tố, alias) ra route_id trước,
+        SQL chỉ lọc b.route_id IN (...) + t.trip_date = ... nên dùng được index.
         
         Schema mới:
         - routes (tuyến đường)
@@ -36,7 +39,13 @@ class Trip:
             if not travel_date:
                 travel_date = datetime.now().strftime('%Y-%m-%d')
             
-            query = """
+            from models.city_index import city_index
+            route_ids = city_index.find_routes(departure_city, arrival_city)
+            if not route_ids:
+                return []
+            
+            placeholders = ', '.join(['%s'] * len(route_ids))
+            query = f"""
                 SELECT 
                     t.id,
                     t.trip_date,
@@ -79,18 +88,13 @@ class Trip:
                   AND b.is_active = TRUE
                   AND r.is_active = TRUE
                   AND t.status = 'scheduled'
-                  AND r.departure_point LIKE %s
-                  AND r.arrival_point LIKE %s
+                  AND b.route_id IN ({placeholders})
                   AND t.trip_date = %s
                   AND t.available_seats > 0
                 ORDER BY departure_time ASC
             """
             
-            params = (
-                f"%{departure_city}%",
-                f"%{arrival_city}%",
-                travel_date
-            )
+            params = (*route_ids, travel_date)
             
             trips = Database.execute_query(query, params, fetch_all=True)
             
@@ -303,18 +307,26 @@ class Trip:
                 print(f"❌ Xe {bus_id} đã có chuyến ngày {trip_date}!")
                 return None
             
+            from models.trip_seat import TripSeat
+            total_seats = TripSeat.get_seat_count(bus)
+            
             data = {
                 'bus_id': bus_id,
                 'trip_date': trip_date,
                 'custom_departure_time': custom_departure_time,
                 'custom_price': custom_price,
                 'custom_discount': custom_discount,
-                'available_seats': bus['total_seats'],  # Ban đầu = tổng ghế
+                'available_seats': total_seats,  # Ban đầu = tổng ghế
                 'status': 'scheduled'
             }
             
-            trip_id = Database.insert('trips', data)
-            print(f"✅ Đã tạo trip ID: {trip_id}")
+            # Tạo trip + toàn bộ ghế trong trip_seats cùng 1 transaction
+            with Database.transaction():
+                trip_id = Database.insert('trips', data)
+                Database.insert_many('trip_seats', TripSeat.build_seat_rows(trip_id, total_seats))
+            
+            cache.invalidate_tags('trips')
+            print(f"✅ Đã tạo trip ID: {trip_id} ({total_seats} ghế)")
             return trip_id
             
         except Exception as e:
@@ -330,12 +342,16 @@ class Trip:
         
         Args:
             trip_id (int): ID trip
-            data (dict): Dữ liệu cập nhật
+            data (dict): Dữ liệu cập nhật (không gồm available_seats - cột này chỉ
+                do TripSeat.book_seats/release_seats và reconcile-seats cập nhật)
             
         Returns:
             bool: True nếu thành công
         """
         try:
+            # Form sửa cũ/đã mở lâu ghi đè số ghế đã bán từ lúc tải trang -> bỏ qua
+            data.pop('available_seats', None)
+            
             # Chuyển chuỗi rỗng thành None
             if data.get('custom_departure_time') == '':
                 data['custom_departure_time'] = None
@@ -345,6 +361,7 @@ class Trip:
                 data['custom_discount'] = None
             
             Database.update('trips', data, f"id = {trip_id}")
+            cache.invalidate_tags(f'trip:{trip_id}', 'trips')
             print(f"✅ Đã update trip ID: {trip_id}")
             return True
             
@@ -375,6 +392,7 @@ class Trip:
                 return False
             
             Database.delete('trips', f"id = {trip_id}")
+            cache.invalidate_tags(f'trip:{trip_id}', 'trips')
             print(f"✅ Đã xóa trip ID: {trip_id}")
             return True
             
@@ -390,6 +408,7 @@ class Trip:
         try:
             query = "UPDATE trips SET is_active = NOT is_active WHERE id = %s"
             Database.execute_query(query, (trip_id,))
+            cache.invalidate_tags(f'trip:{trip_id}', 'trips')
             return True
         except Exception as e:
             print(f"❌ Lỗi toggle_active: {e}")
@@ -438,23 +457,93 @@ class Trip:
         Returns:
             int: Số trips đã tạo
         """
-        try:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            end = datetime.strptime(end_date, '%Y-%m-%d')
+        return Trip.schedule_bulk([bus_id], start_date, end_date)['created']
+    
+    @staticmethod
+    def schedule_bulk(bus_ids, start_date, end_date, chunk_size=1000):
+        """
+        Lên lịch chuyến cho nhiều xe trong khoảng ngày bằng thao tác tập hợp
+        - 1 query lấy thông tin tất cả xe (chỉ xe đang hoạt động: is_active, status 'active')
+        - Sinh toàn bộ (bus_id, trip_date) trong bộ nhớ
+        - INSERT IGNORE theo UNIQUE KEY unique_trip (bus_id, trip_date): ngày đã có chuyến bị bỏ qua
+        - Tạo trip_seats cho các chuyến mới bằng insert_many
+        
+        Args:
+            bus_ids (list): Danh sách ID xe
+            start_date (str): Ngày bắt đầu (YYYY-MM-DD)
+            end_date (str): Ngày kết thúc (YYYY-MM-DD)
+            chunk_size (int): Số dòng mỗi câu INSERT
             
-            count = 0
-            current = start
+        Returns:
+            dict: {'created': số chuyến tạo mới, 'skipped': số chuyến đã tồn tại/bỏ qua,
+                   'invalid_bus_ids': xe không tồn tại / ngừng hoạt động / bảo trì / không rõ số ghế}
+        """
+        result = {'created': 0, 'skipped': 0, 'invalid_bus_ids': []}
+        
+        try:
+            from models.trip_seat import TripSeat
+            
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date()
+            bus_ids = sorted({int(bus_id) for bus_id in bus_ids})
+            
+            if not bus_ids or end < start:
+                return result
+            
+            placeholders = ', '.join(['%s'] * len(bus_ids))
+            buses = Database.execute_query(f"""
+                SELECT id, total_seats, bus_type FROM buses
+                WHERE id IN ({placeholders}) AND is_active = TRUE AND status = 'active'
+            """, tuple(bus_ids), fetch_all=True) or []
+            
+            seat_counts = {bus['id']: TripSeat.get_seat_count(bus) for bus in buses}
+            seat_counts = {bus_id: count for bus_id, count in seat_counts.items() if count > 0}
+            result['invalid_bus_ids'] = [bus_id for bus_id in bus_ids if bus_id not in seat_counts]
+            if not seat_counts:
+                return result
+            
+            bus_ids = sorted(seat_counts)
+            placeholders = ', '.join(['%s'] * len(bus_ids))
+            dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+            
+            rows = [
+                {
+                    'bus_id': bus_id,
+                    'trip_date': trip_date,
+                    'available_seats': total_seats,
+                    'status': 'scheduled'
+                }
+                for bus_id, total_seats in seat_counts.items()
+                for trip_date in dates
+            ]
+            
+            with Database.transaction():
+                created = Database.insert_ignore_many('trips', rows, chunk_size=chunk_size)
+                
+                # Chuyến trong khoảng ngày chưa có ghế = chuyến vừa tạo
+                new_trips = Database.execute_query(f"""
+                    SELECT t.id, t.bus_id FROM trips t
+                    WHERE t.bus_id IN ({placeholders})
+                      AND t.trip_date BETWEEN %s AND %s
+                      AND NOT EXISTS (SELECT 1 FROM trip_seats ts WHERE ts.trip_id = t.id)
+                """, (*bus_ids, start, end), fetch_all=True) or []
+                
+                seat_rows = []
+                for trip in new_trips:
+                    seat_rows.extend(TripSeat.build_seat_rows(trip['id'], seat_counts[trip['bus_id']]))
+                Database.insert_many('trip_seats', seat_rows, chunk_size=chunk_size)
             
-            while current <= end:
-                date_str = current.strftime('%Y-%m-%d')
-                trip_id = Trip.create(bus_id, date_str)
-                if trip_id:
-                    count += 1
-                current += timedelta(days=1)
+            result['created'] = created
+            result['skipped'] = len(rows) - created
+            if created:
+                cache.invalidate_tags('trips')
             
-            print(f"✅ Đã tạo {count} trips cho bus {bus_id}")
-            return count
+            print(f"✅ Lên lịch {len(seat_counts)} xe x {len(dates)} ngày: "
+                  f"tạo {result['created']}, bỏ qua {result['skipped']}")
+            return result
             
         except Exception as e:
-            print(f"❌ Lỗi create_bulk: {e}")
-            return 0
\ No newline at end of file
+            print(f"❌ Lỗi schedule_bulk: {e}")
+            import traceback
+            traceback.print_exc()
+            return result
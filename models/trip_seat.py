@@ -5,12 +5,51 @@ TripSeat Model - FIXED cho schema mới
 """
 
 from models.database import Database
+from models.seat_cache import seat_cache
 from datetime import datetime, timedelta
 
 
 class TripSeat:
     """TripSeat model class"""
     
+    @staticmethod
+    def get_seat_count(bus):
+        """
+        Số ghế cần tạo cho 1 xe
+        Ưu tiên buses.total_seats, nếu trống thì lấy từ seat_layouts theo bus_type
+        
+        Args:
+            bus (dict): Thông tin xe (cần total_seats, bus_type)
+            
+        Returns:
+            int: Số ghế (0 nếu không xác định được)
+        """
+        if bus.get('total_seats'):
+            return int(bus['total_seats'])
+        
+        query = """
+            SELECT total_seats FROM seat_layouts
+            WHERE bus_type = %s OR layout_name = %s
+            LIMIT 1
+        """
+        layout = Database.execute_query(query, (bus.get('bus_type'), bus.get('bus_type')), fetch_one=True)
+        return int(layout['total_seats']) if layout else 0
+    
+    @staticmethod
+    def build_seat_rows(trip_id, total_seats):
+        """
+        Tạo danh sách dòng trip_seats (ghế 1..total_seats, available)
+        dùng cho Database.insert_many
+        """
+        return [
+            {
+                'trip_id': trip_id,
+                'seat_number': seat_num,
+                'status': 'available'
+            }
+            for seat_num in range(1, total_seats + 1)
+        ]
+    
     @staticmethod
     def init_seats_for_trip(trip_id, total_seats):
         """
@@ -36,13 +75,7 @@ class TripSeat:
             # Tạo ghế từ 1 đến total_seats
             print(f"🔧 Khởi tạo {total_seats} ghế cho trip {trip_id}")
             
-            for seat_num in range(1, total_seats + 1):
-                data = {
-                    'trip_id': trip_id,
-                    'seat_number': seat_num,
-                    'status': 'available'
-                }
-                Database.insert('trip_seats', data)
+            Database.insert_many('trip_seats', TripSeat.build_seat_rows(trip_id, total_seats))
             
             print(f"✅ Đã tạo {total_seats} ghế")
             return True
@@ -53,6 +86,56 @@ class TripSeat:
             traceback.print_exc()
             return False
     
+    @staticmethod
+    def backfill_missing_seats(batch_size=100, chunk_size=500):
+        """
+        Tạo trip_seats cho các chuyến cũ chưa có ghế (chạy 1 lần sau khi nâng cấp)
+        Mỗi lô batch_size chuyến là 1 transaction riêng -> không giữ 1 transaction khổng lồ
+        và không dựng toàn bộ danh sách ghế trong RAM; dừng giữa chừng thì chạy lại tiếp được.
+        
+        Args:
+            batch_size (int): Số chuyến mỗi lô (mỗi lô commit 1 lần)
+            chunk_size (int): Số dòng mỗi câu INSERT
+            
+        Returns:
+            int: Số chuyến đã được tạo ghế
+        """
+        query = """
+            SELECT t.id as trip_id, b.total_seats, b.bus_type
+            FROM trips t
+            INNER JOIN buses b ON t.bus_id = b.id
+            WHERE t.id > %s
+              AND NOT EXISTS (
+                SELECT 1 FROM trip_seats ts WHERE ts.trip_id = t.id
+              )
+            ORDER BY t.id
+            LIMIT %s
+        """
+        
+        filled = 0
+        created = 0
+        last_id = 0
+        while True:
+            trips = Database.execute_query(query, (last_id, batch_size), fetch_all=True) or []
+            if not trips:
+                break
+            last_id = trips[-1]['trip_id']
+            
+            rows = []
+            for trip in trips:
+                total_seats = TripSeat.get_seat_count(trip)
+                if total_seats <= 0:
+                    print(f"⚠️ Trip {trip['trip_id']}: không xác định được số ghế")
+                    continue
+                rows.extend(TripSeat.build_seat_rows(trip['trip_id'], total_seats))
+                filled += 1
+            
+            # 1 transaction cho cả lô; IGNORE: app đang chạy có thể vừa tạo ghế cho cùng chuyến
+            created += Database.insert_ignore_many('trip_seats', rows, chunk_size=chunk_size)
+        
+        print(f"✅ Backfill: tạo {created} ghế cho {filled} chuyến")
+        return filled
+    
     @staticmethod
     def get_seat_status(trip_id, seat_number):
         """
@@ -82,14 +165,7 @@ class TripSeat:
         Returns:
             list: Danh sách số ghế trống [1, 2, 3, ...]
         """
-        query = """
-            SELECT seat_number FROM trip_seats 
-            WHERE trip_id = %s AND status = 'available'
-            ORDER BY seat_number
-        """
-        
-        results = Database.execute_query(query, (trip_id,), fetch_all=True)
-        return [row['seat_number'] for row in results] if results else []
+        return seat_cache.get_seat_map(trip_id)['available']
     
     @staticmethod
     def get_booked_seats(trip_id):
@@ -102,14 +178,7 @@ class TripSeat:
         Returns:
             list: Danh sách số ghế đã đặt [1, 2, 3, ...]
         """
-        query = """
-            SELECT seat_number FROM trip_seats 
-            WHERE trip_id = %s AND status = 'booked'
-            ORDER BY seat_number
-        """
-        
-        results = Database.execute_query(query, (trip_id,), fetch_all=True)
-        seats = [str(row['seat_number']) for row in results] if results else []
+        seats = [str(seat) for seat in seat_cache.get_seat_map(trip_id)['booked']]
         
         print(f"🔍 Trip {trip_id}: Ghế đã đặt = {seats}")
         return seats
@@ -128,38 +197,55 @@ class TripSeat:
         Returns:
             bool: True nếu thành công
         """
-        try:
-            # Chuyển seat_number về int
-            seat_num = int(seat_number)
-            
-            # Kiểm tra ghế có trống không
-            seat = TripSeat.get_seat_status(trip_id, seat_num)
+        return TripSeat.lock_seats(trip_id, [seat_number], user_id, ttl=minutes)
+    
+    @staticmethod
+    def lock_seats(trip_id, seat_numbers, user_id, ttl=10):
+        """
+        Khóa nhiều ghế cùng lúc bằng 1 câu UPDATE có điều kiện (all-or-nothing)
+        Chỉ ghế đang 'available' (hoặc lock đã hết hạn) mới bị khóa; nếu số dòng bị ảnh hưởng
+        ít hơn số ghế yêu cầu (có người giữ trước) thì rollback toàn bộ.
+        Không gọi bên trong Database.transaction() khác (rollback sẽ không có hiệu lực).
+        
+        Args:
+            trip_id (int): ID chuyến xe
+            seat_numbers (list): Danh sách số ghế (int hoặc str)
+            user_id (int): ID user đang giữ
+            ttl (int): Số phút giữ ghế
             
-            if not seat or seat['status'] != 'available':
-                print(f"⚠️ Ghế {seat_num} không available (status: {seat['status'] if seat else 'NULL'})")
+        Returns:
+            bool: True nếu khóa được tất cả ghế
+        """
+        try:
+            seat_nums = sorted({int(seat) for seat in seat_numbers})
+            if not seat_nums:
                 return False
             
-            # Khóa ghế
-            locked_until = datetime.now() + timedelta(minutes=minutes)
+            locked_until = datetime.now() + timedelta(minutes=ttl)
+            placeholders = ', '.join(['%s'] * len(seat_nums))
             
-            query = """
+            query = f"""
                 UPDATE trip_seats 
-                SET status = %s, locked_until = %s
-                WHERE trip_id = %s AND seat_number = %s AND status = 'available'
+                SET status = 'locked', locked_until = %s
+                WHERE trip_id = %s 
+                  AND (status = 'available' OR (status = 'locked' AND locked_until < NOW()))
+                  AND seat_number IN ({placeholders})
             """
             
-            Database.execute_query(query, (
-                'locked', locked_until,
-                trip_id, seat_num
-            ))
+            with Database.transaction():
+                affected = Database.execute_update(query, (locked_until, trip_id, *seat_nums))
+                
+                if affected != len(seat_nums):
+                    raise RuntimeError(
+                        f"Chỉ khóa được {affected}/{len(seat_nums)} ghế, rollback"
+                    )
             
-            print(f"🔒 Locked ghế {seat_num} cho user {user_id}")
+            Database.on_commit(lambda: seat_cache.update(trip_id, seat_nums, 'locked', locked_until))
+            print(f"🔒 Locked ghế {seat_nums} cho user {user_id}")
             return True
             
         except Exception as e:
-            print(f"❌ Lỗi lock ghế {seat_number}: {e}")
-            import traceback
-            traceback.print_exc()
+            print(f"⚠️ Không thể lock ghế {list(seat_numbers)} (trip {trip_id}): {e}")
             return False
     
     @staticmethod
@@ -177,16 +263,15 @@ class TripSeat:
         try:
             seat_num = int(seat_number)
             
+            # Chỉ mở ghế đang locked - không đụng ghế đã booked (available_seats không đổi)
             query = """
                 UPDATE trip_seats 
                 SET status = %s, locked_until = %s
-                WHERE trip_id = %s AND seat_number = %s
+                WHERE trip_id = %s AND seat_number = %s AND status = 'locked'
             """
             
-            Database.execute_query(query, (
-                'available', None,
-                trip_id, seat_num
-            ))
+            if Database.execute_update(query, ('available', None, trip_id, seat_num)):
+                Database.on_commit(lambda: seat_cache.update(trip_id, [seat_num], 'available'))
             
             print(f"🔓 Unlocked ghế {seat_num}")
             return True
@@ -195,6 +280,53 @@ class TripSeat:
             print(f"❌ Lỗi unlock ghế: {e}")
             return False
     
+    @staticmethod
+    def _adjust_available(trip_id, delta):
+        """
+        Cộng/trừ trips.available_seats - chỉ gọi từ các chuyển trạng thái ghế
+        (book_seats / release_seats), cùng transaction với UPDATE trip_seats
+        available_seats = số ghế chưa booked (available + locked)
+        """
+        if delta:
+            Database.execute_update(
+                "UPDATE trips SET available_seats = available_seats + %s WHERE id = %s",
+                (delta, trip_id)
+            )
+    
+    @staticmethod
+    def book_seats(trip_id, seat_numbers, booking_id):
+        """
+        Đặt nhiều ghế (locked/available -> booked) bằng 1 câu UPDATE
+        và trừ trips.available_seats đúng số ghế đã chuyển, trong 1 transaction
+        
+        Args:
+            trip_id (int): ID chuyến xe
+            seat_numbers (list): Danh sách số ghế (int hoặc str)
+            booking_id (int): ID booking
+            
+        Returns:
+            int: Số ghế đã đặt (ghế đã booked trước đó không tính)
+        """
+        seat_nums = sorted({int(seat) for seat in seat_numbers})
+        if not seat_nums:
+            return 0
+        
+        placeholders = ', '.join(['%s'] * len(seat_nums))
+        query = f"""
+            UPDATE trip_seats 
+            SET status = 'booked', booking_id = %s, locked_until = NULL
+            WHERE trip_id = %s AND status != 'booked'
+              AND seat_number IN ({placeholders})
+        """
+        
+        with Database.transaction():
+            booked = Database.execute_update(query, (booking_id, trip_id, *seat_nums))
+            TripSeat._adjust_available(trip_id, -booked)
+        
+        Database.on_commit(lambda: seat_cache.update(trip_id, seat_nums, 'booked'))
+        print(f"✅ Booked {booked}/{len(seat_nums)} ghế {seat_nums} cho booking {booking_id}")
+        return booked
+    
     @staticmethod
     def book_seat(trip_id, seat_number, booking_id, ticket_id, user_id):
         """
@@ -208,24 +340,10 @@ class TripSeat:
             user_id (int): ID người đặt
             
         Returns:
-            bool: True nếu thành công
+            bool: True nếu thành công (False nếu ghế đã có người đặt)
         """
         try:
-            seat_num = int(seat_number)
-            
-            query = """
-                UPDATE trip_seats 
-                SET status = %s, booking_id = %s, locked_until = %s
-                WHERE trip_id = %s AND seat_number = %s
-            """
-            
-            Database.execute_query(query, (
-                'booked', booking_id, None,
-                trip_id, seat_num
-            ))
-            
-            print(f"✅ Booked ghế {seat_num} cho booking {booking_id}")
-            return True
+            return TripSeat.book_seats(trip_id, [seat_number], booking_id) == 1
             
         except Exception as e:
             print(f"❌ Lỗi book ghế {seat_number}: {e}")
@@ -233,6 +351,51 @@ class TripSeat:
             traceback.print_exc()
             return False
     
+    @staticmethod
+    def release_seats(trip_id, seat_numbers=None, booking_id=None):
+        """
+        Trả ghế đã booked về available bằng 1 câu UPDATE và cộng lại
+        trips.available_seats đúng số ghế đã trả, trong 1 transaction
+        
+        Args:
+            trip_id (int): ID chuyến xe
+            seat_numbers (list): Chỉ các ghế này (None = không lọc)
+            booking_id (int): Chỉ ghế của booking này (None = không lọc)
+            
+        Returns:
+            list: Số ghế đã trả
+        """
+        condition = "trip_id = %s AND status = 'booked'"
+        params = [trip_id]
+        if seat_numbers is not None:
+            seat_nums = sorted({int(seat) for seat in seat_numbers})
+            if not seat_nums:
+                return []
+            condition += f" AND seat_number IN ({', '.join(['%s'] * len(seat_nums))})"
+            params.extend(seat_nums)
+        if booking_id is not None:
+            condition += " AND booking_id = %s"
+            params.append(booking_id)
+        
+        with Database.transaction():
+            released = [row['seat_number'] for row in Database.execute_query(
+                f"SELECT seat_number FROM trip_seats WHERE {condition} ORDER BY seat_number FOR UPDATE",
+                tuple(params), fetch_all=True
+            ) or []]
+            if not released:
+                return []
+            
+            Database.execute_update(f"""
+                UPDATE trip_seats 
+                SET status = 'available', booking_id = NULL, locked_until = NULL
+                WHERE {condition}
+            """, tuple(params))
+            TripSeat._adjust_available(trip_id, len(released))
+        
+        Database.on_commit(lambda: seat_cache.update(trip_id, released, 'available'))
+        print(f"🔓 Released ghế {released} (trip {trip_id})")
+        return released
+    
     @staticmethod
     def release_seat(trip_id, seat_number):
         """
@@ -246,20 +409,7 @@ class TripSeat:
             bool: True nếu thành công
         """
         try:
-            seat_num = int(seat_number)
-            
-            query = """
-                UPDATE trip_seats 
-                SET status = %s, booking_id = %s, locked_until = %s
-                WHERE trip_id = %s AND seat_number = %s
-            """
-            
-            Database.execute_query(query, (
-                'available', None, None,
-                trip_id, seat_num
-            ))
-            
-            print(f"🔓 Released ghế {seat_num}")
+            TripSeat.release_seats(trip_id, [seat_number])
             return True
             
         except Exception as e:
@@ -267,10 +417,16 @@ class TripSeat:
             return False
     
     @staticmethod
-    def release_expired_locks():
+    def release_expired_locks(batch_size=500, max_batches=None):
         """
         Giải phóng các ghế bị lock quá thời gian
+        Chạy theo từng lô (UPDATE ... LIMIT) để không giữ lock bảng lâu.
+        Được gọi định kỳ bởi LockReaper, không gọi trên request đọc.
         
+        Args:
+            batch_size (int): Số ghế tối đa mỗi lô
+            max_batches (int): Số lô tối đa mỗi lần quét (None = đến khi hết)
+            
         Returns:
             int: Số ghế đã được giải phóng
         """
@@ -279,49 +435,89 @@ class TripSeat:
                 UPDATE trip_seats 
                 SET status = 'available', locked_until = NULL
                 WHERE status = 'locked' AND locked_until < NOW()
+                LIMIT %s
             """
             
-            cursor = Database.get_connection().cursor()
-            cursor.execute(query)
-            affected = cursor.rowcount
-            cursor.close()
+            total = 0
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                affected = Database.execute_update(query, (batch_size,))
+                total += affected
+                batches += 1
+                if affected < batch_size:
+                    break
             
-            if affected > 0:
-                print(f"🔓 Released {affected} expired locks")
+            if total > 0:
+                print(f"🔓 Released {total} expired locks")
             
-            return affected
+            return total
             
         except Exception as e:
             print(f"❌ Lỗi release expired locks: {e}")
             return 0
     
     @staticmethod
-    def get_seat_map(trip_id):
+    def reconcile_available_seats(fix=True, from_date=None):
         """
-        Lấy sơ đồ ghế đầy đủ (available/booked/locked)
+        Đối chiếu trips.available_seats với số ghế chưa booked trong trip_seats
+        (1 query GROUP BY cho tất cả chuyến), báo các chuyến bị lệch và sửa bằng 1 câu UPDATE JOIN
         
         Args:
-            trip_id (int): ID chuyến xe
+            fix (bool): Sửa lại cột cho khớp (False = chỉ báo cáo)
+            from_date (date|str): Chỉ các chuyến từ ngày này (None = tất cả)
             
         Returns:
-            dict: {'available': [1,2,3], 'booked': [4,5], 'locked': [6]}
-        """
-        query = """
-            SELECT seat_number, status FROM trip_seats 
-            WHERE trip_id = %s
-            ORDER BY seat_number
+            list: Các chuyến lệch [{'trip_id', 'trip_date', 'available_seats', 'actual'}, ...]
         """
+        date_filter = " AND t.trip_date >= %s" if from_date else ""
+        params = (from_date,) if from_date else ()
+        
+        drift = Database.execute_query(f"""
+            SELECT t.id as trip_id, t.trip_date, t.available_seats,
+                   SUM(ts.status != 'booked') as actual
+            FROM trips t
+            INNER JOIN trip_seats ts ON ts.trip_id = t.id
+            WHERE 1=1{date_filter}
+            GROUP BY t.id, t.trip_date, t.available_seats
+            HAVING t.available_seats != actual
+            ORDER BY t.trip_date, t.id
+        """, params, fetch_all=True) or []
         
-        results = Database.execute_query(query, (trip_id,), fetch_all=True)
+        for row in drift:
+            print(f"⚠️ Trip {row['trip_id']} ({row['trip_date']}): "
+                  f"available_seats = {row['available_seats']}, thực tế = {row['actual']}")
         
-        seat_map = {
-            'available': [],
-            'booked': [],
-            'locked': []
-        }
+        if fix and drift:
+            fixed = Database.execute_update(f"""
+                UPDATE trips t
+                INNER JOIN (
+                    SELECT trip_id, SUM(status != 'booked') as actual
+                    FROM trip_seats
+                    GROUP BY trip_id
+                ) s ON s.trip_id = t.id
+                SET t.available_seats = s.actual
+                WHERE t.available_seats != s.actual{date_filter}
+            """, params)
+            from models.cache import cache
+            cache.invalidate_tags('trips')
+            print(f"✅ Đã sửa available_seats cho {fixed} chuyến")
+        elif not drift:
+            print("✅ available_seats khớp với trip_seats")
         
-        if results:
-            for row in results:
-                seat_map[row['status']].append(str(row['seat_number']))
+        return drift
+    
+    @staticmethod
+    def get_seat_map(trip_id):
+        """
+        Lấy sơ đồ ghế đầy đủ (available/booked/locked) từ seat_cache
+        Ghế 'locked' đã quá locked_until được tính là available
+        (không cần chờ LockReaper dọn)
         
-        return seat_map
\ No newline at end of file
+        Args:
+            trip_id (int): ID chuyến xe
+            
+        Returns:
+            dict: {'available': [1,2,3], 'booked': [4,5], 'locked': [6]}
+        """
+        seat_map = seat_cache.get_seat_map(trip_id)
+        return {status: [str(seat) for seat in seats] for status, seats in seat_map.items()}
@@ -3,11 +3,19 @@ User Model - Quản lý dữ liệu người dùng
 Xử lý tất cả các thao tác liên quan đến user trong database
 """
 
+import copy
 from flask_login import UserMixin
+from config import Config
+from models.cache import LocalCache, cache
 from models.database import Database
-from flask_bcrypt import Bcrypt
+from models.password_hasher import PasswordHasherBusy, password_hasher
 
-bcrypt = Bcrypt()
+# User đã load cho Flask-Login (mỗi process 1 bản), entry nhớ phiên bản tag 'user:<id>'
+# của cache dùng chung -> User.update/delete ở worker khác cũng làm entry hết hiệu lực
+_loaded_users = LocalCache(
+    max_entries=Config.USER_CACHE['max_entries'],
+    default_ttl=Config.USER_CACHE['ttl']
+)
 
 
 class User(UserMixin):
@@ -38,10 +46,13 @@ class User(UserMixin):
             
         Returns:
             int: ID của user vừa tạo hoặc None nếu thất bại
+            
+        Raises:
+            PasswordHasherBusy: Pool hash đang quá tải (chưa ghi gì vào DB)
         """
         try:
-            # Hash password
-            password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+            # Hash password (process pool, báo bận nếu quá tải)
+            password_hash = password_hasher.hash(password)
             
             # Prepare data
             data = {
@@ -58,6 +69,8 @@ class User(UserMixin):
             user_id = Database.insert('users', data)
             return user_id
             
+        except PasswordHasherBusy:
+            raise
         except Exception as e:
             print(f"❌ Lỗi tạo user: {e}")
             return None
@@ -88,6 +101,42 @@ class User(UserMixin):
             )
         return None
     
+    @staticmethod
+    def get_cached(user_id):
+        """
+        Lấy User cho Flask-Login (load_user) - không query DB nếu đã có trong cache
+        và chưa bị invalidate / hết TTL
+        
+        Args:
+            user_id (int|str): ID của user
+            
+        Returns:
+            User object (bản sao) hoặc None
+        """
+        user_id = int(user_id)
+        version = cache.tag_version(f'user:{user_id}')
+        
+        entry = _loaded_users.get(user_id)
+        if entry is not None and entry[0] == version:
+            return copy.copy(entry[1])
+        
+        user = User.find_by_id(user_id)
+        if user is not None:
+            _loaded_users.set(user_id, (version, copy.copy(user)))
+        return user
+    
+    @staticmethod
+    def invalidate_cache(user_id):
+        """Xóa User khỏi cache load_user ở mọi worker (sau khi sửa/xóa user)"""
+        user_id = int(user_id)
+        cache.invalidate_tags(f'user:{user_id}')
+        _loaded_users.delete(user_id)
+    
+    @staticmethod
+    def cache_stats():
+        """Thống kê cache load_user của process hiện tại"""
+        return _loaded_users.stats()
+    
     @staticmethod
     def find_by_username(username):
         """
@@ -179,15 +228,21 @@ class User(UserMixin):
             
         Returns:
             bool: True nếu thành công
+            
+        Raises:
+            PasswordHasherBusy: Pool hash đang quá tải (chưa ghi gì vào DB)
         """
         try:
             # Nếu có password mới thì hash
             if 'password' in data and data['password']:
-                data['password_hash'] = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+                data['password_hash'] = password_hasher.hash(data['password'])
                 del data['password']
             
             Database.update('users', data, f"id = {user_id}")
+            User.invalidate_cache(user_id)
             return True
+        except PasswordHasherBusy:
+            raise
         except Exception as e:
             print(f"❌ Lỗi update user: {e}")
             return False
@@ -205,6 +260,7 @@ class User(UserMixin):
         """
         try:
             Database.delete('users', f"id = {user_id}")
+            User.invalidate_cache(user_id)
             return True
         except Exception as e:
             print(f"❌ Lỗi xóa user: {e}")
@@ -238,8 +294,43 @@ class User(UserMixin):
             
         Returns:
             bool: True nếu đúng
+            
+        Raises:
+            PasswordHasherBusy: Pool hash đang quá tải
+        """
+        return password_hasher.verify(password_hash, password)
+    
+    @staticmethod
+    def rehash_if_needed(user_id, password_hash, password):
+        """
+        Hash lại mật khẩu nếu hash đang lưu dùng cost khác BCRYPT_LOG_ROUNDS
+        (gọi sau khi verify_password đúng - chỉ lúc này mới có mật khẩu gốc)
+        
+        Args:
+            user_id (int): ID của user
+            password_hash (str): Hash đang lưu
+            password (str): Mật khẩu vừa nhập (đã xác thực)
+            
+        Returns:
+            bool: True nếu đã hash lại
         """
-        return bcrypt.check_password_hash(password_hash, password)
+        if not password_hasher.needs_rehash(password_hash):
+            return False
+        
+        try:
+            new_hash = password_hasher.hash(password)
+            # Chỉ ghi nếu hash chưa bị đổi (vd user vừa đổi mật khẩu ở request khác)
+            updated = Database.execute_update(
+                "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                (new_hash, user_id, password_hash)
+            )
+            if updated:
+                print(f"🔐 Đã hash lại mật khẩu user {user_id} (cost {password_hasher.rounds})")
+            return bool(updated)
+        except Exception as e:
+            # Không chặn đăng nhập: lần đăng nhập sau sẽ thử lại
+            print(f"⚠️ Không hash lại được mật khẩu user {user_id}: {e}")
+            return False
     
     @staticmethod
     def get_stats():